@@ -4,10 +4,11 @@
     'summary': 'Consulta KPIs de Odoo con lenguaje natural usando IA',
     'category': 'Tools',
     'author': 'Martin Mendez',
-    'depends': ['base', 'hr', 'sale', 'purchase', 'account'],
+    'depends': ['base', 'hr', 'sale', 'purchase', 'account', 'chatbot_ia_base'],
     'data': [
         'security/ir.model.access.csv',
         'views/chatbot_view.xml',
+        'data/ir_cron.xml',
     ],
     'external_dependencies': {
         'python': ['openai'],
@@ -3,7 +3,16 @@ import json
 import openai
 from odoo import models, fields
 
+from odoo.addons.chatbot_ia_base.tools.admision import control_admision, ChatbotSaturado
+from odoo.addons.chatbot_ia_base.tools.replica import ejecutar_lectura
+from odoo.addons.chatbot_ia_base.tools.llm import completar
+
 openai.api_key = os.environ.get('OPENAI_API_KEY')
+# Permite apuntar a un endpoint compatible (ej: scripts/mock_openai.py)
+openai.api_base = os.environ.get('OPENAI_API_BASE') or openai.api_base
+
+# Prefijo de las claves de odoo.conf de este modulo
+PREFIJO_CONFIG = 'chatbot_ia'
 
 
 class OdooJSONEncoder(json.JSONEncoder):
@@ -189,42 +198,53 @@ class OdooChatbot(models.Model):
                 continue
 
             try:
-                response = openai.ChatCompletion.create(
-                    model="gpt-4o-mini",
+                with control_admision(PREFIJO_CONFIG).turno(self.env.uid):
+                    record.respuesta = record._responder()
+            except ChatbotSaturado as e:
+                record.respuesta = str(e)
+
+    def _responder(self):
+        """Pregunta -> funcion elegida por la IA -> respuesta formateada."""
+        self.ensure_one()
+        try:
+            response = completar(
+                PREFIJO_CONFIG, 'herramientas',
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": self.pregunta}
+                ],
+                functions=FUNCIONES_DISPONIBLES,
+                function_call="auto",
+                temperature=0.3,
+            )
+
+            mensaje = response.choices[0].message
+
+            if mensaje.get("function_call"):
+                nombre_funcion = mensaje["function_call"]["name"]
+                argumentos = json.loads(mensaje["function_call"].get("arguments", "{}"))
+
+                resultado = ejecutar_lectura(
+                    PREFIJO_CONFIG, self.env,
+                    lambda env: self.with_env(env)._ejecutar_funcion(nombre_funcion, argumentos),
+                )
+
+                response2 = completar(
+                    PREFIJO_CONFIG, 'reformulacion',
                     messages=[
                         {"role": "system", "content": SYSTEM_PROMPT},
-                        {"role": "user", "content": record.pregunta}
+                        {"role": "user", "content": self.pregunta},
+                        mensaje,
+                        {
+                            "role": "function",
+                            "name": nombre_funcion,
+                            "content": json.dumps(resultado, ensure_ascii=False, cls=OdooJSONEncoder)
+                        }
                     ],
-                    functions=FUNCIONES_DISPONIBLES,
-                    function_call="auto",
                     temperature=0.3,
                 )
+                return response2.choices[0].message["content"]
+            return mensaje.get("content", "No pude procesar tu consulta")
 
-                mensaje = response.choices[0].message
-
-                if mensaje.get("function_call"):
-                    nombre_funcion = mensaje["function_call"]["name"]
-                    argumentos = json.loads(mensaje["function_call"].get("arguments", "{}"))
-
-                    resultado = record._ejecutar_funcion(nombre_funcion, argumentos)
-
-                    response2 = openai.ChatCompletion.create(
-                        model="gpt-4o-mini",
-                        messages=[
-                            {"role": "system", "content": SYSTEM_PROMPT},
-                            {"role": "user", "content": record.pregunta},
-                            mensaje,
-                            {
-                                "role": "function",
-                                "name": nombre_funcion,
-                                "content": json.dumps(resultado, ensure_ascii=False, cls=OdooJSONEncoder)
-                            }
-                        ],
-                        temperature=0.3,
-                    )
-                    record.respuesta = response2.choices[0].message["content"]
-                else:
-                    record.respuesta = mensaje.get("content", "No pude procesar tu consulta")
-
-            except Exception as e:
-                record.respuesta = f"Error al procesar: {str(e)}"
+        except Exception as e:
+            return f"Error al procesar: {str(e)}"
@@ -1,3 +1,5 @@
 from . import ventas
 from . import compras
 from . import facturacion
+from . import contador
+from . import pedidos
@@ -11,21 +11,9 @@ class KPICompras(models.AbstractModel):
         start_m, end_m = month_range(self)
         start_pm, end_pm = prev_month_range(self)
 
-        compras_actual = self.env['purchase.order'].search([
-            ('state', 'in', ['purchase', 'done']),
-            ('date_order', '>=', start_m),
-            ('date_order', '<', end_m),
-        ])
-        total_actual = sum(compras_actual.mapped('amount_total'))
-        cantidad_actual = len(compras_actual)
-
-        compras_anterior = self.env['purchase.order'].search([
-            ('state', 'in', ['purchase', 'done']),
-            ('date_order', '>=', start_pm),
-            ('date_order', '<', end_pm),
-        ])
-        total_anterior = sum(compras_anterior.mapped('amount_total'))
-        cantidad_anterior = len(compras_anterior)
+        Contador = self.env['chatbot.kpi.contador']
+        total_actual, cantidad_actual = Contador.totales('compra', start_m, end_m)
+        total_anterior, cantidad_anterior = Contador.totales('compra', start_pm, end_pm)
 
         variacion = variacion_porcentual(total_actual, total_anterior)
 
@@ -0,0 +1,190 @@
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from odoo import models, fields, api
+
+_logger = logging.getLogger(__name__)
+
+# Dias hacia atras que recalcula la conciliacion diaria
+DIAS_CONCILIACION_DEFAULT = 62
+
+# tipo -> (modelo del pedido, tabla, estados confirmados)
+FUENTES = {
+    'venta': ('sale.order', 'sale_order', ('sale', 'done')),
+    'compra': ('purchase.order', 'purchase_order', ('purchase', 'done')),
+}
+
+
+class KPIContador(models.Model):
+    """Totales diarios de pedidos confirmados, por compania y tipo.
+
+    Al confirmar la transaccion, cada pedido creado, modificado o borrado
+    inserta una fila con la diferencia (monto, cantidad) en su dia: las filas
+    no se actualizan, asi dos transacciones que confirman pedidos el mismo dia
+    no se bloquean. La conciliacion diaria recalcula los ultimos dias desde
+    los pedidos y deja una sola fila por dia.
+    """
+    _name = 'chatbot.kpi.contador'
+    _description = 'Contadores diarios de KPIs para Chatbot'
+    _log_access = False
+
+    company_id = fields.Many2one('res.company', string='Compania', required=True, index=True)
+    fecha = fields.Date(string='Fecha', required=True, index=True)
+    tipo = fields.Selection([
+        ('venta', 'Venta'),
+        ('compra', 'Compra'),
+    ], string='Tipo', required=True)
+    monto = fields.Float(string='Monto', default=0.0)
+    cantidad = fields.Integer(string='Cantidad', default=0)
+
+    def init(self):
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS chatbot_kpi_contador_tipo_fecha_idx
+                ON chatbot_kpi_contador (tipo, company_id, fecha)
+        """)
+        self.env.cr.execute("SELECT 1 FROM chatbot_kpi_contador LIMIT 1")
+        if not self.env.cr.fetchone():
+            self._reconstruir(None)
+
+    # ------------------------------------------------------------------
+    # Mantenimiento desde los hooks de pedidos
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _aporte(self, pedido, tipo):
+        """(company_id, fecha, monto) que aporta el pedido, o None si no suma."""
+        if pedido.state not in FUENTES[tipo][2] or not pedido.date_order:
+            return None
+        return (pedido.company_id.id, pedido.date_order.date(), pedido.amount_total)
+
+    @api.model
+    def registrar_cambio(self, pedidos, tipo, alta=False):
+        """Anota el aporte de `pedidos` antes de que se modifiquen.
+
+        Solo cuenta el aporte de la primera vez que la transaccion toca cada
+        pedido (con `alta`, el pedido no existia: aporte nulo). Antes del
+        commit se inserta la diferencia con el aporte final.
+        """
+        datos = self.env.cr.precommit.data
+        clave = f'chatbot.kpi.contador.{tipo}'
+        if clave not in datos:
+            datos[clave] = {}
+            self.env.cr.precommit.add(lambda: self._aplicar_pendientes(tipo, clave))
+        aportes = datos[clave]
+        for pedido in pedidos.sudo():
+            if alta:
+                aportes[pedido.id] = None
+            elif pedido.id not in aportes:
+                aportes[pedido.id] = self._aporte(pedido, tipo)
+
+    def _aplicar_pendientes(self, tipo, clave):
+        aportes_antes = self.env.cr.precommit.data.pop(clave, {})
+        if not aportes_antes:
+            return
+        diferencias = defaultdict(lambda: [0.0, 0])
+        for aporte in aportes_antes.values():
+            if aporte:
+                diferencia = diferencias[aporte[:2]]
+                diferencia[0] -= aporte[2]
+                diferencia[1] -= 1
+        pedidos = self.env[FUENTES[tipo][0]].sudo().browse(list(aportes_antes)).exists()
+        for pedido in pedidos:
+            aporte = self._aporte(pedido, tipo)
+            if aporte:
+                diferencia = diferencias[aporte[:2]]
+                diferencia[0] += aporte[2]
+                diferencia[1] += 1
+
+        filas = [
+            (company_id, fecha, tipo, monto, cantidad)
+            for (company_id, fecha), (monto, cantidad) in diferencias.items()
+            if abs(monto) > 1e-9 or cantidad
+        ]
+        if not filas:
+            return
+        valores = ', '.join(['(%s, %s, %s, %s, %s)'] * len(filas))
+        self.env.cr.execute(
+            "INSERT INTO chatbot_kpi_contador (company_id, fecha, tipo, monto, cantidad) "
+            "VALUES " + valores,
+            [valor for fila in filas for valor in fila],
+        )
+
+    # ------------------------------------------------------------------
+    # Lectura para los KPIs
+    # ------------------------------------------------------------------
+
+    @api.model
+    def totales(self, tipo, desde, hasta):
+        """(monto, cantidad) de pedidos confirmados en [desde, hasta) de las
+        companias activas del usuario."""
+        self.env[FUENTES[tipo][0]].check_access_rights('read')
+        self.env.cr.execute("""
+            SELECT COALESCE(SUM(monto), 0), COALESCE(SUM(cantidad), 0)
+              FROM chatbot_kpi_contador
+             WHERE tipo = %s AND company_id = ANY(%s)
+               AND fecha >= %s AND fecha < %s
+        """, [tipo, self.env.companies.ids, desde, hasta])
+        monto, cantidad = self.env.cr.fetchone()
+        return float(monto), int(cantidad)
+
+    # ------------------------------------------------------------------
+    # Conciliacion
+    # ------------------------------------------------------------------
+
+    def _reconstruir(self, desde):
+        """Recalcula desde los pedidos los contadores con fecha >= desde (None:
+        todos). Retorna la cantidad de (compania, dia, tipo) que estaban mal."""
+        corregidos = 0
+        for tipo, (_modelo, tabla, estados) in FUENTES.items():
+            filtro_fecha = "AND date_order >= %s" if desde else ""
+            params_fecha = [desde] if desde else []
+            self.env.cr.execute(f"""
+                WITH real AS (
+                    SELECT company_id, date_order::date AS fecha,
+                           SUM(amount_total) AS monto, COUNT(*) AS cantidad
+                      FROM {tabla}
+                     WHERE state IN %s {filtro_fecha}
+                     GROUP BY 1, 2
+                ), contado AS (
+                    SELECT company_id, fecha, SUM(monto) AS monto, SUM(cantidad) AS cantidad
+                      FROM chatbot_kpi_contador
+                     WHERE tipo = %s {filtro_fecha.replace('date_order', 'fecha')}
+                     GROUP BY 1, 2
+                )
+                SELECT COUNT(*)
+                  FROM real FULL JOIN contado USING (company_id, fecha)
+                 WHERE ABS(COALESCE(real.monto, 0) - COALESCE(contado.monto, 0)) > 0.005
+                    OR COALESCE(real.cantidad, 0) <> COALESCE(contado.cantidad, 0)
+            """, [estados] + params_fecha + [tipo] + params_fecha)
+            corregidos += self.env.cr.fetchone()[0]
+
+            self.env.cr.execute(f"""
+                DELETE FROM chatbot_kpi_contador
+                 WHERE tipo = %s {filtro_fecha.replace('date_order', 'fecha')}
+            """, [tipo] + params_fecha)
+            self.env.cr.execute(f"""
+                INSERT INTO chatbot_kpi_contador (company_id, fecha, tipo, monto, cantidad)
+                SELECT company_id, date_order::date, %s, SUM(amount_total), COUNT(*)
+                  FROM {tabla}
+                 WHERE state IN %s {filtro_fecha}
+                 GROUP BY 1, 2
+            """, [tipo, estados] + params_fecha)
+        self.invalidate_cache()
+        return corregidos
+
+    @api.model
+    def _cron_conciliar(self):
+        """Corrige la deriva de los contadores y compacta las filas de diferencias."""
+        params = self.env['ir.config_parameter'].sudo()
+        dias = int(params.get_param('chatbot_ia.dias_conciliacion', DIAS_CONCILIACION_DEFAULT))
+        self.env['sale.order'].flush(['state', 'date_order', 'amount_total', 'company_id'])
+        self.env['purchase.order'].flush(['state', 'date_order', 'amount_total', 'company_id'])
+        desde = fields.Date.today() - timedelta(days=dias)
+        corregidos = self._reconstruir(desde)
+        if corregidos:
+            _logger.warning("Conciliacion de contadores KPI: %d dias corregidos desde %s",
+                            corregidos, desde)
+        else:
+            _logger.info("Conciliacion de contadores KPI: sin diferencias desde %s", desde)
+        return corregidos
@@ -0,0 +1,99 @@
+from odoo import models, api
+
+# Campos cuyo cambio puede modificar el aporte de un pedido a los contadores
+CAMPOS_PEDIDO = {'state', 'date_order', 'company_id', 'amount_total', 'order_line'}
+CAMPOS_LINEA_VENTA = {
+    'order_id', 'product_id', 'product_uom', 'product_uom_qty', 'price_unit',
+    'discount', 'tax_id', 'display_type',
+}
+CAMPOS_LINEA_COMPRA = {
+    'order_id', 'product_id', 'product_uom', 'product_qty', 'price_unit',
+    'taxes_id', 'display_type',
+}
+
+
+def _pedidos_de_vals(env, modelo, vals_list):
+    ids = {vals['order_id'] for vals in vals_list if vals.get('order_id')}
+    return env[modelo].browse(ids)
+
+
+class SaleOrder(models.Model):
+    _inherit = 'sale.order'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        pedidos = super().create(vals_list)
+        self.env['chatbot.kpi.contador'].registrar_cambio(pedidos, 'venta', alta=True)
+        return pedidos
+
+    def write(self, vals):
+        if CAMPOS_PEDIDO.intersection(vals):
+            self.env['chatbot.kpi.contador'].registrar_cambio(self, 'venta')
+        return super().write(vals)
+
+    def unlink(self):
+        self.env['chatbot.kpi.contador'].registrar_cambio(self, 'venta')
+        return super().unlink()
+
+
+class SaleOrderLine(models.Model):
+    _inherit = 'sale.order.line'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        self.env['chatbot.kpi.contador'].registrar_cambio(
+            _pedidos_de_vals(self.env, 'sale.order', vals_list), 'venta',
+        )
+        return super().create(vals_list)
+
+    def write(self, vals):
+        if CAMPOS_LINEA_VENTA.intersection(vals):
+            self.env['chatbot.kpi.contador'].registrar_cambio(
+                self.order_id | _pedidos_de_vals(self.env, 'sale.order', [vals]), 'venta',
+            )
+        return super().write(vals)
+
+    def unlink(self):
+        self.env['chatbot.kpi.contador'].registrar_cambio(self.order_id, 'venta')
+        return super().unlink()
+
+
+class PurchaseOrder(models.Model):
+    _inherit = 'purchase.order'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        pedidos = super().create(vals_list)
+        self.env['chatbot.kpi.contador'].registrar_cambio(pedidos, 'compra', alta=True)
+        return pedidos
+
+    def write(self, vals):
+        if CAMPOS_PEDIDO.intersection(vals):
+            self.env['chatbot.kpi.contador'].registrar_cambio(self, 'compra')
+        return super().write(vals)
+
+    def unlink(self):
+        self.env['chatbot.kpi.contador'].registrar_cambio(self, 'compra')
+        return super().unlink()
+
+
+class PurchaseOrderLine(models.Model):
+    _inherit = 'purchase.order.line'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        self.env['chatbot.kpi.contador'].registrar_cambio(
+            _pedidos_de_vals(self.env, 'purchase.order', vals_list), 'compra',
+        )
+        return super().create(vals_list)
+
+    def write(self, vals):
+        if CAMPOS_LINEA_COMPRA.intersection(vals):
+            self.env['chatbot.kpi.contador'].registrar_cambio(
+                self.order_id | _pedidos_de_vals(self.env, 'purchase.order', [vals]), 'compra',
+            )
+        return super().write(vals)
+
+    def unlink(self):
+        self.env['chatbot.kpi.contador'].registrar_cambio(self.order_id, 'compra')
+        return super().unlink()
@@ -6,26 +6,29 @@ class KPIVentas(models.AbstractModel):
     _name = 'chatbot.kpi.ventas'
     _description = 'KPIs de Ventas para Chatbot'
 
+    def _totales_ventas(self, start, end):
+        """(monto, cantidad) de pedidos confirmados en [start, end).
+
+        Usa los contadores diarios si el usuario ve todos los pedidos de sus
+        companias; si sus reglas solo le dejan ver los propios, se suman sus
+        pedidos como antes.
+        """
+        if self.env.user.has_group('sales_team.group_sale_salesman_all_leads'):
+            return self.env['chatbot.kpi.contador'].totales('venta', start, end)
+        ventas = self.env['sale.order'].search([
+            ('state', 'in', ['sale', 'done']),
+            ('date_order', '>=', start),
+            ('date_order', '<', end),
+        ])
+        return sum(ventas.mapped('amount_total')), len(ventas)
+
     def get_ventas_mes_actual(self):
         """KPI 1: Total ventas del mes actual + variación vs mes anterior"""
         start_m, end_m = month_range(self)
         start_pm, end_pm = prev_month_range(self)
 
-        ventas_actual = self.env['sale.order'].search([
-            ('state', 'in', ['sale', 'done']),
-            ('date_order', '>=', start_m),
-            ('date_order', '<', end_m),
-        ])
-        total_actual = sum(ventas_actual.mapped('amount_total'))
-        cantidad_actual = len(ventas_actual)
-
-        ventas_anterior = self.env['sale.order'].search([
-            ('state', 'in', ['sale', 'done']),
-            ('date_order', '>=', start_pm),
-            ('date_order', '<', end_pm),
-        ])
-        total_anterior = sum(ventas_anterior.mapped('amount_total'))
-        cantidad_anterior = len(ventas_anterior)
+        total_actual, cantidad_actual = self._totales_ventas(start_m, end_m)
+        total_anterior, cantidad_anterior = self._totales_ventas(start_pm, end_pm)
 
         variacion = variacion_porcentual(total_actual, total_anterior)
 
@@ -117,17 +120,12 @@ class KPIVentas(models.AbstractModel):
         """Ticket promedio de ventas del mes"""
         start_m, end_m = month_range(self)
 
-        ventas = self.env['sale.order'].search([
-            ('state', 'in', ['sale', 'done']),
-            ('date_order', '>=', start_m),
-            ('date_order', '<', end_m),
-        ])
+        total, cantidad = self._totales_ventas(start_m, end_m)
 
-        if not ventas:
+        if not cantidad:
             return {'promedio': 0, 'mensaje': "No hay ventas este mes"}
 
-        total = sum(ventas.mapped('amount_total'))
-        promedio = total / len(ventas)
+        promedio = total / cantidad
 
         return {
             'promedio': promedio,
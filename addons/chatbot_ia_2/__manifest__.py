@@ -4,14 +4,19 @@
     'summary': 'Chat multi-turno con IA para consultar KPIs de Odoo',
     'category': 'Tools',
     'author': 'Martin Mendez',
-    'depends': ['base', 'sale', 'account', 'product', 'stock'],
+    'depends': ['base', 'sale', 'account', 'product', 'stock', 'chatbot_ia_base'],
     'data': [
         'security/ir.model.access.csv',
+        'security/chatbot_security.xml',
+        'data/ir_cron.xml',
         'views/assets.xml',
         'views/chatbot_view.xml',
     ],
+    'qweb': [
+        'static/src/xml/chatbot_widget.xml',
+    ],
     'external_dependencies': {
-        'python': ['openai'],
+        'python': ['openai', 'numpy', 'xlsxwriter'],
     },
     'installable': True,
     'application': True,
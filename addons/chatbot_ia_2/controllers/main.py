@@ -0,0 +1,186 @@
+import json
+import logging
+
+import odoo
+from odoo import api, http, _
+from odoo.exceptions import UserError
+from odoo.http import request
+
+from odoo.addons.chatbot_ia_base.tools.admision import control_admision
+from ..models.chatbot import TurnoEnCurso, PREFIJO_CONFIG
+
+_logger = logging.getLogger(__name__)
+
+# Maximo de preguntas por pedido bulk
+MAX_PREGUNTAS_BULK = 50
+
+
+class ChatbotController(http.Controller):
+    """API JSON del chatbot v2 para integraciones y procesos batch.
+
+    /chatbot/ask          una pregunta (opcionalmente en una sesion existente)
+    /chatbot/ask_bulk     varias preguntas, cada una en su propia sesion
+    /chatbot/ask/stream   como ask_bulk, pero responde NDJSON a medida que
+                          cada pregunta termina (respuesta chunked)
+    /chatbot/mensajes     mensajes visibles nuevos de una sesion (widget de chat)
+    /chatbot/cola         posicion del usuario en la cola de admision mientras
+                          espera su turno
+    /chatbot/exportacion/<id>  descarga de una exportacion (o su estado si no
+                          esta lista todavia)
+    """
+
+    @staticmethod
+    def _sesion(env, session_id=None):
+        if session_id:
+            sesion = env['chatbot.ia2'].browse(int(session_id)).exists()
+            if not sesion:
+                raise UserError(_("La sesion %s no existe.") % session_id)
+            return sesion
+        return env['chatbot.ia2'].create({})
+
+    @staticmethod
+    def _validar_preguntas(preguntas):
+        if not isinstance(preguntas, list) or not preguntas:
+            raise UserError(_("'preguntas' tiene que ser una lista no vacia."))
+        if len(preguntas) > MAX_PREGUNTAS_BULK:
+            raise UserError(_("Como maximo %d preguntas por pedido.") % MAX_PREGUNTAS_BULK)
+        return [str(p) for p in preguntas]
+
+    @http.route('/chatbot/ask', type='json', auth='user')
+    def ask(self, pregunta, session_id=None):
+        if not pregunta:
+            raise UserError(_("La pregunta esta vacia."))
+        sesion = self._sesion(request.env, session_id)
+        try:
+            respuesta = sesion.preguntar(pregunta)
+        except TurnoEnCurso as e:
+            return {
+                'session_id': sesion.id,
+                'pregunta': pregunta,
+                'respuesta': e.args[0],
+                'turno_en_curso': True,
+            }
+        return {
+            'session_id': sesion.id,
+            'pregunta': pregunta,
+            'respuesta': respuesta,
+        }
+
+    @http.route('/chatbot/ask_bulk', type='json', auth='user')
+    def ask_bulk(self, preguntas):
+        # Cada turno confirma su propio trabajo: un error en una pregunta va en
+        # su resultado y no descarta las respuestas ya guardadas del resto
+        resultados = []
+        for pregunta in self._validar_preguntas(preguntas):
+            sesion = None
+            try:
+                sesion = self._sesion(request.env)
+                resultados.append({
+                    'session_id': sesion.id,
+                    'pregunta': pregunta,
+                    'respuesta': sesion.preguntar(pregunta),
+                })
+            except Exception as e:
+                _logger.exception("Error en /chatbot/ask_bulk")
+                request.env.cr.rollback()
+                resultados.append({
+                    'session_id': sesion.exists().id if sesion else None,
+                    'pregunta': pregunta,
+                    'error': str(e),
+                })
+        return {'resultados': resultados}
+
+    @http.route('/chatbot/ask/stream', type='http', auth='user', methods=['POST'], csrf=False)
+    def ask_stream(self, **kwargs):
+        # Sin token CSRF: solo se aceptan cuerpos JSON, que un formulario de
+        # otro sitio no puede enviar sin preflight
+        if request.httprequest.mimetype != 'application/json':
+            return request.make_response(
+                json.dumps({'error': "Content-Type tiene que ser application/json"}),
+                headers=[('Content-Type', 'application/json')], status=415,
+            )
+        try:
+            cuerpo = json.loads(request.httprequest.get_data(as_text=True) or '{}')
+            preguntas = self._validar_preguntas(cuerpo.get('preguntas'))
+        except (ValueError, UserError) as e:
+            return request.make_response(
+                json.dumps({'error': str(e)}),
+                headers=[('Content-Type', 'application/json')], status=400,
+            )
+
+        dbname, uid, context = request.db, request.env.uid, dict(request.env.context)
+
+        def generar():
+            # El generador corre despues de cerrado el cursor (y el
+            # Environment.manage()) del request: cada pregunta abre los suyos
+            for pregunta in preguntas:
+                try:
+                    with api.Environment.manage(), odoo.registry(dbname).cursor() as cr:
+                        env = api.Environment(cr, uid, context)
+                        sesion = self._sesion(env)
+                        linea = {
+                            'session_id': sesion.id,
+                            'pregunta': pregunta,
+                            'respuesta': sesion.preguntar(pregunta),
+                        }
+                except Exception as e:
+                    _logger.exception("Error en /chatbot/ask/stream")
+                    linea = {'pregunta': pregunta, 'error': str(e)}
+                yield json.dumps(linea, ensure_ascii=False) + '\n'
+
+        return http.Response(
+            generar(),
+            headers=[('Content-Type', 'application/x-ndjson'), ('Cache-Control', 'no-cache')],
+            direct_passthrough=True,
+        )
+
+    @http.route('/chatbot/cola', type='json', auth='user')
+    def cola(self):
+        """Posicion del usuario en la cola de admision de este proceso (0 si no
+        esta esperando), para mostrarla mientras espera la respuesta."""
+        control = control_admision(PREFIJO_CONFIG)
+        return dict(control.estado(), posicion=control.posicion(request.env.uid))
+
+    @http.route('/chatbot/mensajes', type='json', auth='user')
+    def mensajes(self, session_id, desde_sequence=0):
+        """Mensajes visibles con sequence > desde_sequence, en orden.
+
+        Los mensajes ocultos (function calls y resultados) nunca se envian al
+        cliente, asi el payload por turno no crece con la sesion.
+        """
+        sesion = self._sesion(request.env, session_id)
+        mensajes = request.env['chatbot.ia2.message'].search_read(
+            [
+                ('session_id', '=', sesion.id),
+                ('visible', '=', True),
+                ('sequence', '>', desde_sequence),
+            ],
+            ['sequence', 'role', 'content'],
+            order='sequence asc, id asc',
+        )
+        if not mensajes and not desde_sequence and sesion.historial_archivado:
+            mensajes = [
+                {'sequence': m['sequence'], 'role': m['role'], 'content': m['content']}
+                for m in sesion._leer_historial_archivado() if m['visible']
+            ]
+        return {'session_id': sesion.id, 'mensajes': mensajes}
+
+    @http.route('/chatbot/exportacion/<int:exportacion_id>', type='http', auth='user')
+    def exportacion(self, exportacion_id):
+        """Redirige a la descarga si el archivo esta listo; si no, devuelve el
+        estado en JSON (las reglas de acceso limitan a las exportaciones propias)."""
+        exportacion = request.env['chatbot.ia2.exportacion'].browse(exportacion_id).exists()
+        if not exportacion:
+            return request.not_found()
+        if exportacion.estado == 'listo' and exportacion.attachment_id:
+            return request.redirect(
+                f'/web/content/{exportacion.attachment_id.id}?download=true'
+            )
+        return request.make_response(
+            json.dumps({
+                'exportacion_id': exportacion.id,
+                'estado': exportacion.estado,
+                'error': exportacion.error or None,
+            }),
+            headers=[('Content-Type', 'application/json')],
+        )
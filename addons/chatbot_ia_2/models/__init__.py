@@ -1,3 +1,5 @@
 from . import chatbot
 from . import message
+from . import plan
+from . import exportacion
 from . import kpi
@@ -0,0 +1,109 @@
+import json
+
+# Valores por defecto de cada funcion expuesta a la IA. El dispatcher completa
+# los argumentos con esta tabla, asi dos llamadas equivalentes (una con el
+# default explicito y otra sin el) producen la misma clave.
+ARGUMENTOS_DEFAULT = {
+    'get_productos': {
+        'orden': None,
+        'limite': 10,
+        'filtros': {},
+        'cursor': None,
+        'resumen': False,
+    },
+    'get_ventas': {
+        'producto_ids': None,
+        'vendedor_ids': None,
+        'cliente_ids': None,
+        'agrupar_por': None,
+        'periodo': 'mes_actual',
+        'limite': 20,
+        'orden': 'monto_desc',
+        'cursor': None,
+        'resumen': False,
+    },
+    'get_facturas': {
+        'tipo': 'cliente',
+        'estado': 'pendiente',
+        'dias_vencimiento': None,
+        'cliente_ids': None,
+        'limite': 20,
+        'cursor': None,
+        'resumen': False,
+    },
+    'get_cruce': {
+        'fuente': 'ventas',
+        'productos': {},
+        'periodo': 'mes_actual',
+        'vendedor_ids': None,
+        'cliente_ids': None,
+        'agrupar_por': 'producto',
+        'orden': None,
+        'limite': 20,
+    },
+    'buscar_contactos': {
+        'nombre': '',
+        'limite': 10,
+    },
+    'buscar_vendedores': {
+        'nombre': '',
+        'limite': 10,
+    },
+    'get_stock': {
+        'analisis': 'valorizacion',
+        'agrupar_por': 'categoria',
+        'categoria': None,
+        'almacen_ids': None,
+        'dias': 90,
+        'limite': 20,
+    },
+    'exportar': {
+        'funcion': None,
+        'argumentos': {},
+        'formato': 'xlsx',
+    },
+}
+
+
+def _normalizar_valor(valor):
+    if isinstance(valor, dict):
+        return {k: _normalizar_valor(v) for k, v in valor.items() if v not in (None, '', [], {})}
+    if isinstance(valor, (list, tuple)):
+        valores = [_normalizar_valor(v) for v in valor]
+        if all(isinstance(v, int) for v in valores):
+            return sorted(set(valores))
+        return valores
+    return valor
+
+
+def normalizar_argumentos(nombre, argumentos):
+    """Argumentos que acepta la funcion `nombre`, completados con sus defaults.
+
+    Las listas de IDs se ordenan y los filtros vacios se descartan: el
+    resultado de las funciones KPI no depende de eso.
+    """
+    argumentos = argumentos or {}
+    normalizados = {
+        clave: _normalizar_valor(argumentos.get(clave, default))
+        for clave, default in ARGUMENTOS_DEFAULT.get(nombre, {}).items()
+    }
+    if 'resumen' in normalizados:
+        normalizados['resumen'] = bool(normalizados['resumen'])
+    for clave in ('producto_ids', 'vendedor_ids', 'cliente_ids', 'almacen_ids'):
+        if clave in normalizados and not normalizados[clave]:
+            normalizados[clave] = None
+    if nombre == 'get_productos':
+        normalizados['filtros'] = normalizados['filtros'] or {}
+        if not normalizados['orden']:
+            normalizados['orden'] = (
+                'relevancia' if normalizados['filtros'].get('nombre') else 'nombre_asc'
+            )
+    return normalizados
+
+
+def clave_llamada(nombre, argumentos):
+    """Clave estable de una llamada (funcion + argumentos normalizados)."""
+    return json.dumps(
+        [nombre, normalizar_argumentos(nombre, argumentos)],
+        sort_keys=True, ensure_ascii=False, default=str,
+    )
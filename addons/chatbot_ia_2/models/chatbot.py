@@ -1,15 +1,84 @@
 import os
 import json
+import zlib
+import base64
 import logging
+from datetime import timedelta
+
 import openai
+import psycopg2
 from odoo import models, fields, api
+from odoo.exceptions import UserError
+from odoo.service.model import PG_CONCURRENCY_ERRORS_TO_RETRY
+from odoo.tools import config
+
+from odoo.addons.chatbot_ia_base.tools.admision import control_admision, ChatbotSaturado
+from odoo.addons.chatbot_ia_base.tools.coalescencia import SingleFlight
+from odoo.addons.chatbot_ia_base.tools.replica import ejecutar_lectura
+from odoo.addons.chatbot_ia_base.tools.llm import completar
+from .argumentos import normalizar_argumentos, clave_llamada
+from .especulacion import EspeculacionTurno
+from .exportacion import EXPORTABLES
 
 _logger = logging.getLogger(__name__)
 
 openai.api_key = os.environ.get('OPENAI_API_KEY')
+# Permite apuntar a un endpoint compatible (ej: scripts/mock_openai.py)
+openai.api_base = os.environ.get('OPENAI_API_BASE') or openai.api_base
+
+# Prefijo de las claves de odoo.conf de este modulo
+PREFIJO_CONFIG = 'chatbot_ia2'
 
 MAX_ITERACIONES = 10
 
+# Funcion expuesta a la IA -> (modelo KPI, metodo)
+FUNCIONES_KPI = {
+    'get_productos': ('chatbot2.kpi.productos', 'get_productos'),
+    'get_ventas': ('chatbot2.kpi.ventas', 'get_ventas'),
+    'get_facturas': ('chatbot2.kpi.facturacion', 'get_facturas'),
+    'get_stock': ('chatbot2.kpi.stock', 'get_stock'),
+    'get_cruce': ('chatbot2.kpi.cruce', 'get_cruce'),
+    'buscar_contactos': ('chatbot2.kpi.contactos', 'buscar_contactos'),
+    'buscar_vendedores': ('chatbot2.kpi.contactos', 'buscar_vendedores'),
+}
+# Modelos cuyas reglas de acceso acotan el resultado de cada funcion
+MODELOS_LEIDOS = {
+    'get_productos': ('product.product', 'stock.quant'),
+    'get_ventas': ('sale.order', 'sale.order.line', 'sale.report'),
+    'get_facturas': ('account.move',),
+    'get_stock': ('stock.quant', 'stock.move', 'product.product'),
+    'get_cruce': ('sale.order.line', 'account.move.line', 'product.product'),
+    'buscar_contactos': ('res.partner',),
+    'buscar_vendedores': ('res.users',),
+}
+
+# Espera maxima por el resultado de una llamada KPI identica ya en curso
+ESPERA_MAX_KPI = 30.0
+_KPIS_EN_CURSO = SingleFlight('KPI', espera_max=ESPERA_MAX_KPI)
+
+# Duracion maxima de un turno (segundos): pasado ese tiempo el turno de una
+# sesion se considera abandonado (worker caido) y otro envio puede tomarlo.
+# Configurable en odoo.conf con chatbot_ia2_turno_max
+TURNO_MAX_DEFAULT = 300
+MENSAJE_TURNO_EN_CURSO = (
+    "Ya hay una pregunta en curso en esta sesion. Espera la respuesta antes de enviar otra."
+)
+MENSAJE_CONFLICTO = (
+    "No pude terminar la consulta por un conflicto con otra operacion simultanea. "
+    "Proba de nuevo en unos segundos."
+)
+
+
+class TurnoEnCurso(UserError):
+    """La sesion ya esta respondiendo otra pregunta (doble envio u otra pestana)."""
+
+
+# Politica de retencion por defecto (configurable con ir.config_parameter)
+DIAS_COMPACTAR_DEFAULT = 7
+DIAS_ARCHIVAR_DEFAULT = 90
+# Sesiones archivadas por corrida del cron, para acotar la duracion
+LOTE_ARCHIVADO = 200
+
 
 class OdooJSONEncoder(json.JSONEncoder):
     """Encoder que convierte tipos lazy de Odoo a tipos nativos de Python"""
@@ -42,20 +111,44 @@ FUNCIONES_DISPONIBLES = [
             "properties": {
                 "orden": {
                     "type": "string",
-                    "enum": ["precio_asc", "precio_desc", "nombre_asc", "nombre_desc", "stock_asc", "stock_desc"],
-                    "description": "Orden de resultados (default: nombre_asc)",
+                    "enum": [
+                        "relevancia", "precio_asc", "precio_desc", "nombre_asc",
+                        "nombre_desc", "stock_asc", "stock_desc",
+                    ],
+                    "description": (
+                        "Orden de resultados (default: relevancia si se busca por nombre, "
+                        "sino nombre_asc)"
+                    ),
                 },
                 "limite": {
                     "type": "integer",
                     "description": "Cantidad maxima de productos (default 10)",
                 },
+                "cursor": {
+                    "type": "string",
+                    "description": (
+                        "Cursor de continuacion (valor de 'cursor_siguiente' de la respuesta "
+                        "anterior) para traer la pagina siguiente. Usar los mismos filtros."
+                    ),
+                },
+                "resumen": {
+                    "type": "boolean",
+                    "description": (
+                        "Si es true devuelve estadisticas de TODOS los registros que "
+                        "coinciden (cantidad, suma, min/max, percentiles, top) en vez de "
+                        "filas. Usar para preguntas de magnitud sobre muchos registros."
+                    ),
+                },
                 "filtros": {
                     "type": "object",
                     "description": "Filtros opcionales",
                     "properties": {
                         "nombre": {
                             "type": "string",
-                            "description": "Buscar por nombre (parcial, case insensitive)",
+                            "description": (
+                                "Buscar por nombre (parcial, case insensitive, tolera "
+                                "errores de tipeo)"
+                            ),
                         },
                         "precio_min": {"type": "number"},
                         "precio_max": {"type": "number"},
@@ -68,6 +161,18 @@ FUNCIONES_DISPONIBLES = [
                             "items": {"type": "integer"},
                             "description": "IDs especificos de productos",
                         },
+                        "stock_min": {
+                            "type": "number",
+                            "description": "Stock disponible minimo",
+                        },
+                        "stock_max": {
+                            "type": "number",
+                            "description": "Stock disponible maximo",
+                        },
+                        "sin_stock": {
+                            "type": "boolean",
+                            "description": "Solo productos sin stock disponible",
+                        },
                     },
                 },
             },
@@ -119,6 +224,21 @@ FUNCIONES_DISPONIBLES = [
                     "enum": ["monto_desc", "monto_asc", "fecha_desc", "fecha_asc", "cantidad_desc"],
                     "description": "Orden de resultados (default: monto_desc)",
                 },
+                "cursor": {
+                    "type": "string",
+                    "description": (
+                        "Cursor de continuacion (valor de 'cursor_siguiente' de la respuesta "
+                        "anterior) para traer la pagina siguiente. Usar los mismos filtros."
+                    ),
+                },
+                "resumen": {
+                    "type": "boolean",
+                    "description": (
+                        "Si es true devuelve estadisticas de TODOS los registros que "
+                        "coinciden (cantidad, suma, min/max, percentiles, top) en vez de "
+                        "filas. Usar para preguntas de magnitud sobre muchos registros."
+                    ),
+                },
             },
             "required": [],
         },
@@ -156,10 +276,203 @@ FUNCIONES_DISPONIBLES = [
                     "type": "integer",
                     "description": "Cantidad maxima de resultados (default 20)",
                 },
+                "cursor": {
+                    "type": "string",
+                    "description": (
+                        "Cursor de continuacion (valor de 'cursor_siguiente' de la respuesta "
+                        "anterior) para traer la pagina siguiente. Usar los mismos filtros."
+                    ),
+                },
+                "resumen": {
+                    "type": "boolean",
+                    "description": (
+                        "Si es true devuelve estadisticas de TODOS los registros que "
+                        "coinciden (cantidad, suma, min/max, percentiles, top) en vez de "
+                        "filas. Usar para preguntas de magnitud sobre muchos registros."
+                    ),
+                },
             },
             "required": [],
         },
     },
+    {
+        "name": "get_cruce",
+        "description": (
+            "Ventas o facturacion de los productos que cumplen filtros de producto "
+            "(nombre, categoria, precio, ids), agrupadas por producto, categoria, vendedor, "
+            "cliente o mes, en UNA sola llamada. Usar en vez de encadenar get_productos y "
+            "get_ventas cuando la pregunta filtra productos por nombre o categoria."
+        ),
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "fuente": {
+                    "type": "string",
+                    "enum": ["ventas", "facturas"],
+                    "description": (
+                        "ventas: pedidos confirmados; facturas: facturas de cliente "
+                        "publicadas (las notas de credito restan). Default ventas"
+                    ),
+                },
+                "productos": {
+                    "type": "object",
+                    "description": "Filtros de productos (mismos que get_productos)",
+                    "properties": {
+                        "nombre": {"type": "string"},
+                        "categoria": {"type": "string"},
+                        "precio_min": {"type": "number"},
+                        "precio_max": {"type": "number"},
+                        "ids": {"type": "array", "items": {"type": "integer"}},
+                    },
+                },
+                "periodo": {
+                    "type": "string",
+                    "enum": ["mes_actual", "mes_anterior", "trimestre", "anio"],
+                    "description": "Periodo de tiempo (default mes_actual)",
+                },
+                "vendedor_ids": {
+                    "type": "array",
+                    "items": {"type": "integer"},
+                    "description": "IDs de vendedores",
+                },
+                "cliente_ids": {
+                    "type": "array",
+                    "items": {"type": "integer"},
+                    "description": "IDs de clientes",
+                },
+                "agrupar_por": {
+                    "type": "string",
+                    "enum": ["producto", "categoria", "vendedor", "cliente", "mes"],
+                    "description": "Agrupacion del resultado (default producto)",
+                },
+                "orden": {
+                    "type": "string",
+                    "enum": ["monto_desc", "monto_asc", "cantidad_desc", "cronologico"],
+                    "description": "Orden de los grupos (default monto_desc; mes: cronologico)",
+                },
+                "limite": {
+                    "type": "integer",
+                    "description": "Cantidad maxima de grupos (default 20)",
+                },
+            },
+        },
+    },
+    {
+        "name": "get_stock",
+        "description": (
+            "Analisis de inventario calculado en bloque: valorizacion del stock por "
+            "categoria o almacen, dias de cobertura segun el consumo reciente, o productos "
+            "lentos (con stock y sin movimientos). Usar para preguntas de inventario."
+        ),
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "analisis": {
+                    "type": "string",
+                    "enum": ["valorizacion", "cobertura", "lentos"],
+                    "description": (
+                        "valorizacion: cantidad y valor a costo estandar por grupo; "
+                        "cobertura: dias de stock segun el consumo de los ultimos 'dias' "
+                        "(menor cobertura primero); lentos: productos con stock sin "
+                        "movimientos en los ultimos 'dias' (mayor valor primero)"
+                    ),
+                },
+                "agrupar_por": {
+                    "type": "string",
+                    "enum": ["categoria", "almacen"],
+                    "description": "Agrupacion de la valorizacion (default categoria)",
+                },
+                "categoria": {
+                    "type": "string",
+                    "description": "Filtrar por nombre de categoria (parcial)",
+                },
+                "almacen_ids": {
+                    "type": "array",
+                    "items": {"type": "integer"},
+                    "description": "IDs de almacenes a considerar",
+                },
+                "dias": {
+                    "type": "integer",
+                    "description": "Ventana en dias para cobertura y lentos (default 90)",
+                },
+                "limite": {
+                    "type": "integer",
+                    "description": "Cantidad maxima de filas (default 20)",
+                },
+            },
+        },
+    },
+    {
+        "name": "buscar_contactos",
+        "description": (
+            "Busca clientes o proveedores por nombre (parcial, sin importar acentos ni "
+            "mayusculas, tolera errores de tipeo) y devuelve candidatos ordenados con su id. "
+            "Usar para obtener cliente_ids antes de get_ventas o get_facturas."
+        ),
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "nombre": {
+                    "type": "string",
+                    "description": "Nombre o parte del nombre del contacto",
+                },
+                "limite": {
+                    "type": "integer",
+                    "description": "Cantidad maxima de candidatos (default 10)",
+                },
+            },
+            "required": ["nombre"],
+        },
+    },
+    {
+        "name": "buscar_vendedores",
+        "description": (
+            "Busca vendedores (usuarios internos) por nombre y devuelve candidatos "
+            "ordenados con su id. Usar para obtener vendedor_ids antes de get_ventas."
+        ),
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "nombre": {
+                    "type": "string",
+                    "description": "Nombre o parte del nombre del vendedor",
+                },
+                "limite": {
+                    "type": "integer",
+                    "description": "Cantidad maxima de candidatos (default 10)",
+                },
+            },
+            "required": ["nombre"],
+        },
+    },
+    {
+        "name": "exportar",
+        "description": (
+            "Genera un archivo CSV o Excel con TODAS las filas de get_productos, get_ventas "
+            "o get_facturas (sin paginar) y devuelve un link de descarga. Usar cuando el "
+            "usuario pide la lista completa o un archivo."
+        ),
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "funcion": {
+                    "type": "string",
+                    "enum": ["get_productos", "get_ventas", "get_facturas"],
+                    "description": "Funcion cuyo resultado completo se exporta",
+                },
+                "argumentos": {
+                    "type": "object",
+                    "description": "Los mismos filtros que se usarian en esa funcion",
+                },
+                "formato": {
+                    "type": "string",
+                    "enum": ["csv", "xlsx"],
+                    "description": "Formato del archivo (default xlsx)",
+                },
+            },
+            "required": ["funcion"],
+        },
+    },
 ]
 
 SYSTEM_PROMPT = """Eres un asistente de Odoo ERP especializado en datos de negocio.
@@ -169,9 +482,20 @@ REGLAS CRITICAS:
 1. SIEMPRE usa funciones para obtener datos. NUNCA inventes datos.
 2. Para consultas complejas, ENCADENA funciones: usa el resultado de una como entrada de la siguiente.
    Ejemplo: primero get_productos para obtener IDs, luego get_ventas con esos producto_ids.
+   Pero si la pregunta filtra productos por nombre o categoria y pide sus ventas o su
+   facturacion (ej: "ventas del trimestre de la categoria X por vendedor"), usa get_cruce
+   en una sola llamada en vez de encadenar.
+   Si el usuario nombra un cliente o vendedor, resolve su ID con buscar_contactos o
+   buscar_vendedores (no adivines IDs); si hay varios candidatos parecidos, preguntale cual.
 3. Las funciones tienen proteccion automatica: si hay demasiados registros, devuelven una advertencia
-   con la cantidad y te piden que solicites al usuario filtros adicionales.
+   con la cantidad junto con la primera pagina de resultados.
    Cuando recibas una advertencia, transmitila al usuario de forma amigable y sugerile opciones para acotar.
+   Si el usuario quiere ver mas, volve a llamar a la funcion con los mismos filtros y el
+   'cursor_siguiente' recibido para traer la pagina siguiente.
+   Para preguntas de magnitud ("cuanto suman", "que tan grandes son") sobre muchos registros,
+   usa resumen=true: devuelve estadisticas del total sin listar filas.
+   Si el usuario quiere la lista completa o un archivo, usa exportar con los mismos filtros
+   y pasale el link de descarga (no pagines todo en el chat).
 4. Responde en espanol, conciso y directo.
 5. Usa valores por defecto si el usuario no especifica.
 6. Si la pregunta no se relaciona con ninguna funcion, indica que consultas podes hacer.
@@ -179,12 +503,16 @@ REGLAS CRITICAS:
 
 Funciones disponibles cubren:
 - Productos: buscar productos, ver precios, stock, categorias
+- Inventario: valorizacion por categoria/almacen, dias de cobertura, productos sin movimiento
 - Ventas: totales, rankings por vendedor/producto/cliente, periodos
+- Cruces: ventas o facturacion de productos filtrados por nombre/categoria, agrupadas
 - Facturacion: cuentas por cobrar/pagar, vencimientos, estados
+- Contactos y vendedores: resolver nombres a IDs
+- Exportacion: archivo CSV/Excel con el resultado completo de una consulta
 
 FLUJO RECOMENDADO para consultas complejas:
 1. Llamar a la funcion directamente (el sistema verifica volumen automaticamente)
-2. Si recibes advertencia de volumen, pedir al usuario que acote la consulta
+2. Si recibes advertencia de volumen, mostrar la primera pagina y ofrecer acotar o seguir paginando
 3. Encadenar si necesitas cruzar datos (ej: productos -> ventas de esos productos)
 """
 
@@ -208,21 +536,39 @@ class OdooChatbot2(models.Model):
         string='Mensajes',
     )
     input_text = fields.Char(string='Tu mensaje')
+    active = fields.Boolean(string='Activa', default=True)
+    turno_inicio = fields.Datetime(
+        string='Turno en curso desde', readonly=True, copy=False,
+        help='Inicio del turno que esta respondiendo en la sesion (vacio si no hay).',
+    )
+    historial_archivado = fields.Binary(
+        string='Historial archivado',
+        attachment=True,
+        help='Mensajes de la sesion comprimidos (JSON + zlib) al archivarla.',
+    )
     chat_html = fields.Html(
         string='Chat',
         compute='_compute_chat_html',
         sanitize=False,
     )
 
-    @api.depends('message_ids', 'message_ids.content', 'message_ids.role', 'message_ids.visible')
+    @api.depends('message_ids', 'message_ids.content', 'message_ids.role', 'message_ids.visible',
+                 'historial_archivado')
     def _compute_chat_html(self):
         for record in self:
+            if record.message_ids:
+                mensajes = [
+                    {'role': m.role, 'content': m.content, 'visible': m.visible}
+                    for m in record.message_ids.sorted('sequence')
+                ]
+            else:
+                mensajes = record._leer_historial_archivado()
             html_parts = []
-            for msg in record.message_ids.sorted('sequence'):
-                if not msg.visible:
+            for msg in mensajes:
+                if not msg['visible']:
                     continue
-                content = (msg.content or '').replace('<', '&lt;').replace('>', '&gt;').replace('\n', '<br/>')
-                if msg.role == 'user':
+                content = (msg['content'] or '').replace('<', '&lt;').replace('>', '&gt;').replace('\n', '<br/>')
+                if msg['role'] == 'user':
                     html_parts.append(
                         '<div style="text-align:right; margin:8px 0;">'
                         '<span style="background:#d1ecf1; padding:10px 16px; '
@@ -230,7 +576,7 @@ class OdooChatbot2(models.Model):
                         'max-width:80%%; text-align:left; font-size:13px;">'
                         '<b>Vos:</b><br/>%s</span></div>' % content
                     )
-                elif msg.role == 'assistant':
+                elif msg['role'] == 'assistant':
                     html_parts.append(
                         '<div style="text-align:left; margin:8px 0;">'
                         '<span style="background:#d4edda; padding:10px 16px; '
@@ -253,16 +599,124 @@ class OdooChatbot2(models.Model):
             return
         user_text = self.input_text
         self.input_text = False
+        self.preguntar(user_text)
+
+    def preguntar(self, texto):
+        """Ejecuta un turno completo del agente y retorna la respuesta visible.
+
+        Es el punto de entrada comun de la vista (accion_enviar) y del
+        controlador HTTP (/chatbot/ask).
+        """
+        self.ensure_one()
+
+        # Un turno por sesion: un segundo envio concurrente se rechaza al
+        # instante, antes de escribir nada o llamar al LLM
+        if not self._tomar_turno():
+            raise TurnoEnCurso(MENSAJE_TURNO_EN_CURSO)
+        try:
+            return self._turno(texto)
+        except Exception:
+            self.env.cr.rollback()
+            self.invalidate_cache()
+            raise
+        finally:
+            self._liberar_turno()
+
+    def _turno(self, texto):
+        """Turno del agente en transacciones cortas.
+
+        Cada fase de base de datos (guardar la pregunta, ejecutar funciones,
+        guardar resultados) se confirma antes de esperar al LLM o a la cola de
+        admision: mientras se espera la red no queda ninguna transaccion
+        abierta ni locks tomados.
+
+        Una vez confirmada la pregunta ningun error de concurrencia sale de
+        aca: Odoo reintentaria el request entero (service.model.check), con
+        la pregunta guardada de nuevo y todas las llamadas al LLM repetidas.
+        El turno termina con un mensaje de error del asistente.
+        """
+        # Una sesion archivada vuelve a la tabla de mensajes al retomarla
+        if self.historial_archivado:
+            self._restaurar_historial_archivado()
+
+        # Solo la primera pregunta de la sesion no depende de contexto previo:
+        # es la unica que aprende o reutiliza planes
+        primera = not self.message_ids.filtered(lambda m: m.role == 'user')
 
         # Inyectar system prompt si es el primer mensaje
         if not self.message_ids.filtered(lambda m: m.role == 'system'):
             self._crear_mensaje('system', SYSTEM_PROMPT, visible=False)
 
         # Agregar mensaje del usuario
-        self._crear_mensaje('user', user_text)
+        self._crear_mensaje('user', texto)
+        self.env.cr.commit()
+
+        # Ejecutar loop de OpenAI dentro del pool acotado de turnos
+        try:
+            with control_admision(PREFIJO_CONFIG).turno(self.env.uid):
+                self._ejecutar_loop_openai(pregunta=texto if primera else None)
+        except ChatbotSaturado as e:
+            _logger.info("Turno de chatbot rechazado para uid %s: %s", self.env.uid, e)
+            self._crear_mensaje('assistant', str(e))
+        except psycopg2.OperationalError as e:
+            if e.pgcode not in PG_CONCURRENCY_ERRORS_TO_RETRY:
+                raise
+            _logger.warning("Sesion de chatbot %s: conflicto de concurrencia en el turno (%s)",
+                            self.id, e.pgcode)
+            self.env.cr.rollback()
+            self.invalidate_cache()
+            self._crear_mensaje('assistant', MENSAJE_CONFLICTO)
+
+        ultima = self.env['chatbot.ia2.message'].search([
+            ('session_id', '=', self.id),
+            ('role', '=', 'assistant'),
+            ('visible', '=', True),
+        ], order='sequence desc, id desc', limit=1)
+        respuesta = ultima.content or ''
+        # La respuesta queda confirmada antes de liberar el turno
+        self.env.cr.commit()
+        return respuesta
+
+    def _tomar_turno(self):
+        """Marca la sesion con un turno en curso, si no tiene uno vigente.
+
+        Es un UPDATE condicional que se confirma enseguida: el turno queda
+        registrado en la fila (no en un lock de la transaccion), asi el resto
+        del turno puede hacer commits cortos. Retorna False si otra pestana o
+        envio ya tiene el turno.
+        """
+        turno_max = float(config.get(f'{PREFIJO_CONFIG}_turno_max') or TURNO_MAX_DEFAULT)
+        ahora = fields.Datetime.now()
+        self.flush()
+        self.env.cr.execute("""
+            UPDATE chatbot_ia2 SET turno_inicio = %s
+             WHERE id = %s AND (turno_inicio IS NULL OR turno_inicio < %s)
+         RETURNING id
+        """, [ahora, self.id, ahora - timedelta(seconds=turno_max)])
+        tomado = bool(self.env.cr.fetchone())
+        self.invalidate_cache(['turno_inicio'])
+        if not tomado:
+            _logger.info("Sesion de chatbot %s: turno ya en curso, envio rechazado", self.id)
+            return False
+        self.env.cr.commit()
+        return True
 
-        # Ejecutar loop de OpenAI
-        self._ejecutar_loop_openai()
+    def _liberar_turno(self):
+        """Borra la marca del turno. Ante un conflicto de concurrencia se
+        reintenta aca (la transaccion ya no tiene trabajo pendiente) en vez de
+        dejar que Odoo repita el request."""
+        for intento in range(3):
+            try:
+                self.env.cr.execute(
+                    "UPDATE chatbot_ia2 SET turno_inicio = NULL WHERE id = %s", [self.id],
+                )
+                break
+            except psycopg2.OperationalError as e:
+                if e.pgcode not in PG_CONCURRENCY_ERRORS_TO_RETRY or intento == 2:
+                    raise
+                self.env.cr.rollback()
+        self.invalidate_cache(['turno_inicio'])
+        self.env.cr.commit()
 
     def accion_nueva_sesion(self):
         nueva = self.create({})
@@ -278,14 +732,43 @@ class OdooChatbot2(models.Model):
     # Loop OpenAI con funciones encadenadas
     # ------------------------------------------------------------------
 
-    def _ejecutar_loop_openai(self):
-        """Loop: enviar historial -> si function_call ejecutar y repetir -> si texto, fin."""
+    def _ejecutar_loop_openai(self, pregunta=None):
+        """Loop: enviar historial -> si function_call ejecutar y repetir -> si texto, fin.
+
+        Si `pregunta` es la primera de la sesion y se parece lo suficiente a una
+        pregunta pasada, se reutiliza su plan (funcion + argumentos) y se
+        saltea la llamada de planificacion al LLM.
+
+        Mientras la IA procesa un resultado, las llamadas que suelen seguirlo
+        se ejecutan en segundo plano (ver especulacion.py).
+        """
+        especulacion = EspeculacionTurno(self.env, PREFIJO_CONFIG)
+        try:
+            self._iterar_openai(pregunta, especulacion)
+        finally:
+            especulacion.cerrar()
+
+    def _iterar_openai(self, pregunta, especulacion):
+        plan = None
+        if pregunta:
+            plan = self.env['chatbot.ia2.plan'].buscar_similar(pregunta)
+
         for i in range(MAX_ITERACIONES):
+            if i == 0 and plan:
+                plan.sudo().sumar_uso()
+                self._ejecutar_llamada(plan.function_name, plan.arguments, i, especulacion)
+                continue
+
             mensajes_api = self._construir_historial_api()
+            # Nada de la transaccion queda abierto durante la espera al LLM
+            self.env.cr.commit()
 
+            # Con resultados de funciones recien llegados lo esperable es la
+            # sintesis de la respuesta; si no, elegir la proxima funcion
+            tipo = 'respuesta' if mensajes_api[-1]['role'] == 'function' else 'herramientas'
             try:
-                response = openai.ChatCompletion.create(
-                    model="gpt-4o-mini",
+                response = completar(
+                    PREFIJO_CONFIG, tipo,
                     messages=mensajes_api,
                     functions=FUNCIONES_DISPONIBLES,
                     function_call="auto",
@@ -301,36 +784,9 @@ class OdooChatbot2(models.Model):
             if mensaje.get("function_call"):
                 nombre = mensaje["function_call"]["name"]
                 args_str = mensaje["function_call"].get("arguments", "{}")
-
-                try:
-                    argumentos = json.loads(args_str)
-                except json.JSONDecodeError:
-                    argumentos = {}
-
-                # Guardar la decision del asistente (oculto en el chat)
-                self._crear_mensaje(
-                    'assistant',
-                    json.dumps({
-                        "function_call": {
-                            "name": nombre,
-                            "arguments": args_str,
-                        }
-                    }, ensure_ascii=False),
-                    visible=False,
-                    function_name=nombre,
-                )
-
-                # Ejecutar la funcion
-                resultado = self._ejecutar_funcion(nombre, argumentos)
-
-                # Guardar resultado de la funcion (oculto en el chat)
-                self._crear_mensaje(
-                    'function',
-                    json.dumps(resultado, ensure_ascii=False, cls=OdooJSONEncoder),
-                    visible=False,
-                    function_name=nombre,
-                )
-                _logger.info("Iteracion %d: funcion '%s' ejecutada", i, nombre)
+                resultado = self._ejecutar_llamada(nombre, args_str, i, especulacion)
+                if i == 0 and pregunta and not resultado.get('error'):
+                    self.env['chatbot.ia2.plan'].sudo().registrar(pregunta, nombre, args_str)
                 # Continuar loop para que GPT procese el resultado
             else:
                 # GPT respondio con texto
@@ -344,6 +800,47 @@ class OdooChatbot2(models.Model):
             "Se alcanzo el limite de operaciones. Por favor, reformula tu pregunta.",
         )
 
+    def _ejecutar_llamada(self, nombre, args_str, iteracion, especulacion=None):
+        """Registra el function_call, ejecuta la funcion y guarda su resultado.
+
+        Ambos mensajes quedan ocultos en el chat. Si `especulacion` ya tiene
+        el resultado de esta llamada se usa ese. Retorna el resultado.
+        """
+        try:
+            argumentos = json.loads(args_str)
+        except json.JSONDecodeError:
+            argumentos = {}
+
+        # Guardar la decision del asistente (oculto en el chat)
+        self._crear_mensaje(
+            'assistant',
+            json.dumps({
+                "function_call": {
+                    "name": nombre,
+                    "arguments": args_str,
+                }
+            }, ensure_ascii=False),
+            visible=False,
+            function_name=nombre,
+        )
+
+        # Ejecutar la funcion (o tomar el resultado especulado)
+        resultado = especulacion.tomar(nombre, argumentos) if especulacion else None
+        if resultado is None:
+            resultado = self._ejecutar_funcion(nombre, argumentos)
+        if especulacion:
+            especulacion.lanzar(nombre, argumentos, resultado)
+
+        # Guardar resultado de la funcion (oculto en el chat)
+        self._crear_mensaje(
+            'function',
+            json.dumps(resultado, ensure_ascii=False, cls=OdooJSONEncoder),
+            visible=False,
+            function_name=nombre,
+        )
+        _logger.info("Iteracion %d: funcion '%s' ejecutada", iteracion, nombre)
+        return resultado
+
     # ------------------------------------------------------------------
     # Construccion del historial para la API
     # ------------------------------------------------------------------
@@ -356,7 +853,7 @@ class OdooChatbot2(models.Model):
                 mensajes.append({
                     "role": "function",
                     "name": msg.function_name,
-                    "content": msg.content or "",
+                    "content": msg.contenido(),
                 })
             elif msg.role == 'assistant' and msg.function_name:
                 # Mensaje del asistente que contiene un function_call
@@ -388,36 +885,67 @@ class OdooChatbot2(models.Model):
 
     def _ejecutar_funcion(self, nombre, argumentos):
         """Rutea las llamadas de funciones a los handlers KPI correspondientes."""
-        try:
-            if nombre == 'get_productos':
-                return self.env['chatbot2.kpi.productos'].get_productos(
-                    orden=argumentos.get('orden', 'nombre_asc'),
-                    limite=argumentos.get('limite', 10),
-                    filtros=argumentos.get('filtros', {}),
-                )
-            elif nombre == 'get_ventas':
-                return self.env['chatbot2.kpi.ventas'].get_ventas(
-                    producto_ids=argumentos.get('producto_ids'),
-                    vendedor_ids=argumentos.get('vendedor_ids'),
-                    cliente_ids=argumentos.get('cliente_ids'),
-                    agrupar_por=argumentos.get('agrupar_por'),
-                    periodo=argumentos.get('periodo', 'mes_actual'),
-                    limite=argumentos.get('limite', 20),
-                    orden=argumentos.get('orden', 'monto_desc'),
-                )
-            elif nombre == 'get_facturas':
-                return self.env['chatbot2.kpi.facturacion'].get_facturas(
-                    tipo=argumentos.get('tipo', 'cliente'),
-                    estado=argumentos.get('estado', 'pendiente'),
-                    dias_vencimiento=argumentos.get('dias_vencimiento'),
-                    cliente_ids=argumentos.get('cliente_ids'),
-                    limite=argumentos.get('limite', 20),
-                )
+        if nombre != 'exportar' and nombre not in FUNCIONES_KPI:
             return {'error': True, 'mensaje': f"Funcion '{nombre}' no disponible"}
+        try:
+            kwargs = normalizar_argumentos(nombre, argumentos)
+            if nombre == 'exportar':
+                return self._exportar(**kwargs)
+            modelo, metodo = FUNCIONES_KPI[nombre]
+            return _KPIS_EN_CURSO.ejecutar(
+                self._clave_coalescencia(nombre, kwargs),
+                lambda: ejecutar_lectura(
+                    PREFIJO_CONFIG, self.env, lambda env: getattr(env[modelo], metodo)(**kwargs),
+                ),
+            )
         except Exception as e:
+            # Los conflictos de concurrencia cortan el turno (ver _turno)
+            if getattr(e, 'pgcode', None) in PG_CONCURRENCY_ERRORS_TO_RETRY:
+                raise
             _logger.error("Error ejecutando funcion '%s': %s", nombre, str(e))
             return {'error': True, 'mensaje': f"Error al ejecutar '{nombre}': {str(e)}"}
 
+    def _exportar(self, funcion, argumentos, formato):
+        """Encola la exportacion completa; el archivo se genera en segundo plano."""
+        if funcion not in EXPORTABLES:
+            return {'error': True, 'mensaje': f"La funcion '{funcion}' no se puede exportar"}
+        kwargs = normalizar_argumentos(funcion, argumentos)
+        for clave in ('limite', 'cursor', 'resumen', 'orden', 'agrupar_por'):
+            kwargs.pop(clave, None)
+        exportacion = self.env['chatbot.ia2.exportacion'].solicitar(
+            funcion, kwargs, formato=formato, session=self,
+        )
+        return {
+            'exportacion_id': exportacion.id,
+            'estado': exportacion.estado,
+            'url': exportacion.url(),
+            'mensaje': (
+                "La exportacion se esta generando. El archivo se descarga desde la url "
+                "cuando este listo (unos segundos a minutos segun el volumen)."
+            ),
+        }
+
+    def _clave_coalescencia(self, nombre, argumentos):
+        """Clave de una llamada KPI: dos llamadas con la misma clave devuelven
+        lo mismo (misma base, funcion y argumentos normalizados, y mismo
+        alcance de lectura: companias, grupos, reglas efectivas, idioma y zona
+        horaria)."""
+        Rule = self.env['ir.rule']
+        reglas = tuple(
+            str(Rule._compute_domain(modelo, 'read'))
+            for modelo in MODELOS_LEIDOS.get(nombre, ())
+        )
+        return (
+            self.env.cr.dbname,
+            clave_llamada(nombre, argumentos),
+            tuple(self.env.companies.ids),
+            tuple(sorted(self.env.user.groups_id.ids)),
+            self.env.su,
+            self.env.context.get('lang'),
+            self.env.context.get('tz'),
+            reglas,
+        )
+
     # ------------------------------------------------------------------
     # Helper para crear mensajes
     # ------------------------------------------------------------------
@@ -426,8 +954,15 @@ class OdooChatbot2(models.Model):
         """Crea un nuevo mensaje en la sesion."""
         if visible is None:
             visible = role in ('user', 'assistant') and not function_name
-        max_seq = max(self.message_ids.mapped('sequence') or [0])
-        self.env['chatbot.ia2.message'].create({
+        # MAX en la base (bajo el lock del turno) en vez de cargar message_ids
+        Message = self.env['chatbot.ia2.message']
+        Message.flush(['sequence', 'session_id'])
+        self.env.cr.execute(
+            "SELECT COALESCE(MAX(sequence), 0) FROM chatbot_ia2_message WHERE session_id = %s",
+            [self.id],
+        )
+        max_seq = self.env.cr.fetchone()[0]
+        Message.create({
             'session_id': self.id,
             'sequence': max_seq + 1,
             'role': role,
@@ -435,3 +970,100 @@ class OdooChatbot2(models.Model):
             'function_name': function_name,
             'visible': visible,
         })
+
+    # ------------------------------------------------------------------
+    # Retencion: compactacion y archivado de sesiones viejas
+    # ------------------------------------------------------------------
+
+    def _leer_historial_archivado(self):
+        """Lista de mensajes (dicts) guardados en historial_archivado."""
+        self.ensure_one()
+        if not self.historial_archivado:
+            return []
+        raw = zlib.decompress(base64.b64decode(self.historial_archivado))
+        return json.loads(raw.decode('utf-8'))
+
+    def _restaurar_historial_archivado(self):
+        """Devuelve los mensajes archivados a chatbot.ia2.message y reactiva la sesion."""
+        self.ensure_one()
+        mensajes = self._leer_historial_archivado()
+        self.env['chatbot.ia2.message'].create([
+            dict(msg, session_id=self.id) for msg in mensajes
+        ])
+        self.write({'historial_archivado': False, 'active': True})
+
+    def _archivar(self):
+        """Comprime los mensajes de cada sesion en historial_archivado, los
+        borra de la tabla de mensajes y desactiva la sesion."""
+        for sesion in self:
+            mensajes = [
+                {
+                    'sequence': m.sequence,
+                    'role': m.role,
+                    'content': m.contenido(),
+                    'function_name': m.function_name,
+                    'visible': m.visible,
+                }
+                for m in sesion.message_ids.sorted('sequence')
+            ]
+            raw = json.dumps(mensajes, ensure_ascii=False).encode('utf-8')
+            sesion.write({
+                'historial_archivado': base64.b64encode(zlib.compress(raw, 9)),
+                'active': False,
+            })
+            sesion.message_ids.unlink()
+
+    @api.model
+    def _cron_retencion(self):
+        """Mantiene chico el historial caliente de chatbot_ia2_message.
+
+        - Borra los mensajes ocultos de funciones (function_call y resultados
+          JSON) con mas de `chatbot_ia2.dias_compactar` dias: las preguntas y
+          respuestas visibles conservan el contexto de la conversacion.
+        - Archiva las sesiones sin actividad en `chatbot_ia2.dias_archivar`
+          dias en un unico blob comprimido por sesion.
+        """
+        params = self.env['ir.config_parameter'].sudo()
+        dias_compactar = int(params.get_param('chatbot_ia2.dias_compactar', DIAS_COMPACTAR_DEFAULT))
+        dias_archivar = int(params.get_param('chatbot_ia2.dias_archivar', DIAS_ARCHIVAR_DEFAULT))
+        ahora = fields.Datetime.now()
+
+        self.env['chatbot.ia2.message'].flush()
+        self.env.cr.execute("""
+            DELETE FROM chatbot_ia2_message
+             WHERE visible = false
+               AND (role = 'function' OR (role = 'assistant' AND function_name IS NOT NULL))
+               AND create_date < %s
+         RETURNING COALESCE(octet_length(content), 0)
+                   + COALESCE(octet_length(content_comprimido), 0)
+        """, [ahora - timedelta(days=dias_compactar)])
+        liberados = [r[0] for r in self.env.cr.fetchall()]
+        self.env['chatbot.ia2.message'].invalidate_cache()
+
+        self.env.cr.execute("""
+            SELECT s.id
+              FROM chatbot_ia2 s
+              LEFT JOIN chatbot_ia2_message m ON m.session_id = s.id
+             WHERE s.active
+             GROUP BY s.id
+            HAVING COALESCE(MAX(m.create_date), MAX(s.write_date)) < %s
+             LIMIT %s
+        """, [ahora - timedelta(days=dias_archivar), LOTE_ARCHIVADO])
+        sesiones = self.browse([r[0] for r in self.env.cr.fetchall()])
+        cantidad_archivados = len(sesiones.mapped('message_ids'))
+        sesiones._archivar()
+
+        stats = {
+            'fecha': fields.Datetime.to_string(ahora),
+            'mensajes_compactados': len(liberados),
+            'bytes_liberados': sum(liberados),
+            'sesiones_archivadas': len(sesiones),
+            'mensajes_archivados': cantidad_archivados,
+        }
+        params.set_param('chatbot_ia2.ultima_retencion', json.dumps(stats))
+        _logger.info(
+            "Retencion chatbot: %(mensajes_compactados)d mensajes de funciones compactados "
+            "(%(bytes_liberados)d bytes), %(sesiones_archivadas)d sesiones archivadas "
+            "(%(mensajes_archivados)d mensajes)", stats,
+        )
+        return stats
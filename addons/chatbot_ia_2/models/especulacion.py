@@ -0,0 +1,169 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import odoo
+from odoo import api
+
+from odoo.addons.chatbot_ia_base.tools.admision import control_admision
+from .argumentos import clave_llamada, normalizar_argumentos
+
+_logger = logging.getLogger(__name__)
+
+# Threads para ejecutar llamadas especulativas (cada una abre su cursor)
+MAX_ESPECULACIONES = 2
+# Minimo de intentos antes de juzgar una cadena, y tasa de aciertos minima
+MIN_INTENTOS_CADENA = 20
+TASA_ACIERTO_MIN = 0.2
+# IDs de socios a partir de los cuales no se especula con facturas
+MAX_CLIENTES_ESPECULACION = 10
+
+
+def _ventas_de_productos(argumentos, resultado):
+    ids = resultado.get('ids') or []
+    if not ids:
+        return None
+    return {'producto_ids': ids}
+
+
+def _ventas_de_clientes(argumentos, resultado):
+    if argumentos.get('tipo') != 'cliente':
+        return None
+    clientes = {d.get('cliente_id') for d in resultado.get('data') or [] if d.get('cliente_id')}
+    if not clientes or len(clientes) > MAX_CLIENTES_ESPECULACION:
+        return None
+    return {'cliente_ids': sorted(clientes)}
+
+
+# Cadenas que el system prompt sugiere: funcion previa -> [(siguiente, armador)].
+# El armador recibe los argumentos normalizados y el resultado de la llamada
+# previa, y devuelve los argumentos probables de la siguiente (o None).
+CADENAS = {
+    'get_productos': [('get_ventas', _ventas_de_productos)],
+    'get_facturas': [('get_ventas', _ventas_de_clientes)],
+}
+
+# Aciertos por cadena en este proceso: {(previa, siguiente): [intentos, aciertos]}
+_ESTADISTICAS = {}
+_ESTADISTICAS_LOCK = threading.Lock()
+
+_EJECUTOR = None
+_EJECUTOR_LOCK = threading.Lock()
+
+
+def _ejecutor():
+    global _EJECUTOR
+    with _EJECUTOR_LOCK:
+        if _EJECUTOR is None:
+            _EJECUTOR = ThreadPoolExecutor(
+                max_workers=MAX_ESPECULACIONES, thread_name_prefix='chatbot_especulacion',
+            )
+        return _EJECUTOR
+
+
+def _cadena_habilitada(cadena):
+    with _ESTADISTICAS_LOCK:
+        intentos, aciertos = _ESTADISTICAS.get(cadena, (0, 0))
+    return intentos < MIN_INTENTOS_CADENA or aciertos >= intentos * TASA_ACIERTO_MIN
+
+
+def _contar(cadena, acierto):
+    with _ESTADISTICAS_LOCK:
+        estadistica = _ESTADISTICAS.setdefault(cadena, [0, 0])
+        estadistica[0] += 1
+        if acierto:
+            estadistica[1] += 1
+
+
+def estadisticas():
+    """Intentos y aciertos por cadena en este proceso."""
+    with _ESTADISTICAS_LOCK:
+        return {
+            f'{previa}->{siguiente}': {'intentos': intentos, 'aciertos': aciertos}
+            for (previa, siguiente), (intentos, aciertos) in _ESTADISTICAS.items()
+        }
+
+
+def _ejecutar_en_cursor_propio(prefijo, dbname, uid, context, nombre, argumentos):
+    """Corre la funcion KPI en una transaccion propia, de solo lectura.
+
+    La conexion cuenta contra el control de admision; si no hay lugar la
+    especulacion se omite (retorna None) y el turno ejecuta la llamada.
+    """
+    registry = odoo.registry(dbname)
+    with control_admision(prefijo).conexion_extra() as reservada:
+        if not reservada:
+            return None
+        with api.Environment.manage(), registry.cursor() as cr:
+            env = api.Environment(cr, uid, context)
+            try:
+                return env['chatbot.ia2']._ejecutar_funcion(nombre, argumentos)
+            finally:
+                cr.rollback()
+
+
+class EspeculacionTurno:
+    """Llamadas especulativas de un turno del chatbot.
+
+    Despues de cada resultado de funcion se lanzan en segundo plano las
+    llamadas que probablemente pida la IA a continuacion; si la siguiente
+    iteracion pide exactamente esa llamada, se usa el resultado ya calculado.
+    Las especulaciones leen con su propio cursor y no escriben nada; cada
+    cursor ocupa un lugar del control de admision de `prefijo`.
+    """
+
+    def __init__(self, env, prefijo):
+        self.prefijo = prefijo
+        self.dbname = env.cr.dbname
+        self.uid = env.uid
+        self.context = dict(env.context)
+        self._pendientes = {}
+
+    def lanzar(self, nombre, argumentos, resultado):
+        if not isinstance(resultado, dict) or resultado.get('error') or resultado.get('advertencia'):
+            return
+        argumentos = normalizar_argumentos(nombre, argumentos)
+        if argumentos.get('resumen'):
+            return
+        for siguiente, armador in CADENAS.get(nombre, []):
+            cadena = (nombre, siguiente)
+            if not _cadena_habilitada(cadena):
+                continue
+            args_siguiente = armador(argumentos, resultado)
+            if args_siguiente is None:
+                continue
+            clave = clave_llamada(siguiente, args_siguiente)
+            if clave in self._pendientes:
+                continue
+            futuro = _ejecutor().submit(
+                _ejecutar_en_cursor_propio, self.prefijo, self.dbname, self.uid, self.context,
+                siguiente, args_siguiente,
+            )
+            self._pendientes[clave] = (cadena, futuro)
+
+    def tomar(self, nombre, argumentos):
+        """Resultado especulado para la llamada, o None si no hay (o fallo)."""
+        pendiente = self._pendientes.pop(clave_llamada(nombre, argumentos), None)
+        if not pendiente:
+            return None
+        cadena, futuro = pendiente
+        _contar(cadena, acierto=True)
+        # Si todavia no arranco, conviene ejecutarla en el thread del turno
+        if futuro.cancel():
+            return None
+        try:
+            resultado = futuro.result()
+        except Exception as e:
+            _logger.warning("Especulacion de '%s' fallo: %s", nombre, e)
+            return None
+        if resultado is None or isinstance(resultado, dict) and resultado.get('error'):
+            return None
+        _logger.info("Especulacion acertada: %s -> %s", *cadena)
+        return resultado
+
+    def cerrar(self):
+        """Cancela lo que no llego a empezar y computa los desaciertos."""
+        for cadena, futuro in self._pendientes.values():
+            futuro.cancel()
+            _contar(cadena, acierto=False)
+        self._pendientes.clear()
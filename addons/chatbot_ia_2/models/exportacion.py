@@ -0,0 +1,300 @@
+import os
+import csv
+import json
+import base64
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+from datetime import timedelta
+
+import odoo
+from odoo import models, fields, api, SUPERUSER_ID
+
+from odoo.addons.chatbot_ia_base.tools.admision import control_admision
+
+_logger = logging.getLogger(__name__)
+
+# Funcion exportable -> modelo KPI que arma su SQL (_sql_exportacion)
+EXPORTABLES = {
+    'get_productos': 'chatbot2.kpi.productos',
+    'get_ventas': 'chatbot2.kpi.ventas',
+    'get_facturas': 'chatbot2.kpi.facturacion',
+}
+
+# Filas que se traen por FETCH del cursor del servidor
+FILAS_POR_LOTE = 2000
+# Limite de filas de una hoja XLSX (sin contar el encabezado)
+MAX_FILAS_XLSX = 1048575
+# Una exportacion en proceso hace mas de esto se considera abandonada
+MINUTOS_ABANDONADA = 30
+
+MIMETYPES = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+# Primer caracter con el que una planilla interpreta una celda como formula
+INICIO_FORMULA = ('=', '+', '-', '@')
+
+
+def _celda_csv(valor):
+    """Valor de la celda como texto; si empieza como una formula se le antepone
+    un apostrofe para que la planilla lo muestre como texto."""
+    if valor is None:
+        return ''
+    if isinstance(valor, str) and valor.startswith(INICIO_FORMULA):
+        return "'" + valor
+    return valor
+
+
+class _EscritorCSV:
+    def __init__(self, path):
+        self._archivo = open(path, 'w', newline='', encoding='utf-8-sig')
+        self._csv = csv.writer(self._archivo)
+
+    def fila(self, valores):
+        self._csv.writerow([_celda_csv(v) for v in valores])
+
+    def cerrar(self):
+        self._archivo.close()
+
+
+class _EscritorXLSX:
+    """xlsxwriter en modo constant_memory: cada fila se escribe al disco
+    cuando se pasa a la siguiente, sin guardar la hoja en memoria.
+
+    Los textos se escriben siempre como texto (nunca como formula ni link).
+    """
+
+    def __init__(self, path):
+        import xlsxwriter
+        self._libro = xlsxwriter.Workbook(path, {
+            'constant_memory': True,
+            'default_date_format': 'yyyy-mm-dd',
+            'strings_to_formulas': False,
+            'strings_to_urls': False,
+            'tmpdir': tempfile.gettempdir(),
+        })
+        self._hoja = self._libro.add_worksheet()
+        self._numero = 0
+
+    def fila(self, valores):
+        self._hoja.write_row(self._numero, 0, valores)
+        self._numero += 1
+
+    def cerrar(self):
+        self._libro.close()
+
+
+def _procesar_en_hilo(dbname, exportacion_id):
+    """Genera la exportacion en un thread con su propio cursor.
+
+    El cursor cuenta contra el control de admision del chatbot: si no hay
+    lugar la exportacion queda pendiente y la toma el cron.
+    """
+    # chatbot.py importa este modulo
+    from .chatbot import PREFIJO_CONFIG
+
+    def ejecutar():
+        with control_admision(PREFIJO_CONFIG).conexion_extra() as reservada:
+            if not reservada:
+                _logger.info("Exportacion %s sin lugar en el pool: queda para el cron", exportacion_id)
+                return
+            with api.Environment.manage(), odoo.registry(dbname).cursor() as cr:
+                env = api.Environment(cr, SUPERUSER_ID, {})
+                env['chatbot.ia2.exportacion'].browse(exportacion_id)._procesar()
+
+    threading.Thread(
+        target=ejecutar, name=f'chatbot_exportacion_{exportacion_id}', daemon=True,
+    ).start()
+
+
+class ChatbotExportacion(models.Model):
+    """Exportacion completa (CSV/XLSX) del resultado de una funcion KPI.
+
+    Se genera en segundo plano despues del commit que la crea; el chat solo
+    recibe el link de descarga, sin las filas.
+    """
+    _name = 'chatbot.ia2.exportacion'
+    _description = 'Exportacion de resultados del chatbot'
+    _order = 'id desc'
+
+    session_id = fields.Many2one('chatbot.ia2', string='Sesion', ondelete='set null')
+    user_id = fields.Many2one(
+        'res.users', string='Usuario', required=True, default=lambda self: self.env.user,
+    )
+    funcion = fields.Char(string='Funcion', required=True)
+    argumentos = fields.Text(string='Argumentos (JSON)', default='{}')
+    contexto = fields.Text(string='Contexto (JSON)', default='{}')
+    formato = fields.Selection([
+        ('csv', 'CSV'),
+        ('xlsx', 'Excel (XLSX)'),
+    ], string='Formato', required=True, default='xlsx')
+    estado = fields.Selection([
+        ('pendiente', 'Pendiente'),
+        ('en_proceso', 'En proceso'),
+        ('listo', 'Listo'),
+        ('error', 'Error'),
+    ], string='Estado', required=True, default='pendiente', index=True)
+    inicio = fields.Datetime(string='Inicio')
+    filas = fields.Integer(string='Filas')
+    truncada = fields.Boolean(string='Truncada')
+    attachment_id = fields.Many2one('ir.attachment', string='Archivo', ondelete='set null')
+    error = fields.Text(string='Error')
+
+    @api.model
+    def solicitar(self, funcion, argumentos, formato='xlsx', session=None):
+        """Crea la exportacion; se procesa cuando se confirma la transaccion."""
+        contexto = {
+            clave: self.env.context[clave]
+            for clave in ('allowed_company_ids', 'lang', 'tz')
+            if self.env.context.get(clave)
+        }
+        exportacion = self.create({
+            'session_id': session.id if session else False,
+            'funcion': funcion,
+            'argumentos': json.dumps(argumentos, ensure_ascii=False, default=str),
+            'contexto': json.dumps(contexto),
+            'formato': formato if formato in MIMETYPES else 'xlsx',
+        })
+        dbname = self.env.cr.dbname
+        self.env.cr.postcommit.add(lambda: _procesar_en_hilo(dbname, exportacion.id))
+        return exportacion
+
+    def url(self):
+        self.ensure_one()
+        base = self.env['ir.config_parameter'].sudo().get_param('web.base.url', '')
+        return f"{base}/chatbot/exportacion/{self.id}"
+
+    # ------------------------------------------------------------------
+    # Generacion
+    # ------------------------------------------------------------------
+
+    def _tomar(self):
+        """Marca la exportacion en proceso si nadie la esta procesando."""
+        self.env.cr.execute("""
+            UPDATE chatbot_ia2_exportacion
+               SET estado = 'en_proceso', inicio = %s
+             WHERE id = %s
+               AND (estado = 'pendiente' OR (estado = 'en_proceso' AND inicio < %s))
+         RETURNING id
+        """, [
+            fields.Datetime.now(), self.id,
+            fields.Datetime.now() - timedelta(minutes=MINUTOS_ABANDONADA),
+        ])
+        tomada = bool(self.env.cr.fetchone())
+        self.invalidate_cache()
+        self.env.cr.commit()
+        return tomada
+
+    def _procesar(self):
+        """Genera el archivo (corre como superusuario, lee como el solicitante)."""
+        self.ensure_one()
+        if not self.exists() or not self._tomar():
+            return
+        try:
+            filas, truncada, path = self._generar()
+            attachment = self._adjuntar(path)
+            self.write({
+                'estado': 'listo', 'filas': filas, 'truncada': truncada,
+                'attachment_id': attachment.id, 'error': False,
+            })
+            _logger.info("Exportacion %s lista: %d filas (%s)", self.id, filas, self.formato)
+        except Exception as e:
+            _logger.exception("Exportacion %s fallo", self.id)
+            self.env.cr.rollback()
+            self.write({'estado': 'error', 'error': str(e)})
+        self.env.cr.commit()
+
+    def _generar(self):
+        """Escribe el archivo recorriendo un cursor del servidor por lotes.
+
+        Retorna (filas, truncada, path del archivo temporal).
+        """
+        contexto = json.loads(self.contexto or '{}')
+        Kpi = self.env[EXPORTABLES[self.funcion]].with_user(self.user_id).with_context(**contexto)
+        columnas, sql, params = Kpi._sql_exportacion(**json.loads(self.argumentos or '{}'))
+
+        fd, path = tempfile.mkstemp(prefix='chatbot_exportacion_', suffix='.' + self.formato)
+        os.close(fd)
+        escritor = _EscritorXLSX(path) if self.formato == 'xlsx' else _EscritorCSV(path)
+        filas, truncada = 0, False
+        cr = self.env.cr
+        cursor_servidor = f'chatbot_exportacion_{self.id}'
+        try:
+            escritor.fila(columnas)
+            cr.execute(f'DECLARE {cursor_servidor} NO SCROLL CURSOR FOR {sql}', params)
+            while not truncada:
+                cr.execute(f'FETCH {FILAS_POR_LOTE} FROM {cursor_servidor}')
+                lote = cr.fetchall()
+                if not lote:
+                    break
+                for fila in lote:
+                    if self.formato == 'xlsx' and filas >= MAX_FILAS_XLSX:
+                        truncada = True
+                        break
+                    escritor.fila(fila)
+                    filas += 1
+            cr.execute(f'CLOSE {cursor_servidor}')
+        finally:
+            escritor.cerrar()
+        return filas, truncada, path
+
+    def _adjuntar(self, path):
+        """ir.attachment con el archivo generado.
+
+        Con el filestore en disco el archivo se mueve tal cual (sha1 calculado
+        por bloques), sin cargarlo entero en memoria.
+        """
+        Attachment = self.env['ir.attachment']
+        nombre = f"{self.funcion.replace('get_', '')}_{self.id}.{self.formato}"
+        vals = {
+            'name': nombre,
+            'res_model': self._name,
+            'res_id': self.id,
+            'mimetype': MIMETYPES[self.formato],
+            'type': 'binary',
+        }
+        try:
+            if Attachment._storage() != 'file':
+                with open(path, 'rb') as archivo:
+                    vals['datas'] = base64.b64encode(archivo.read())
+                return Attachment.create(vals)
+
+            sha1, tamano = hashlib.sha1(), 0
+            with open(path, 'rb') as archivo:
+                for bloque in iter(lambda: archivo.read(1 << 20), b''):
+                    sha1.update(bloque)
+                    tamano += len(bloque)
+            checksum = sha1.hexdigest()
+            store_fname = f'{checksum[:2]}/{checksum}'
+            destino = Attachment._full_path(store_fname)
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            if not os.path.exists(destino):
+                shutil.move(path, destino)
+            attachment = Attachment.create(dict(vals, store_fname=store_fname))
+            # create() recalcula tamano y checksum desde 'datas', que aca no se pasa
+            self.env.cr.execute(
+                "UPDATE ir_attachment SET file_size = %s, checksum = %s WHERE id = %s",
+                [tamano, checksum, attachment.id],
+            )
+            attachment.invalidate_cache(['file_size', 'checksum'])
+            return attachment
+        finally:
+            if os.path.exists(path):
+                os.unlink(path)
+
+    @api.model
+    def _cron_procesar(self):
+        """Red de seguridad: exportaciones que no arrancaron (reinicio del
+        worker, commit sin postcommit) o que quedaron abandonadas."""
+        pendientes = self.search([
+            '|', ('estado', '=', 'pendiente'),
+            '&', ('estado', '=', 'en_proceso'),
+            ('inicio', '<', fields.Datetime.now() - timedelta(minutes=MINUTOS_ABANDONADA)),
+        ], order='id')
+        for exportacion in pendientes:
+            exportacion._procesar()
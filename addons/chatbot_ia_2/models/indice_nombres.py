@@ -0,0 +1,116 @@
+from bisect import bisect_left
+from collections import defaultdict
+
+import numpy as np
+
+from .similitud import normalizar
+
+# Similitud de trigramas minima para sugerir un nombre que no matchea por prefijo
+SIMILITUD_MIN = 0.3
+# Trigramas mas frecuentes que esta fraccion del indice no aportan al ranking
+FRECUENCIA_MAX_TRIGRAMA = 0.1
+
+
+def _trigramas(tokens):
+    """Trigramas por palabra, con el mismo relleno que pg_trgm."""
+    trigramas = set()
+    for token in tokens:
+        relleno = '  %s ' % token
+        trigramas.update(relleno[i:i + 3] for i in range(len(relleno) - 2))
+    return trigramas
+
+
+class IndiceNombres:
+    """Indice en memoria de nombres, sin acentos ni mayusculas.
+
+    Busca primero por prefijos de palabra: todas las palabras de la consulta
+    tienen que ser prefijo de alguna palabra del nombre ("juan p" encuentra
+    "Juan Perez"), con bisect sobre la lista ordenada de palabras. Si faltan
+    resultados completa con similitud de trigramas para tolerar errores de
+    tipeo ("juan peres"). Los conteos y el ranking se hacen con NumPy.
+    """
+
+    def __init__(self, entradas):
+        """`entradas`: iterable de (id, nombre, company_id, peso)."""
+        ids, nombres, companias, pesos, largos, cantidades = [], [], [], [], [], []
+        palabras = []
+        postings = defaultdict(list)
+        for posicion, (id_, nombre, company_id, peso) in enumerate(entradas):
+            normalizado = normalizar(nombre)
+            tokens = normalizado.split()
+            trigramas = _trigramas(tokens)
+            ids.append(id_)
+            nombres.append(nombre)
+            companias.append(company_id or 0)
+            pesos.append(peso or 0)
+            largos.append(max(len(normalizado), 1))
+            cantidades.append(len(trigramas))
+            palabras.extend((token, posicion) for token in set(tokens))
+            for trigrama in trigramas:
+                postings[trigrama].append(posicion)
+        palabras.sort()
+
+        self.ids = ids
+        self.nombres = nombres
+        self.companias = np.array(companias, dtype=np.int64)
+        self.pesos = np.array(pesos, dtype=np.float64)
+        self._largos = np.array(largos, dtype=np.float64)
+        self._cantidad_trigramas = np.array(cantidades, dtype=np.float64)
+        self._palabras = [p[0] for p in palabras]
+        self._posiciones = np.array([p[1] for p in palabras], dtype=np.int32)
+        self._postings = {t: np.array(p, dtype=np.int32) for t, p in postings.items()}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _por_prefijo(self, tokens):
+        """(posiciones, scores) de los nombres con todas las palabras como prefijo."""
+        mascara = None
+        for token in set(tokens):
+            inicio = bisect_left(self._palabras, token)
+            fin = bisect_left(self._palabras, token + '\uffff')
+            coincide = np.zeros(len(self.ids), dtype=bool)
+            coincide[self._posiciones[inicio:fin]] = True
+            mascara = coincide if mascara is None else mascara & coincide
+        candidatos = np.flatnonzero(mascara)
+        # Mas alto cuanto mas del nombre cubre la consulta (2.0 = nombre completo)
+        cobertura = len(' '.join(tokens)) / self._largos[candidatos]
+        return candidatos, 1.0 + np.minimum(cobertura, 1.0)
+
+    def _por_trigramas(self, tokens):
+        """(posiciones, similitudes) de los nombres con trigramas en comun."""
+        trigramas = _trigramas(tokens)
+        frecuencia_max = max(FRECUENCIA_MAX_TRIGRAMA * len(self.ids), 1)
+        listas = [
+            self._postings[t] for t in trigramas
+            if t in self._postings and len(self._postings[t]) <= frecuencia_max
+        ]
+        if not listas:
+            return np.empty(0, dtype=np.int32), np.empty(0)
+        comunes = np.bincount(np.concatenate(listas), minlength=len(self.ids))
+        candidatos = np.flatnonzero(comunes)
+        compartidos = comunes[candidatos]
+        union = len(trigramas) + self._cantidad_trigramas[candidatos] - compartidos
+        similitud = compartidos / union
+        mascara = similitud >= SIMILITUD_MIN
+        return candidatos[mascara], similitud[mascara]
+
+    def buscar(self, texto, limite=10, companias=None):
+        """[(posicion, score)] de mejor a peor. Score >= 1 es match por prefijo.
+
+        Con `companias`, solo entradas de esas companias o sin compania.
+        """
+        tokens = normalizar(texto).split()
+        if not tokens or not self.ids:
+            return []
+        posiciones, scores = self._por_prefijo(tokens)
+        if len(posiciones) < limite:
+            extra, similitud = self._por_trigramas(tokens)
+            nuevas = ~np.isin(extra, posiciones)
+            posiciones = np.concatenate([posiciones, extra[nuevas]])
+            scores = np.concatenate([scores, similitud[nuevas]])
+        if companias is not None and len(posiciones):
+            mascara = np.isin(self.companias[posiciones], list(companias) + [0])
+            posiciones, scores = posiciones[mascara], scores[mascara]
+        orden = np.lexsort((-self.pesos[posiciones], -scores))[:limite]
+        return [(int(posiciones[i]), float(scores[i])) for i in orden]
@@ -1,3 +1,6 @@
 from . import ventas
 from . import facturacion
 from . import productos
+from . import contactos
+from . import stock
+from . import cruce
@@ -0,0 +1,169 @@
+import logging
+import threading
+
+from odoo import models, api
+
+from ..indice_nombres import IndiceNombres
+
+_logger = logging.getLogger(__name__)
+
+# Secuencia que se incrementa al confirmar cambios de nombres: los workers
+# comparan su valor con el de su indice para saber si tienen que rehacerlo
+SECUENCIA_VERSION = 'chatbot2_contactos_version_seq'
+
+# Indices por base y tipo: {(dbname, tipo): (version, IndiceNombres)}
+_INDICES = {}
+_INDICES_LOCK = threading.Lock()
+
+# Campos cuyo cambio modifica lo que guardan los indices
+CAMPOS_CONTACTO = {
+    'name', 'display_name', 'parent_id', 'is_company', 'active', 'company_id',
+    'customer_rank', 'type',
+}
+CAMPOS_USUARIO = {'name', 'active', 'share', 'groups_id', 'partner_id'}
+
+# tipo -> (modelo, SQL de (id, nombre, company_id, peso))
+FUENTES = {
+    'contactos': ('res.partner', """
+        SELECT id, display_name, company_id, COALESCE(customer_rank, 0)
+          FROM res_partner
+         WHERE active AND display_name IS NOT NULL
+    """),
+    'vendedores': ('res.users', """
+        SELECT u.id, p.name, NULL, 0
+          FROM res_users u
+          JOIN res_partner p ON p.id = u.partner_id
+         WHERE u.active AND NOT u.share
+    """),
+}
+
+
+class KPIContactos(models.AbstractModel):
+    _name = 'chatbot2.kpi.contactos'
+    _description = 'Resolucion de nombres de contactos y vendedores para Chatbot v2'
+
+    def init(self):
+        self.env.cr.execute(f"CREATE SEQUENCE IF NOT EXISTS {SECUENCIA_VERSION}")
+
+    @api.model
+    def _invalidar_indices(self):
+        """Marca los indices de todos los workers como viejos al confirmar la
+        transaccion (antes del commit otro worker leeria los datos anteriores)."""
+        datos = self.env.cr.postcommit.data
+        if datos.get(SECUENCIA_VERSION):
+            return
+        datos[SECUENCIA_VERSION] = True
+        cr = self.env.cr
+        cr.postcommit.add(lambda: cr.execute(f"SELECT nextval('{SECUENCIA_VERSION}')"))
+
+    def _indice(self, tipo):
+        """Indice del worker para `tipo`, reconstruido si cambiaron los nombres."""
+        # El primer nextval deja last_value igual y solo cambia is_called
+        self.env.cr.execute(f"SELECT last_value, is_called FROM {SECUENCIA_VERSION}")
+        version = self.env.cr.fetchone()
+        clave = (self.env.cr.dbname, tipo)
+        with _INDICES_LOCK:
+            cache = _INDICES.get(clave)
+            if cache and cache[0] == version:
+                return cache[1]
+        modelo, consulta = FUENTES[tipo]
+        self.env[modelo].flush()
+        self.env.cr.execute(consulta)
+        indice = IndiceNombres(self.env.cr.fetchall())
+        with _INDICES_LOCK:
+            _INDICES[clave] = (version, indice)
+        _logger.info("Indice de %s del chatbot reconstruido: %d nombres", tipo, len(indice))
+        return indice
+
+    def _buscar(self, tipo, nombre, limite):
+        modelo, _consulta = FUENTES[tipo]
+        Modelo = self.env[modelo]
+        Modelo.check_access_rights('read')
+        limite = max(1, min(int(limite or 10), 20))
+        indice = self._indice(tipo)
+        companias = self.env.companies.ids if tipo == 'contactos' else None
+        # Se piden candidatos de mas por si las reglas de acceso descartan algunos
+        candidatos = indice.buscar(nombre or '', limite * 3, companias=companias)
+        ids = [indice.ids[posicion] for posicion, _score in candidatos]
+        visibles = set(Modelo.search([('id', 'in', ids)]).ids)
+        data = []
+        for posicion, score in candidatos:
+            if indice.ids[posicion] not in visibles:
+                continue
+            data.append({
+                'id': indice.ids[posicion],
+                'nombre': indice.nombres[posicion],
+                'score': round(score, 2),
+                'coincidencia': 'prefijo' if score >= 1 else 'aproximada',
+            })
+            if len(data) == limite:
+                break
+        return data
+
+    @api.model
+    def buscar_contactos(self, nombre, limite=10):
+        """Clientes/proveedores cuyo nombre coincide, para obtener cliente_ids."""
+        data = self._buscar('contactos', nombre, limite)
+        if not data:
+            return {'ids': [], 'data': [],
+                    'mensaje': f"No se encontraron contactos parecidos a '{nombre}'"}
+        return {
+            'ids': [d['id'] for d in data],
+            'data': data,
+            'mensaje': (
+                f"Se encontraron {len(data)} contactos para '{nombre}' (mejor coincidencia "
+                f"primero). Usa sus IDs como cliente_ids en get_ventas o get_facturas."
+            ),
+        }
+
+    @api.model
+    def buscar_vendedores(self, nombre, limite=10):
+        """Usuarios internos cuyo nombre coincide, para obtener vendedor_ids."""
+        data = self._buscar('vendedores', nombre, limite)
+        if not data:
+            return {'ids': [], 'data': [],
+                    'mensaje': f"No se encontraron vendedores parecidos a '{nombre}'"}
+        return {
+            'ids': [d['id'] for d in data],
+            'data': data,
+            'mensaje': (
+                f"Se encontraron {len(data)} vendedores para '{nombre}' (mejor coincidencia "
+                f"primero). Usa sus IDs como vendedor_ids en get_ventas."
+            ),
+        }
+
+
+class ResPartner(models.Model):
+    _inherit = 'res.partner'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        self.env['chatbot2.kpi.contactos']._invalidar_indices()
+        return super().create(vals_list)
+
+    def write(self, vals):
+        if CAMPOS_CONTACTO.intersection(vals):
+            self.env['chatbot2.kpi.contactos']._invalidar_indices()
+        return super().write(vals)
+
+    def unlink(self):
+        self.env['chatbot2.kpi.contactos']._invalidar_indices()
+        return super().unlink()
+
+
+class ResUsers(models.Model):
+    _inherit = 'res.users'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        self.env['chatbot2.kpi.contactos']._invalidar_indices()
+        return super().create(vals_list)
+
+    def write(self, vals):
+        if CAMPOS_USUARIO.intersection(vals):
+            self.env['chatbot2.kpi.contactos']._invalidar_indices()
+        return super().write(vals)
+
+    def unlink(self):
+        self.env['chatbot2.kpi.contactos']._invalidar_indices()
+        return super().unlink()
@@ -0,0 +1,163 @@
+from odoo import models
+from .helpers import date_range_from_periodo, limitar, sql_desde_domain
+
+
+# Fuente de lineas -> como se leen de la base. Los filtros de estado van como
+# domain (con reglas de acceso sobre las lineas); el resto son expresiones SQL
+# sobre la linea y su documento (alias d)
+FUENTES_CRUCE = {
+    'ventas': {
+        'modelo': 'sale.order.line',
+        'domain': [('state', 'in', ['sale', 'done'])],
+        'join': 'JOIN sale_order d ON d.id = "sale_order_line".order_id',
+        'condicion': '',
+        'fecha': 'd.date_order',
+        'vendedor': 'd.user_id',
+        'cliente': 'd.partner_id',
+        'monto': '"sale_order_line".price_total',
+        'cantidad': '"sale_order_line".product_uom_qty',
+        'documento': 'd.id',
+        'label': 'ventas',
+    },
+    'facturas': {
+        'modelo': 'account.move.line',
+        'domain': [('parent_state', '=', 'posted'), ('exclude_from_invoice_tab', '=', False)],
+        'join': 'JOIN account_move d ON d.id = "account_move_line".move_id',
+        'condicion': "AND d.move_type IN ('out_invoice', 'out_refund')",
+        'fecha': 'd.invoice_date',
+        'vendedor': 'd.invoice_user_id',
+        'cliente': 'd.partner_id',
+        # Las notas de credito restan
+        'monto': ('"account_move_line".price_total'
+                  ' * CASE WHEN d.move_type = \'out_refund\' THEN -1 ELSE 1 END'),
+        'cantidad': ('"account_move_line".quantity'
+                     ' * CASE WHEN d.move_type = \'out_refund\' THEN -1 ELSE 1 END'),
+        'documento': 'd.id',
+        'label': 'facturacion',
+    },
+}
+
+# agrupar_por -> (expresion del id, expresion del nombre); {fecha} es la fecha
+# del documento de la fuente
+AGRUPAR_CRUCE = {
+    'producto': ('pp_c.id', 'pt_c.name'),
+    'categoria': ('pc_c.id', 'pc_c.complete_name'),
+    'vendedor': ('v_c.id', 'vp_c.name'),
+    'cliente': ('cp_c.id', 'cp_c.name'),
+    'mes': (
+        "date_trunc('month', {fecha})::date",
+        "to_char(date_trunc('month', {fecha}), 'YYYY-MM')",
+    ),
+}
+
+ORDEN_CRUCE = {
+    'monto_desc': '3 DESC NULLS LAST',
+    'monto_asc': '3 ASC NULLS LAST',
+    'cantidad_desc': '4 DESC NULLS LAST',
+    'cronologico': '1 ASC',
+}
+
+CRUCE_SQL = """
+    SELECT {clave}, {nombre}, SUM({monto}), SUM({cantidad}), COUNT(DISTINCT {documento}),
+           COUNT(*) OVER (), SUM(SUM({monto})) OVER ()
+      FROM {from_clause}
+      {join}
+      JOIN product_product pp_c ON pp_c.id = "{tabla}".product_id
+      JOIN product_template pt_c ON pt_c.id = pp_c.product_tmpl_id
+      LEFT JOIN product_category pc_c ON pc_c.id = pt_c.categ_id
+      LEFT JOIN res_partner cp_c ON cp_c.id = {cliente}
+      LEFT JOIN res_users v_c ON v_c.id = {vendedor}
+      LEFT JOIN res_partner vp_c ON vp_c.id = v_c.partner_id
+     WHERE {where_clause} {condicion}
+       AND {fecha} >= %s AND {fecha} < %s
+       {filtros}
+     GROUP BY 1, 2
+     ORDER BY {orden}, 1
+     LIMIT %s
+"""
+
+
+class KPICruce(models.AbstractModel):
+    _name = 'chatbot2.kpi.cruce'
+    _description = 'KPI de productos cruzados con ventas o facturacion para Chatbot v2'
+
+    def get_cruce(self, fuente='ventas', productos=None, periodo='mes_actual',
+                  vendedor_ids=None, cliente_ids=None, agrupar_por='producto',
+                  orden=None, limite=20):
+        """Ventas o facturacion de los productos que cumplen `productos`
+        (mismos filtros que get_productos), agrupadas, en una sola consulta.
+
+        Reemplaza la cadena get_productos -> get_ventas(producto_ids): el filtro
+        de productos se resuelve como subconsulta dentro del mismo statement.
+        """
+        config = FUENTES_CRUCE.get(fuente, FUENTES_CRUCE['ventas'])
+        agrupar_por = agrupar_por if agrupar_por in AGRUPAR_CRUCE else 'producto'
+        orden = orden if orden in ORDEN_CRUCE else (
+            'cronologico' if agrupar_por == 'mes' else 'monto_desc'
+        )
+        limite = limitar(limite)
+        start, end = date_range_from_periodo(self, periodo)
+
+        Lineas = self.env[config['modelo']]
+        from_clause, where_clause, params = sql_desde_domain(Lineas, config['domain'])
+        filtros, params_filtros = '', []
+        if productos:
+            # Tambien productos archivados o que ya no se venden: lo historico
+            # tiene que sumar completo
+            domain_productos = self.env['chatbot2.kpi.productos']._build_domain(
+                productos, historico=True,
+            )
+            from_p, where_p, params_p = sql_desde_domain(
+                self.env['product.product'].with_context(active_test=False), domain_productos,
+            )
+            filtros += (f' AND "{Lineas._table}".product_id IN'
+                        f' (SELECT "product_product".id FROM {from_p} WHERE {where_p})')
+            params_filtros += params_p
+        if vendedor_ids:
+            filtros += f" AND {config['vendedor']} = ANY(%s)"
+            params_filtros.append(list(vendedor_ids))
+        if cliente_ids:
+            filtros += f" AND {config['cliente']} = ANY(%s)"
+            params_filtros.append(list(cliente_ids))
+
+        clave, nombre = (
+            expr.format(fecha=config['fecha']) for expr in AGRUPAR_CRUCE[agrupar_por]
+        )
+        sql = CRUCE_SQL.format(
+            clave=clave, nombre=nombre, tabla=Lineas._table, from_clause=from_clause,
+            where_clause=where_clause, filtros=filtros, orden=ORDEN_CRUCE[orden],
+            **{k: v for k, v in config.items() if k not in ('modelo', 'domain', 'label')},
+        )
+        self.env.cr.execute(sql, params + [start, end] + params_filtros + [limite])
+        filas = self.env.cr.fetchall()
+        grupos = filas[0][5] if filas else 0
+        total_periodo = float(filas[0][6] or 0.0) if filas else 0.0
+
+        data = [{
+            'id': f[0] if agrupar_por != 'mes' else None,
+            'nombre': f[1] or 'Sin asignar',
+            'monto': float(f[2] or 0.0),
+            'cantidad': float(f[3] or 0.0),
+            'documentos': f[4],
+        } for f in filas]
+        total_monto = sum(d['monto'] for d in data)
+        resultado = {
+            'fuente': fuente if fuente in FUENTES_CRUCE else 'ventas',
+            'agrupado_por': agrupar_por,
+            'periodo': periodo,
+            'ids': [d['id'] for d in data if d['id']],
+            'data': data,
+            'total_monto': total_monto,
+            'total_periodo': total_periodo,
+            'count': len(data),
+            'mensaje': (
+                f"{config['label'].capitalize()} de los productos filtrados ({periodo}) por "
+                f"{agrupar_por}: {grupos} grupos, total ${total_periodo:,.2f}"
+            ),
+        }
+        if grupos > len(data):
+            resultado['mensaje'] += (
+                f"; se muestran {len(data)} (${total_monto:,.2f}). Subi 'limite' o acota "
+                f"los filtros para ver el resto."
+            )
+        return resultado
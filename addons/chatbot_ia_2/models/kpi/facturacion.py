@@ -1,6 +1,15 @@
 from odoo import models
 from dateutil.relativedelta import relativedelta
-from .helpers import today, UMBRAL_REGISTROS
+from .helpers import (
+    today, limitar, firma_consulta, buscar_pagina, resumen_sql, sql_desde_domain,
+    m2o_id, m2o_nombre, UMBRAL_REGISTROS, estimar_volumen, texto_cantidad,
+)
+
+# Columnas que se leen de account.move (no se cargan los demas campos)
+CAMPOS_FACTURA = [
+    'name', 'partner_id', 'amount_total', 'amount_residual',
+    'invoice_date_due', 'payment_state',
+]
 
 
 class KPIFacturacion2(models.AbstractModel):
@@ -39,58 +48,124 @@ class KPIFacturacion2(models.AbstractModel):
         return domain
 
     def get_facturas(self, tipo='cliente', estado='pendiente',
-                     dias_vencimiento=None, cliente_ids=None, limite=20):
+                     dias_vencimiento=None, cliente_ids=None, limite=20, cursor=None,
+                     resumen=False):
         domain = self._build_domain(tipo, estado, dias_vencimiento, cliente_ids)
+        limite = limitar(limite)
+        tipo_label = 'cliente' if tipo == 'cliente' else 'proveedor'
 
-        # Pre-check de volumen con el mismo domain
-        count = self.env['account.move'].search_count(domain)
-        if count > UMBRAL_REGISTROS:
-            tipo_label = 'cliente' if tipo == 'cliente' else 'proveedor'
-            return {
-                'advertencia': True,
-                'cantidad': count,
-                'filtros_actuales': {
-                    'tipo': tipo,
-                    'estado': estado,
-                    'dias_vencimiento': dias_vencimiento,
-                    'cliente_ids': cliente_ids,
-                },
-                'mensaje': (
-                    f"Hay {count} facturas de {tipo_label} con estado '{estado}'. "
-                    f"Pedile al usuario que acote la busqueda por estado "
-                    f"(pendiente, vencido, pagado), cliente, o dias de vencimiento."
-                ),
-            }
+        if resumen:
+            return self._get_facturas_resumen(domain, tipo, estado, tipo_label)
+        firma = firma_consulta('facturas', tipo, estado, dias_vencimiento, cliente_ids)
+
+        # Pre-check de volumen con el mismo domain (solo en la primera pagina)
+        count, aproximada = 0, False
+        if not cursor:
+            count, aproximada = estimar_volumen(self.env['account.move'], domain)
 
-        facturas = self.env['account.move'].search(
-            domain, limit=limite, order='invoice_date_due asc'
+        facturas, cursor_siguiente = buscar_pagina(
+            self.env['account.move'], domain, 'invoice_date_due', 'asc',
+            limite, CAMPOS_FACTURA, cursor=cursor, firma=firma,
         )
 
         data = []
         for f in facturas:
             data.append({
-                'id': f.id,
-                'numero': f.name,
-                'cliente': f.partner_id.name,
-                'cliente_id': f.partner_id.id,
-                'monto_total': float(f.amount_total),
-                'monto_pendiente': float(f.amount_residual),
-                'fecha_vencimiento': str(f.invoice_date_due) if f.invoice_date_due else '',
-                'estado_pago': f.payment_state,
+                'id': f['id'],
+                'numero': f['name'],
+                'cliente': m2o_nombre(f['partner_id']),
+                'cliente_id': m2o_id(f['partner_id']),
+                'monto_total': float(f['amount_total']),
+                'monto_pendiente': float(f['amount_residual']),
+                'fecha_vencimiento': str(f['invoice_date_due']) if f['invoice_date_due'] else '',
+                'estado_pago': f['payment_state'],
             })
 
         total_pendiente = sum(d['monto_pendiente'] for d in data)
-        tipo_label = 'cliente' if tipo == 'cliente' else 'proveedor'
 
-        return {
+        resultado = {
             'ids': [d['id'] for d in data],
             'data': data,
             'total_pendiente': total_pendiente,
             'count': len(data),
             'tipo': tipo,
             'estado': estado,
+            'cursor_siguiente': cursor_siguiente,
             'mensaje': (
                 f"Se encontraron {len(data)} facturas de {tipo_label} "
                 f"({estado}) por un total pendiente de ${total_pendiente:,.2f}"
             ),
         }
+        if count > UMBRAL_REGISTROS:
+            resultado.update({
+                'advertencia': True,
+                'cantidad': count,
+                'cantidad_aproximada': aproximada,
+                'filtros_actuales': {
+                    'tipo': tipo,
+                    'estado': estado,
+                    'dias_vencimiento': dias_vencimiento,
+                    'cliente_ids': cliente_ids,
+                },
+                'mensaje': (
+                    f"Hay {texto_cantidad(count, aproximada)} facturas de {tipo_label} "
+                    f"con estado '{estado}'; "
+                    f"se muestran las primeras {len(data)} "
+                    f"(total pendiente de esta pagina ${total_pendiente:,.2f}). "
+                    f"Para la pagina siguiente llama de nuevo con el mismo filtro y "
+                    f"cursor='cursor_siguiente', pedi resumen=true para estadisticas del total, "
+                    f"o pedile al usuario que acote la busqueda "
+                    f"por estado (pendiente, vencido, pagado), cliente, o dias de vencimiento."
+                ),
+            })
+        elif cursor_siguiente:
+            resultado['mensaje'] += ". Hay mas resultados: usa 'cursor_siguiente' para verlos."
+        return resultado
+
+    def _get_facturas_resumen(self, domain, tipo, estado, tipo_label):
+        """Estadisticas de todas las facturas del domain, calculadas en PostgreSQL."""
+        # Para deudas interesa lo pendiente; para pagadas/todas, el total facturado
+        campo_monto = 'amount_residual' if estado in ('pendiente', 'vencido') else 'amount_total'
+        stats = resumen_sql(
+            self.env['account.move'], domain,
+            monto=f'"account_move".{campo_monto}',
+            nombre='"account_move".name',
+            grupo='"account_move".partner_id',
+            tabla_grupo='res_partner',
+        )
+        top = stats.pop('top_por_monto')
+        stats['top_por_cliente'] = stats.pop('top_por_grupo')
+        p50 = stats['percentiles']['p50'] or 0.0
+        return dict(stats, **{
+            'resumen': True,
+            'ids': [d['id'] for d in top],
+            'data': top,
+            'campo_monto': 'monto_pendiente' if campo_monto == 'amount_residual' else 'monto_total',
+            'tipo': tipo,
+            'estado': estado,
+            'mensaje': (
+                f"Resumen de {stats['cantidad']} facturas de {tipo_label} ({estado}): "
+                f"total ${stats['suma']:,.2f}, mediana ${p50:,.2f}, "
+                f"maximo ${stats['maximo'] or 0.0:,.2f}"
+            ),
+        })
+
+    def _sql_exportacion(self, tipo='cliente', estado='pendiente', dias_vencimiento=None,
+                         cliente_ids=None, **_otros):
+        """(columnas, sql, params) de todas las facturas que filtra get_facturas."""
+        domain = self._build_domain(tipo, estado, dias_vencimiento, cliente_ids)
+        from_clause, where_clause, params = sql_desde_domain(self.env['account.move'], domain)
+        sql = f"""
+            SELECT "account_move".name, p_exp.name, "account_move".invoice_date,
+                   "account_move".invoice_date_due, "account_move".amount_total,
+                   "account_move".amount_residual, "account_move".payment_state
+              FROM {from_clause}
+              LEFT JOIN res_partner p_exp ON p_exp.id = "account_move".partner_id
+             WHERE {where_clause}
+             ORDER BY "account_move".invoice_date_due, "account_move".id
+        """
+        columnas = [
+            'Numero', 'Cliente' if tipo == 'cliente' else 'Proveedor', 'Fecha',
+            'Vencimiento', 'Total', 'Pendiente', 'Estado de pago',
+        ]
+        return columnas, sql, params
@@ -1,8 +1,15 @@
+import base64
+import hashlib
+import json
+
 from odoo import fields
 from dateutil.relativedelta import relativedelta
 
 # Umbral maximo de registros antes de pedir al usuario que acote la consulta
 UMBRAL_REGISTROS = 50
+# Hasta cuantos registros se cuentan exactamente al superar el umbral; por
+# encima se informa la estimacion del planner de PostgreSQL
+CONTEO_EXACTO_MAX = 1000
 
 
 def month_range(record):
@@ -54,3 +61,223 @@ def date_range_from_periodo(record, periodo):
 def today(record):
     """Retorna la fecha de hoy respetando timezone del usuario"""
     return fields.Date.context_today(record)
+
+
+# ---------------------------------------------------------------------------
+# Paginacion por keyset (seek) con cursores de continuacion
+# ---------------------------------------------------------------------------
+
+def limitar(limite, default=20):
+    """Normaliza el limite pedido por la IA a [1, UMBRAL_REGISTROS]"""
+    try:
+        limite = int(limite or default)
+    except (TypeError, ValueError):
+        limite = default
+    return max(1, min(limite, UMBRAL_REGISTROS))
+
+
+def firma_consulta(*partes):
+    """Hash corto de los parametros de una consulta, para atarle el cursor"""
+    raw = json.dumps(partes, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode()).hexdigest()[:12]
+
+
+def encode_cursor(firma, valor, last_id):
+    """Arma el token opaco con la posicion (valor, id) del ultimo registro"""
+    payload = json.dumps({'f': firma, 'v': valor, 'id': last_id}, default=str)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, firma):
+    """Retorna (valor, id) del token. ValueError si es invalido o de otra consulta."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        pos = data['v'], int(data['id'])
+    except (ValueError, TypeError, KeyError, AttributeError):
+        raise ValueError("Cursor invalido")
+    if data.get('f') != firma:
+        raise ValueError(
+            "El cursor no corresponde a estos filtros. "
+            "Repeti la consulta sin cursor para empezar de nuevo."
+        )
+    return pos
+
+
+def keyset_domain(campo, direccion, valor, last_id):
+    """Domain de los registros posteriores a (valor, last_id) en el orden
+    '<campo> <direccion>, id <direccion>'.
+
+    PostgreSQL ubica los NULL al final en ASC y al principio en DESC.
+    """
+    op = '>' if direccion == 'asc' else '<'
+    if valor is None or valor is False:
+        if direccion == 'asc':
+            return [(campo, '=', False), ('id', op, last_id)]
+        return ['|', (campo, '!=', False), '&', (campo, '=', False), ('id', op, last_id)]
+    siguiente = ['|', (campo, op, valor), '&', (campo, '=', valor), ('id', op, last_id)]
+    if direccion == 'asc':
+        return ['|', (campo, '=', False)] + siguiente
+    return siguiente
+
+
+def buscar_pagina(model, domain, campo, direccion, limite, campos, cursor=None, firma=''):
+    """Busca una pagina ordenada por (campo, id) usando keyset pagination.
+
+    Cada pagina es un unico seek sobre el indice del orden, sin OFFSET ni
+    recuento, y lee solo `campos` (search_read: los many2one vienen como
+    (id, nombre) resueltos en bloque). Retorna (filas, cursor_siguiente);
+    cursor_siguiente es None cuando no quedan mas resultados.
+    """
+    if cursor:
+        domain = domain + keyset_domain(campo, direccion, *decode_cursor(cursor, firma))
+    order = '%s %s, id %s' % (campo, direccion, direccion)
+    campos = list(campos) if campo in campos else list(campos) + [campo]
+    filas = model.search_read(domain, campos, limit=limite + 1, order=order)
+    cursor_siguiente = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        cursor_siguiente = encode_cursor(firma, filas[-1][campo], filas[-1]['id'])
+    return filas, cursor_siguiente
+
+
+def m2o_id(valor):
+    """Id de un many2one leido con search_read ((id, nombre) o False)"""
+    return valor[0] if valor else None
+
+
+def m2o_nombre(valor):
+    """Nombre de un many2one leido con search_read ((id, nombre) o False)"""
+    return valor[1] if valor else ''
+
+
+# ---------------------------------------------------------------------------
+# SQL propio a partir de un domain
+# ---------------------------------------------------------------------------
+
+def sql_desde_domain(model, domain):
+    """Traduce un domain a (from_clause, where_clause, params) con las reglas
+    de acceso del usuario ya aplicadas, para armar SQL propio sobre el modelo.
+    """
+    model.check_access_rights('read')
+    query = model._where_calc(domain)
+    model._apply_ir_rules(query, 'read')
+    from_clause, where_clause, params = query.get_sql()
+    return from_clause, where_clause or 'TRUE', params
+
+
+def estimar_volumen(model, domain):
+    """Cantidad de registros del domain para el control de volumen.
+
+    Retorna (cantidad, aproximada). Un sondeo con LIMIT UMBRAL+1 decide si se
+    supera el umbral; recien entonces se cuenta hasta CONTEO_EXACTO_MAX y, si
+    hay mas, se usa la estimacion de filas del planner (EXPLAIN) sin recorrer
+    la tabla.
+    """
+    from_clause, where_clause, params = sql_desde_domain(model, domain)
+    cr = model.env.cr
+    consulta = f'SELECT 1 FROM {from_clause} WHERE {where_clause}'
+    conteo_acotado = f'SELECT COUNT(*) FROM ({consulta} LIMIT %s) acotado'
+
+    cr.execute(conteo_acotado, params + [UMBRAL_REGISTROS + 1])
+    cantidad = cr.fetchone()[0]
+    if cantidad <= UMBRAL_REGISTROS:
+        return cantidad, False
+
+    cr.execute(conteo_acotado, params + [CONTEO_EXACTO_MAX + 1])
+    cantidad = cr.fetchone()[0]
+    if cantidad <= CONTEO_EXACTO_MAX:
+        return cantidad, False
+
+    cr.execute(f'EXPLAIN (FORMAT JSON) {consulta}', params)
+    plan = cr.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    estimacion = int(plan[0]['Plan']['Plan Rows'])
+    return max(estimacion, CONTEO_EXACTO_MAX + 1), True
+
+
+def texto_cantidad(cantidad, aproximada):
+    """'1234' o 'aproximadamente 1234' segun sea un conteo exacto o estimado"""
+    return f"aproximadamente {cantidad}" if aproximada else str(cantidad)
+
+
+PERCENTILES = (0.25, 0.5, 0.75, 0.9)
+
+
+def resumen_sql(model, domain, monto, nombre, grupo, tabla_grupo,
+                joins='', top_n=5):
+    """Resumen estadistico de un domain calculado en una sola consulta.
+
+    monto, nombre y grupo son expresiones SQL sobre las tablas del domain
+    (mas los joins extra). grupo es un id de tabla_grupo, de la que se toma
+    el nombre para el top por grupo. Retorna un dict con cantidad, suma,
+    minimo, maximo, promedio, percentiles, top_por_monto y top_por_grupo.
+    """
+    from_clause, where_clause, params = sql_desde_domain(model, domain)
+    tabla = model._table
+    base = f"""
+        SELECT "{tabla}".id AS id, {nombre} AS nombre,
+               {monto} AS monto, {grupo} AS grupo_id
+          FROM {from_clause} {joins}
+         WHERE {where_clause}
+    """
+    return resumen_base(model.env, base, params, tabla_grupo, top_n=top_n)
+
+
+def resumen_base(env, base, params, tabla_grupo, top_n=5):
+    """Resumen estadistico (ver resumen_sql) de las filas de una consulta
+    `base` con columnas id, nombre, monto y grupo_id."""
+    query = f"""
+        WITH base AS ({base}), stats AS (
+            SELECT COUNT(*) AS cantidad,
+                   COALESCE(SUM(monto), 0) AS suma,
+                   MIN(monto) AS minimo,
+                   MAX(monto) AS maximo,
+                   AVG(monto) AS promedio,
+                   percentile_cont(%s::float8[]) WITHIN GROUP (ORDER BY monto) AS percentiles
+              FROM base
+        ), top_monto AS (
+            SELECT id, nombre, monto FROM base
+             ORDER BY monto DESC NULLS LAST, id
+             LIMIT %s
+        ), top_grupo AS (
+            SELECT grupo_id, SUM(monto) AS monto, COUNT(*) AS cantidad FROM base
+             WHERE grupo_id IS NOT NULL
+             GROUP BY grupo_id
+             ORDER BY 2 DESC NULLS LAST, grupo_id
+             LIMIT %s
+        )
+        SELECT s.cantidad, s.suma, s.minimo, s.maximo, s.promedio, s.percentiles,
+               (SELECT COALESCE(json_agg(json_build_array(id, nombre, monto)
+                                         ORDER BY monto DESC NULLS LAST, id), '[]')
+                  FROM top_monto),
+               (SELECT COALESCE(json_agg(json_build_array(t.grupo_id, g.name, t.monto, t.cantidad)
+                                         ORDER BY t.monto DESC NULLS LAST, t.grupo_id), '[]')
+                  FROM top_grupo t JOIN {tabla_grupo} g ON g.id = t.grupo_id)
+          FROM stats s
+    """
+    env.cr.execute(query, params + [list(PERCENTILES), top_n, top_n])
+    cantidad, suma, minimo, maximo, promedio, percentiles, top_monto, top_grupo = \
+        env.cr.fetchone()
+
+    def _f(valor):
+        return float(valor) if valor is not None else None
+
+    return {
+        'cantidad': cantidad,
+        'suma': float(suma),
+        'minimo': _f(minimo),
+        'maximo': _f(maximo),
+        'promedio': _f(promedio),
+        'percentiles': {
+            f"p{int(p * 100)}": _f(v)
+            for p, v in zip(PERCENTILES, percentiles or [None] * len(PERCENTILES))
+        },
+        'top_por_monto': [
+            {'id': i, 'nombre': n, 'monto': _f(m)} for i, n, m in top_monto
+        ],
+        'top_por_grupo': [
+            {'id': i, 'nombre': n, 'monto': _f(m), 'cantidad': c} for i, n, m, c in top_grupo
+        ],
+    }
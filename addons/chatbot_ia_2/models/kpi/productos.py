@@ -1,70 +1,363 @@
+import logging
+
+import psycopg2
+
 from odoo import models
-from .helpers import UMBRAL_REGISTROS
+from odoo.tools.sql import escape_psql
+from .helpers import (
+    limitar, firma_consulta, buscar_pagina, resumen_sql, sql_desde_domain,
+    encode_cursor, decode_cursor, m2o_nombre, UMBRAL_REGISTROS,
+    estimar_volumen, texto_cantidad,
+)
+
+
+_logger = logging.getLogger(__name__)
+
+# Cache por base de datos: si la extension pg_trgm esta instalada
+_TRGM_DISPONIBLE = {}
 
+# Cantidad de candidatos que se rankean por similitud de nombre
+CANDIDATOS_RELEVANCIA = 200
 
+# Columnas que se leen de product.product (no se cargan los demas campos)
+CAMPOS_PRODUCTO = ['name', 'list_price', 'categ_id']
+
+# (campo, direccion) para la paginacion keyset
 ORDEN_MAP = {
-    'precio_asc': 'list_price asc',
-    'precio_desc': 'list_price desc',
-    'nombre_asc': 'name asc',
-    'nombre_desc': 'name desc',
-    'stock_asc': 'qty_available asc',
-    'stock_desc': 'qty_available desc',
+    'precio_asc': ('list_price', 'asc'),
+    'precio_desc': ('list_price', 'desc'),
+    'nombre_asc': ('name', 'asc'),
+    'nombre_desc': ('name', 'desc'),
+    'stock_asc': ('stock', 'asc'),
+    'stock_desc': ('stock', 'desc'),
 }
 
+# Stock disponible por producto: un unico agregado sobre stock.quant en
+# ubicaciones internas de las companias activas (en vez de qty_available,
+# que se calcula producto por producto)
+STOCK_QUANT_SQL = """
+    SELECT q.product_id, SUM(q.quantity) AS qty
+      FROM stock_quant q
+      JOIN stock_location l ON l.id = q.location_id
+     WHERE l.usage = 'internal' AND q.company_id = ANY(%s) {filtro}
+     GROUP BY q.product_id
+"""
+
+# Productos cuyo stock cumple una condicion ({op} %s), para filtros
+# 'id inselect': la subconsulta tiene que devolver una sola columna
+STOCK_FILTRO_SQL = """
+    SELECT q.product_id
+      FROM stock_quant q
+      JOIN stock_location l ON l.id = q.location_id
+     WHERE l.usage = 'internal' AND q.company_id = ANY(%s)
+     GROUP BY q.product_id
+    HAVING SUM(q.quantity) {op} %s
+"""
+
 
 class KPIProductos(models.AbstractModel):
     _name = 'chatbot2.kpi.productos'
     _description = 'KPI Productos para Chatbot v2'
 
-    def _build_domain(self, filtros):
-        """Construye el domain para productos."""
-        domain = [('sale_ok', '=', True)]
+    def init(self):
+        """Indices trigram para buscar productos y categorias por nombre con
+        tolerancia a errores de tipeo (requiere la extension pg_trgm)."""
+        cr = self.env.cr
+        try:
+            with cr.savepoint():
+                cr.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        except psycopg2.Error:
+            _logger.warning(
+                "No se pudo activar pg_trgm: la busqueda de productos por nombre "
+                "usara ILIKE sin tolerancia a errores de tipeo."
+            )
+            return
+        cr.execute("""
+            CREATE INDEX IF NOT EXISTS chatbot2_product_template_name_trgm
+                ON product_template USING gin (name gin_trgm_ops)
+        """)
+        cr.execute("""
+            CREATE INDEX IF NOT EXISTS chatbot2_product_category_name_trgm
+                ON product_category USING gin (name gin_trgm_ops)
+        """)
+        cr.execute("""
+            CREATE INDEX IF NOT EXISTS chatbot2_ir_translation_product_name_trgm
+                ON ir_translation USING gin (value gin_trgm_ops)
+             WHERE name = 'product.template,name' AND type = 'model'
+        """)
+        _TRGM_DISPONIBLE.pop(cr.dbname, None)
+
+    def _trgm_disponible(self):
+        dbname = self.env.cr.dbname
+        if dbname not in _TRGM_DISPONIBLE:
+            self.env.cr.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _TRGM_DISPONIBLE[dbname] = bool(self.env.cr.fetchone())
+        return _TRGM_DISPONIBLE[dbname]
+
+    def _sql_similares(self, tabla, texto, traduccion=None, con_score=False):
+        """SQL y params de los ids de `tabla` cuyo nombre se parece a `texto`.
+
+        Usa word_similarity (operador <%) respaldado por el indice trigram, mas
+        ILIKE para coincidencias exactas parciales. Si `traduccion` es el nombre
+        del campo traducible ('modelo,campo'), busca tambien en el idioma del
+        usuario. Con con_score=True retorna (id, score) en vez de solo id.
+        """
+        like = '%%%s%%' % escape_psql(texto)
+        score = ', word_similarity(%s, {col})' if con_score else ''
+        partes = [
+            "SELECT id" + score.format(col='name') + " FROM " + tabla +
+            " WHERE %s <%% name OR name ILIKE %s"
+        ]
+        params = ([texto] if con_score else []) + [texto, like]
+        if traduccion:
+            partes.append(
+                "SELECT res_id" + score.format(col='value') + " FROM ir_translation"
+                " WHERE name = %s AND type = 'model' AND lang = %s"
+                " AND (%s <%% value OR value ILIKE %s)"
+            )
+            params += ([texto] if con_score else []) + [
+                traduccion, self.env.lang or 'en_US', texto, like,
+            ]
+        return (' UNION ALL ' if con_score else ' UNION ').join(partes), params
+
+    def _build_domain(self, filtros, historico=False):
+        """Construye el domain para productos.
+
+        Con historico=True (productos de un total de ventas o facturas) no se
+        exige sale_ok y los nombres se comparan con ILIKE en vez de similitud
+        trigram: un nombre parecido no tiene que sumar en el total.
+        """
+        domain = [] if historico else [('sale_ok', '=', True)]
+        trgm = (
+            not historico and (filtros.get('nombre') or filtros.get('categoria'))
+            and self._trgm_disponible()
+        )
         if filtros.get('nombre'):
-            domain.append(('name', 'ilike', filtros['nombre']))
+            if trgm:
+                domain.append(('product_tmpl_id', 'inselect', self._sql_similares(
+                    'product_template', filtros['nombre'], traduccion='product.template,name',
+                )))
+            else:
+                domain.append(('name', 'ilike', filtros['nombre']))
         if filtros.get('precio_min') is not None:
             domain.append(('list_price', '>=', filtros['precio_min']))
         if filtros.get('precio_max') is not None:
             domain.append(('list_price', '<=', filtros['precio_max']))
         if filtros.get('categoria'):
-            domain.append(('categ_id.name', 'ilike', filtros['categoria']))
+            if trgm:
+                domain.append(('categ_id', 'inselect', self._sql_similares(
+                    'product_category', filtros['categoria'],
+                )))
+            elif historico:
+                # complete_name incluye a los padres: suma tambien las subcategorias
+                domain.append(('categ_id.complete_name', 'ilike', filtros['categoria']))
+            else:
+                domain.append(('categ_id.name', 'ilike', filtros['categoria']))
         if filtros.get('ids'):
             domain.append(('id', 'in', filtros['ids']))
+        domain += self._stock_domain(filtros)
         return domain
 
-    def get_productos(self, orden='nombre_asc', limite=10, filtros=None):
+    def _stock_domain(self, filtros):
+        """Filtros de stock como subconsultas sobre el agregado de stock.quant.
+
+        Un producto sin quants tiene stock 0, por eso los filtros que incluyen
+        el 0 se expresan por exclusion (not inselect).
+        """
+        companias = self.env.companies.ids
+
+        def subconsulta(op, valor):
+            return (STOCK_FILTRO_SQL.format(op=op), [companias, valor])
+
+        domain = []
+        if filtros.get('sin_stock'):
+            domain.append(('id', 'not inselect', subconsulta('>', 0)))
+        stock_min = filtros.get('stock_min')
+        if stock_min is not None:
+            if stock_min > 0:
+                domain.append(('id', 'inselect', subconsulta('>=', stock_min)))
+            else:
+                domain.append(('id', 'not inselect', subconsulta('<', stock_min)))
+        stock_max = filtros.get('stock_max')
+        if stock_max is not None:
+            domain.append(('id', 'not inselect', subconsulta('>', stock_max)))
+        return domain
+
+    def _stock_por_producto(self, product_ids):
+        """{product_id: stock} para los productos dados, en una sola consulta."""
+        if not product_ids:
+            return {}
+        self.env.cr.execute(
+            STOCK_QUANT_SQL.format(filtro='AND q.product_id = ANY(%s)'),
+            [self.env.companies.ids, list(product_ids)],
+        )
+        return {product_id: float(qty) for product_id, qty in self.env.cr.fetchall()}
+
+    def _buscar_por_stock(self, domain, direccion, limite, cursor, firma):
+        """Pagina de productos ordenada por stock en un solo statement SQL.
+
+        El domain (con reglas de acceso) se une al agregado de stock.quant y se
+        ordena por (stock, id), con keyset sobre el mismo par.
+        Retorna (filas leidas, stocks, cursor_siguiente).
+        """
+        from_clause, where_clause, params = sql_desde_domain(self.env['product.product'], domain)
+        op = '>' if direccion == 'asc' else '<'
+        seek = ''
+        if cursor:
+            valor, last_id = decode_cursor(cursor, firma)
+            seek = f'AND (COALESCE(s.qty, 0), "product_product".id) {op} (%s, %s)'
+            params = params + [valor, last_id]
+        query = f"""
+            WITH s AS ({STOCK_QUANT_SQL.format(filtro='')})
+            SELECT "product_product".id, COALESCE(s.qty, 0)
+              FROM {from_clause}
+              LEFT JOIN s ON s.product_id = "product_product".id
+             WHERE {where_clause} {seek}
+             ORDER BY 2 {direccion}, 1 {direccion}
+             LIMIT %s
+        """
+        self.env.cr.execute(query, [self.env.companies.ids] + params + [limite + 1])
+        filas = self.env.cr.fetchall()
+        cursor_siguiente = None
+        if len(filas) > limite:
+            filas = filas[:limite]
+            cursor_siguiente = encode_cursor(firma, float(filas[-1][1]), filas[-1][0])
+        stocks = {product_id: float(qty) for product_id, qty in filas}
+        productos = self.env['product.product'].browse([f[0] for f in filas]).read(CAMPOS_PRODUCTO)
+        return productos, stocks, cursor_siguiente
+
+    def _buscar_por_relevancia(self, domain, nombre, limite):
+        """Filas (CAMPOS_PRODUCTO) del domain ordenadas por similitud con `nombre`."""
+        sql, params = self._sql_similares(
+            'product_template', nombre, traduccion='product.template,name', con_score=True,
+        )
+        self.env.cr.execute(
+            "SELECT id, MAX(score) FROM (%s) s(id, score) GROUP BY id "
+            "ORDER BY 2 DESC, id LIMIT %%s" % sql,
+            params + [CANDIDATOS_RELEVANCIA],
+        )
+        ranking = {tmpl_id: pos for pos, (tmpl_id, _score) in enumerate(self.env.cr.fetchall())}
+        productos = self.env['product.product'].search(
+            domain + [('product_tmpl_id', 'in', list(ranking))],
+        )
+        # load=None: el template como id, sin resolver su nombre
+        plantillas = productos.read(['product_tmpl_id'], load=None)
+        ids = [
+            p['id'] for p in sorted(plantillas, key=lambda p: (ranking[p['product_tmpl_id']], p['id']))
+        ][:limite]
+        return self.env['product.product'].browse(ids).read(CAMPOS_PRODUCTO)
+
+    def get_productos(self, orden='nombre_asc', limite=10, filtros=None, cursor=None,
+                      resumen=False):
         filtros = filtros or {}
         domain = self._build_domain(filtros)
+        if resumen:
+            return self._get_productos_resumen(domain)
+        limite = limitar(limite, default=10)
+        Product = self.env['product.product']
+        campo, direccion = ORDEN_MAP.get(orden, ('name', 'asc'))
 
-        # Pre-check de volumen con el mismo domain
-        count = self.env['product.product'].search_count(domain)
-        if count > UMBRAL_REGISTROS:
-            return {
-                'advertencia': True,
-                'cantidad': count,
-                'filtros_actuales': filtros,
-                'mensaje': (
-                    f"Hay {count} productos que coinciden con la consulta. "
-                    f"Pedile al usuario que acote la busqueda por nombre, "
-                    f"categoria, o rango de precios."
-                ),
-            }
+        # Pre-check de volumen con el mismo domain (solo en la primera pagina)
+        count, aproximada = 0, False
+        if not cursor:
+            count, aproximada = estimar_volumen(Product, domain)
 
-        order = ORDEN_MAP.get(orden, 'name asc')
-        productos = self.env['product.product'].search(domain, limit=limite, order=order)
+        cursor_siguiente = None
+        stocks = None
+        firma = firma_consulta('productos', filtros, orden)
+        if orden == 'relevancia' and filtros.get('nombre') and self._trgm_disponible():
+            # Mejores coincidencias primero; no se pagina, solo el top
+            productos = self._buscar_por_relevancia(domain, filtros['nombre'], limite)
+        elif campo == 'stock':
+            productos, stocks, cursor_siguiente = self._buscar_por_stock(
+                domain, direccion, limite, cursor, firma,
+            )
+        else:
+            productos, cursor_siguiente = buscar_pagina(
+                Product, domain, campo, direccion, limite, CAMPOS_PRODUCTO,
+                cursor=cursor, firma=firma,
+            )
+        if stocks is None:
+            stocks = self._stock_por_producto([p['id'] for p in productos])
 
         data = []
         for p in productos:
             data.append({
-                'id': p.id,
-                'nombre': p.name,
-                'precio': float(p.list_price),
-                'stock': float(p.qty_available),
-                'categoria': p.categ_id.name if p.categ_id else '',
+                'id': p['id'],
+                'nombre': p['name'],
+                'precio': float(p['list_price']),
+                'stock': stocks.get(p['id'], 0.0),
+                'categoria': m2o_nombre(p['categ_id']),
             })
 
-        return {
+        resultado = {
             'ids': [d['id'] for d in data],
             'data': data,
             'total': len(data),
+            'cursor_siguiente': cursor_siguiente,
             'mensaje': f"Se encontraron {len(data)} productos.",
         }
+        if count > UMBRAL_REGISTROS:
+            # En orden 'relevancia' no hay cursor: solo se ofrece si se devolvio uno
+            pagina = (
+                "Para la pagina siguiente llama de nuevo con los mismos filtros y "
+                "cursor='cursor_siguiente', pedi resumen=true "
+                if cursor_siguiente else "Pedi resumen=true "
+            )
+            resultado.update({
+                'advertencia': True,
+                'cantidad': count,
+                'cantidad_aproximada': aproximada,
+                'filtros_actuales': filtros,
+                'mensaje': (
+                    f"Hay {texto_cantidad(count, aproximada)} productos que coinciden con "
+                    f"la consulta; se muestran los primeros {len(data)}. {pagina}"
+                    f"para estadisticas del total, o pedile al usuario que acote la "
+                    f"busqueda por nombre, categoria, o rango de precios."
+                ),
+            })
+        elif cursor_siguiente:
+            resultado['mensaje'] += " Hay mas resultados: usa 'cursor_siguiente' para verlos."
+        return resultado
+
+    def _get_productos_resumen(self, domain):
+        """Estadisticas de precio de todos los productos del domain, en PostgreSQL."""
+        stats = resumen_sql(
+            self.env['product.product'], domain,
+            monto='pt_resumen.list_price',
+            nombre='pt_resumen.name',
+            grupo='pt_resumen.categ_id',
+            tabla_grupo='product_category',
+            joins='JOIN product_template pt_resumen '
+                  'ON pt_resumen.id = "product_product".product_tmpl_id',
+        )
+        top = stats.pop('top_por_monto')
+        stats['top_por_categoria'] = stats.pop('top_por_grupo')
+        p50 = stats['percentiles']['p50'] or 0.0
+        return dict(stats, **{
+            'resumen': True,
+            'ids': [d['id'] for d in top],
+            'data': top,
+            'mensaje': (
+                f"Resumen de {stats['cantidad']} productos: precio mediano ${p50:,.2f}, "
+                f"minimo ${stats['minimo'] or 0.0:,.2f}, maximo ${stats['maximo'] or 0.0:,.2f}"
+            ),
+        })
+
+    def _sql_exportacion(self, filtros=None, **_otros):
+        """(columnas, sql, params) de todos los productos que filtra get_productos."""
+        domain = self._build_domain(filtros or {})
+        from_clause, where_clause, params = sql_desde_domain(self.env['product.product'], domain)
+        sql = f"""
+            WITH s AS ({STOCK_QUANT_SQL.format(filtro='')})
+            SELECT pt_exp.name, "product_product".default_code, c_exp.complete_name,
+                   pt_exp.list_price, COALESCE(s.qty, 0)
+              FROM {from_clause}
+              JOIN product_template pt_exp ON pt_exp.id = "product_product".product_tmpl_id
+              LEFT JOIN product_category c_exp ON c_exp.id = pt_exp.categ_id
+              LEFT JOIN s ON s.product_id = "product_product".id
+             WHERE {where_clause}
+             ORDER BY pt_exp.name, "product_product".id
+        """
+        columnas = ['Producto', 'Referencia', 'Categoria', 'Precio', 'Stock']
+        return columnas, sql, [self.env.companies.ids] + params
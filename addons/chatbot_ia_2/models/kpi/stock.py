@@ -0,0 +1,278 @@
+from datetime import timedelta
+
+from odoo import models, fields
+from .helpers import limitar, sql_desde_domain, UMBRAL_REGISTROS
+
+
+# Stock valorizado por producto, categoria y almacen. Se agrega stock.quant
+# por (producto, compania, ubicacion) y recien ese resultado se cruza con los
+# almacenes (parent_path de su ubicacion vista) y con el costo estandar de
+# ir_property: ningun campo computado por producto.
+BASE_SQL = """
+    WITH wh AS (
+        SELECT w.id, w.name, vl.parent_path
+          FROM stock_warehouse w
+          JOIN stock_location vl ON vl.id = w.view_location_id
+         WHERE w.company_id = ANY(%s)
+    ), defecto AS (
+        SELECT DISTINCT ON (c.id) c.id AS company_id, ip.value_float
+          FROM res_company c
+          JOIN ir_property ip ON ip.fields_id = %s AND ip.res_id IS NULL
+                             AND (ip.company_id = c.id OR ip.company_id IS NULL)
+         ORDER BY c.id, ip.company_id NULLS LAST
+    ), q AS (
+        SELECT "stock_quant".product_id, "stock_quant".company_id,
+               "stock_quant".location_id, SUM("stock_quant".quantity) AS qty
+          FROM {from_clause}
+          JOIN stock_location l_q ON l_q.id = "stock_quant".location_id
+         WHERE {where_clause} AND l_q.usage = 'internal'
+         GROUP BY 1, 2, 3
+    ), base AS (
+        SELECT q.product_id, t.categ_id, wh.id AS almacen_id, q.qty,
+               q.qty * COALESCE(pc.value_float, d.value_float, 0) AS valor
+          FROM q
+          JOIN stock_location l ON l.id = q.location_id
+          LEFT JOIN wh ON l.parent_path LIKE wh.parent_path || '%%'
+          JOIN product_product p ON p.id = q.product_id
+          JOIN product_template t ON t.id = p.product_tmpl_id
+          LEFT JOIN ir_property pc ON pc.fields_id = %s AND pc.company_id = q.company_id
+                                  AND pc.res_id = 'product.product,' || q.product_id
+          LEFT JOIN defecto d ON d.company_id = q.company_id
+         WHERE TRUE {filtro}
+    ), stock AS (
+        SELECT product_id, categ_id, SUM(qty) AS qty, SUM(valor) AS valor
+          FROM base
+         GROUP BY product_id, categ_id
+    )
+"""
+
+AGRUPAR_STOCK = {
+    'categoria': ('categ_id', 'product_category', 'complete_name', 'Categoria'),
+    'almacen': ('almacen_id', 'stock_warehouse', 'name', 'Almacen'),
+}
+
+ANALISIS = ('valorizacion', 'cobertura', 'lentos')
+
+
+class KPIStock(models.AbstractModel):
+    _name = 'chatbot2.kpi.stock'
+    _description = 'KPI Stock para Chatbot v2'
+
+    def _sql_base(self, categoria=None, almacen_ids=None):
+        """(sql, params) de BASE_SQL con las reglas de acceso sobre stock.quant."""
+        companias = self.env.companies.ids
+        from_clause, where_clause, params = sql_desde_domain(
+            self.env['stock.quant'], [('company_id', 'in', companias)],
+        )
+        campo_costo = self.env['ir.model.fields']._get('product.product', 'standard_price').id
+        filtro, params_filtro = '', []
+        if categoria:
+            filtro += (" AND t.categ_id IN (SELECT id FROM product_category"
+                       " WHERE complete_name ILIKE %s)")
+            params_filtro.append('%%%s%%' % categoria)
+        if almacen_ids:
+            filtro += " AND wh.id = ANY(%s)"
+            params_filtro.append(list(almacen_ids))
+        sql = BASE_SQL.format(from_clause=from_clause, where_clause=where_clause, filtro=filtro)
+        return sql, [companias, campo_costo] + params + [campo_costo] + params_filtro
+
+    def _nombres_productos(self, product_ids):
+        """{id: display_name} de los productos visibles para el usuario.
+
+        Incluye archivados: un producto archivado con stock tambien cuenta en
+        las cantidades y totales.
+        """
+        Productos = self.env['product.product'].with_context(active_test=False)
+        return {
+            p['id']: p['display_name']
+            for p in Productos.search_read(
+                [('id', 'in', list(product_ids))], ['display_name'],
+            )
+        }
+
+    def get_stock(self, analisis='valorizacion', agrupar_por='categoria', categoria=None,
+                  almacen_ids=None, dias=90, limite=20):
+        """Valorizacion, cobertura o productos sin movimiento, en bloque.
+
+        - valorizacion: cantidad y valor (costo estandar) por categoria o almacen
+        - cobertura: dias de stock segun el consumo de los ultimos `dias`
+        - lentos: productos con stock y sin movimientos en los ultimos `dias`
+        """
+        self.env['stock.quant'].flush()
+        self.env['stock.move'].flush()
+        limite = limitar(limite)
+        dias = max(1, int(dias or 90))
+        if analisis == 'cobertura':
+            return self._get_cobertura(categoria, almacen_ids, dias, limite)
+        if analisis == 'lentos':
+            return self._get_lentos(categoria, almacen_ids, dias, limite)
+        return self._get_valorizacion(agrupar_por, categoria, almacen_ids, limite)
+
+    def _get_valorizacion(self, agrupar_por, categoria, almacen_ids, limite):
+        columna, tabla, nombre, label = AGRUPAR_STOCK.get(agrupar_por, AGRUPAR_STOCK['categoria'])
+        sql, params = self._sql_base(categoria, almacen_ids)
+        self.env.cr.execute(sql + f"""
+            SELECT b.{columna}, g.{nombre}, SUM(b.qty), SUM(b.valor),
+                   COUNT(DISTINCT b.product_id),
+                   COUNT(*) OVER (), SUM(SUM(b.valor)) OVER ()
+              FROM base b
+              LEFT JOIN {tabla} g ON g.id = b.{columna}
+             GROUP BY b.{columna}, g.{nombre}
+             ORDER BY 4 DESC NULLS LAST, 1
+             LIMIT %s
+        """, params + [limite])
+        filas = self.env.cr.fetchall()
+        grupos = filas[0][5] if filas else 0
+        total_valor = float(filas[0][6] or 0.0) if filas else 0.0
+
+        data = [{
+            'id': f[0],
+            'nombre': f[1] or f"Sin {label.lower()}",
+            'cantidad': float(f[2] or 0.0),
+            'valor': float(f[3] or 0.0),
+            'productos': f[4],
+        } for f in filas]
+        resultado = {
+            'analisis': 'valorizacion',
+            'agrupado_por': agrupar_por if agrupar_por in AGRUPAR_STOCK else 'categoria',
+            'ids': [d['id'] for d in data if d['id']],
+            'data': data,
+            'total_valor': total_valor,
+            'count': len(data),
+            'mensaje': (
+                f"Stock valorizado en ${total_valor:,.2f} (costo estandar), "
+                f"{grupos} grupos por {label}"
+            ),
+        }
+        if grupos > len(data):
+            resultado['mensaje'] += f"; se muestran los {len(data)} de mayor valor"
+        return resultado
+
+    def _get_cobertura(self, categoria, almacen_ids, dias, limite):
+        """Productos con consumo en los ultimos `dias`, de menor a mayor cobertura."""
+        sql, params = self._sql_base(categoria, almacen_ids)
+        desde = fields.Datetime.now() - timedelta(days=dias)
+        companias = self.env.companies.ids
+        from_m, where_m, params_m = sql_desde_domain(self.env['stock.move'], [
+            ('state', '=', 'done'), ('date', '>=', desde), ('company_id', 'in', companias),
+        ])
+        filtro_m, params_filtro_m = '', []
+        if categoria:
+            filtro_m += (" AND t_m.categ_id IN (SELECT id FROM product_category"
+                         " WHERE complete_name ILIKE %s)")
+            params_filtro_m.append('%%%s%%' % categoria)
+        if almacen_ids:
+            filtro_m += " AND wh.id = ANY(%s)"
+            params_filtro_m.append(list(almacen_ids))
+        self.env.cr.execute(sql + f"""
+            , consumo AS (
+                SELECT "stock_move".product_id, SUM("stock_move".product_qty) AS qty
+                  FROM {from_m}
+                  JOIN stock_location lo ON lo.id = "stock_move".location_id
+                  JOIN stock_location ld ON ld.id = "stock_move".location_dest_id
+                  LEFT JOIN wh ON lo.parent_path LIKE wh.parent_path || '%%'
+                  JOIN product_product p_m ON p_m.id = "stock_move".product_id
+                  JOIN product_template t_m ON t_m.id = p_m.product_tmpl_id
+                 WHERE {where_m} AND lo.usage = 'internal'
+                   AND ld.usage NOT IN ('internal', 'transit') {filtro_m}
+                 GROUP BY 1
+            ), cobertura AS (
+                SELECT c.product_id, COALESCE(s.qty, 0) AS qty, COALESCE(s.valor, 0) AS valor,
+                       c.qty / %s AS diario,
+                       GREATEST(COALESCE(s.qty, 0), 0) / (c.qty / %s) AS dias
+                  FROM consumo c
+                  LEFT JOIN stock s ON s.product_id = c.product_id
+                 WHERE c.qty > 0
+            )
+            SELECT product_id, qty, valor, diario, dias, COUNT(*) OVER ()
+              FROM cobertura
+             ORDER BY dias, diario DESC, product_id
+             LIMIT %s
+        """, params + params_m + params_filtro_m + [dias, dias, limite])
+        filas = self.env.cr.fetchall()
+        cantidad = filas[0][5] if filas else 0
+        nombres = self._nombres_productos(f[0] for f in filas)
+
+        data = [{
+            'id': f[0],
+            'nombre': nombres[f[0]],
+            'stock': float(f[1]),
+            'valor': float(f[2]),
+            'consumo_diario': round(float(f[3]), 2),
+            'dias_cobertura': round(float(f[4]), 1),
+        } for f in filas if f[0] in nombres]
+        sin_stock = sum(1 for d in data if d['dias_cobertura'] == 0)
+        return {
+            'analisis': 'cobertura',
+            'dias_consumo': dias,
+            'ids': [d['id'] for d in data],
+            'data': data,
+            'count': len(data),
+            'cantidad': cantidad,
+            'mensaje': (
+                f"{cantidad} productos con consumo en los ultimos {dias} dias; se muestran "
+                f"los {len(data)} con menor cobertura ({sin_stock} ya sin stock)"
+            ),
+        }
+
+    def _get_lentos(self, categoria, almacen_ids, dias, limite):
+        """Productos con stock y sin movimientos hechos en los ultimos `dias`,
+        de mayor a menor valor inmovilizado."""
+        sql, params = self._sql_base(categoria, almacen_ids)
+        desde = fields.Datetime.now() - timedelta(days=dias)
+        companias = self.env.companies.ids
+        # Ultimo movimiento hecho de cada producto con stock, con las reglas de
+        # acceso (y multi compania) sobre stock.move
+        from_m, where_m, params_m = sql_desde_domain(self.env['stock.move'], [
+            ('state', '=', 'done'), ('company_id', 'in', companias),
+        ])
+        self.env.cr.execute(sql + f"""
+            , movimientos AS (
+                SELECT "stock_move".product_id, MAX("stock_move".date) AS ultimo
+                  FROM {from_m}
+                 WHERE {where_m}
+                   AND "stock_move".product_id IN (SELECT product_id FROM stock WHERE qty > 0)
+                 GROUP BY 1
+            ), lentos AS (
+                SELECT s.product_id, s.qty, s.valor, mv.ultimo,
+                       COUNT(*) OVER () AS cantidad, SUM(s.valor) OVER () AS total
+                  FROM stock s
+                  LEFT JOIN movimientos mv ON mv.product_id = s.product_id
+                 WHERE s.qty > 0 AND (mv.ultimo IS NULL OR mv.ultimo < %s)
+                 ORDER BY s.valor DESC NULLS LAST, s.product_id
+                 LIMIT %s
+            )
+            SELECT product_id, qty, valor, cantidad, total, ultimo
+              FROM lentos
+             ORDER BY valor DESC NULLS LAST, product_id
+        """, params + params_m + [desde, limite])
+        filas = self.env.cr.fetchall()
+        cantidad = filas[0][3] if filas else 0
+        total_valor = float(filas[0][4] or 0.0) if filas else 0.0
+        nombres = self._nombres_productos(f[0] for f in filas)
+
+        data = [{
+            'id': f[0],
+            'nombre': nombres[f[0]],
+            'stock': float(f[1]),
+            'valor': float(f[2] or 0.0),
+            'ultimo_movimiento': str(f[5].date()) if f[5] else 'nunca',
+        } for f in filas if f[0] in nombres]
+        resultado = {
+            'analisis': 'lentos',
+            'dias_sin_movimiento': dias,
+            'ids': [d['id'] for d in data],
+            'data': data,
+            'total_valor': total_valor,
+            'count': len(data),
+            'cantidad': cantidad,
+            'mensaje': (
+                f"{cantidad} productos con stock sin movimientos en los ultimos {dias} dias, "
+                f"${total_valor:,.2f} inmovilizados"
+            ),
+        }
+        if cantidad > len(data):
+            resultado['mensaje'] += f"; se muestran los {len(data)} de mayor valor"
+        if cantidad > UMBRAL_REGISTROS:
+            resultado['advertencia'] = True
+        return resultado
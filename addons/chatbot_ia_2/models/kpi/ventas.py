@@ -1,5 +1,9 @@
 from odoo import models
-from .helpers import date_range_from_periodo, UMBRAL_REGISTROS
+from .helpers import (
+    date_range_from_periodo, limitar, firma_consulta, buscar_pagina, resumen_sql,
+    resumen_base, sql_desde_domain, m2o_id, m2o_nombre, UMBRAL_REGISTROS, estimar_volumen, texto_cantidad,
+    encode_cursor, decode_cursor,
+)
 
 
 AGRUPAR_MAP = {
@@ -8,13 +12,50 @@ AGRUPAR_MAP = {
     'cliente': ('partner_id', 'Cliente'),
 }
 
+# Columnas que se leen de sale.order (no se cargan los demas campos)
+CAMPOS_PEDIDO = ['name', 'partner_id', 'user_id', 'amount_total', 'date_order']
+
+# Orden de pedidos individuales: (campo, direccion) para la paginacion keyset
+ORDEN_PEDIDOS_MAP = {
+    'monto_desc': ('amount_total', 'desc'),
+    'monto_asc': ('amount_total', 'asc'),
+    'fecha_desc': ('date_order', 'desc'),
+    'fecha_asc': ('date_order', 'asc'),
+}
+
+# Orden de ventas por linea (pedido x producto): campo de ORDEN_PEDIDOS_MAP ->
+# expresion SQL de la consulta agregada
+ORDEN_LINEAS_MAP = {
+    'amount_total': 'SUM("sale_order_line".price_total)',
+    'date_order': 'so_l.date_order',
+}
+
+# Ventas de productos agregadas por pedido y producto desde sale_order_line.
+# Las reglas de acceso se aplican sobre las lineas (sql_desde_domain)
+LINEAS_SQL = """
+    SELECT so_l.id, so_l.name, so_l.partner_id, cp_l.name, so_l.user_id, vp_l.name,
+           so_l.date_order, "sale_order_line".product_id, pt_l.name,
+           SUM("sale_order_line".product_uom_qty), SUM("sale_order_line".price_subtotal),
+           SUM("sale_order_line".price_total) {columnas}
+      FROM {from_clause}
+      JOIN sale_order so_l ON so_l.id = "sale_order_line".order_id
+      JOIN product_product pp_l ON pp_l.id = "sale_order_line".product_id
+      JOIN product_template pt_l ON pt_l.id = pp_l.product_tmpl_id
+      LEFT JOIN res_partner cp_l ON cp_l.id = so_l.partner_id
+      LEFT JOIN res_users v_l ON v_l.id = so_l.user_id
+      LEFT JOIN res_partner vp_l ON vp_l.id = v_l.partner_id
+     WHERE {where_clause} AND so_l.date_order >= %s AND so_l.date_order < %s
+     GROUP BY so_l.id, "sale_order_line".product_id, cp_l.name, vp_l.name, pt_l.name
+"""
+
 
 class KPIVentas2(models.AbstractModel):
     _name = 'chatbot2.kpi.ventas'
     _description = 'KPI Ventas para Chatbot v2'
 
-    def _build_domain(self, start, end, producto_ids, vendedor_ids, cliente_ids):
-        """Construye el domain para ventas."""
+    def _build_domain(self, start, end, vendedor_ids, cliente_ids):
+        """Construye el domain de pedidos para ventas (sin filtro de productos:
+        las ventas de productos se calculan por linea, ver _consulta_lineas)."""
         domain = [
             ('state', 'in', ['sale', 'done']),
             ('date_order', '>=', start),
@@ -24,13 +65,21 @@ class KPIVentas2(models.AbstractModel):
             domain.append(('user_id', 'in', vendedor_ids))
         if cliente_ids:
             domain.append(('partner_id', 'in', cliente_ids))
-        if producto_ids:
-            domain.append(('order_line.product_id', 'in', producto_ids))
         return domain
 
     def get_ventas(self, producto_ids=None, vendedor_ids=None, cliente_ids=None,
-                   agrupar_por=None, periodo='mes_actual', limite=20, orden='monto_desc'):
+                   agrupar_por=None, periodo='mes_actual', limite=20, orden='monto_desc',
+                   cursor=None, resumen=False):
         start, end = date_range_from_periodo(self, periodo)
+        limite = limitar(limite)
+
+        if resumen and producto_ids:
+            return self._get_ventas_resumen_lineas(
+                start, end, periodo, producto_ids, vendedor_ids, cliente_ids,
+            )
+        if resumen:
+            domain = self._build_domain(start, end, vendedor_ids, cliente_ids)
+            return self._get_ventas_resumen(domain, periodo)
 
         if agrupar_por and agrupar_por in AGRUPAR_MAP:
             return self._get_ventas_agrupadas(
@@ -38,15 +87,55 @@ class KPIVentas2(models.AbstractModel):
                 producto_ids, vendedor_ids, cliente_ids, limite, orden,
             )
 
+        # Con productos: lo vendido de esos productos, no el total de los pedidos
+        if producto_ids:
+            return self._get_ventas_por_linea(
+                start, end, periodo, producto_ids, vendedor_ids, cliente_ids,
+                limite, orden, cursor,
+            )
+
         # Sin agrupacion: pedidos individuales
-        domain = self._build_domain(start, end, producto_ids, vendedor_ids, cliente_ids)
+        domain = self._build_domain(start, end, vendedor_ids, cliente_ids)
+        campo, direccion = ORDEN_PEDIDOS_MAP.get(orden, ('amount_total', 'desc'))
+        firma = firma_consulta('ventas', periodo, str(start), vendedor_ids, cliente_ids, orden)
+
+        # Pre-check de volumen con el mismo domain (solo en la primera pagina)
+        count, aproximada = 0, False
+        if not cursor:
+            count, aproximada = estimar_volumen(self.env['sale.order'], domain)
+
+        pedidos, cursor_siguiente = buscar_pagina(
+            self.env['sale.order'], domain, campo, direccion,
+            limite, CAMPOS_PEDIDO, cursor=cursor, firma=firma,
+        )
+
+        data = []
+        for p in pedidos:
+            data.append({
+                'id': p['id'],
+                'nombre': p['name'],
+                'cliente': m2o_nombre(p['partner_id']),
+                'cliente_id': m2o_id(p['partner_id']),
+                'vendedor': m2o_nombre(p['user_id']),
+                'vendedor_id': m2o_id(p['user_id']),
+                'monto': float(p['amount_total']),
+                'fecha': str(p['date_order'].date()) if p['date_order'] else '',
+            })
 
-        # Pre-check de volumen con el mismo domain
-        count = self.env['sale.order'].search_count(domain)
+        total_monto = sum(d['monto'] for d in data)
+        resultado = {
+            'ids': [d['id'] for d in data],
+            'data': data,
+            'total_monto': total_monto,
+            'count': len(data),
+            'cursor_siguiente': cursor_siguiente,
+            'mensaje': f"Se encontraron {len(data)} pedidos por ${total_monto:,.2f}",
+        }
         if count > UMBRAL_REGISTROS:
-            return {
+            resultado.update({
                 'advertencia': True,
                 'cantidad': count,
+                'cantidad_aproximada': aproximada,
                 'periodo': periodo,
                 'filtros_actuales': {
                     'producto_ids': producto_ids,
@@ -54,43 +143,177 @@ class KPIVentas2(models.AbstractModel):
                     'cliente_ids': cliente_ids,
                 },
                 'mensaje': (
-                    f"Hay {count} pedidos en el periodo '{periodo}'. "
-                    f"Pedile al usuario que acote la busqueda por vendedor, "
-                    f"cliente, producto, o cambie el periodo."
+                    f"Hay {texto_cantidad(count, aproximada)} pedidos en el periodo "
+                    f"'{periodo}'; se muestran "
+                    f"los primeros {len(data)} (${total_monto:,.2f}). "
+                    f"Para la pagina siguiente llama de nuevo con los mismos filtros y "
+                    f"cursor='cursor_siguiente', pedi resumen=true para estadisticas del total, "
+                    f"o pedile al usuario que acote la busqueda "
+                    f"por vendedor, cliente, producto, o cambie el periodo."
                 ),
-            }
+            })
+        elif cursor_siguiente:
+            resultado['mensaje'] += ". Hay mas resultados: usa 'cursor_siguiente' para verlos."
+        return resultado
 
-        order_str = 'amount_total desc'
-        if orden == 'monto_asc':
-            order_str = 'amount_total asc'
-        elif orden == 'fecha_desc':
-            order_str = 'date_order desc'
-        elif orden == 'fecha_asc':
-            order_str = 'date_order asc'
+    def _consulta_lineas(self, start, end, producto_ids, vendedor_ids, cliente_ids,
+                         columnas=''):
+        """(sql, params) de LINEAS_SQL con los filtros de get_ventas."""
+        domain = [
+            ('state', 'in', ['sale', 'done']),
+            ('product_id', 'in', producto_ids),
+        ]
+        if vendedor_ids:
+            domain.append(('salesman_id', 'in', vendedor_ids))
+        if cliente_ids:
+            domain.append(('order_partner_id', 'in', cliente_ids))
+        from_clause, where_clause, params = sql_desde_domain(
+            self.env['sale.order.line'], domain,
+        )
+        sql = LINEAS_SQL.format(
+            columnas=columnas, from_clause=from_clause, where_clause=where_clause,
+        )
+        return sql, params + [start, end]
 
-        pedidos = self.env['sale.order'].search(domain, limit=limite, order=order_str)
+    def _get_ventas_por_linea(self, start, end, periodo, producto_ids, vendedor_ids,
+                              cliente_ids, limite, orden, cursor):
+        """Ventas de los productos pedidos, una fila por pedido y producto.
 
-        data = []
-        for p in pedidos:
-            data.append({
-                'id': p.id,
-                'nombre': p.name,
-                'cliente': p.partner_id.name,
-                'cliente_id': p.partner_id.id,
-                'vendedor': p.user_id.name if p.user_id else '',
-                'vendedor_id': p.user_id.id if p.user_id else None,
-                'monto': float(p.amount_total),
-                'fecha': str(p.date_order.date()) if p.date_order else '',
-            })
+        Una sola consulta agregada sobre sale_order_line: el monto es el de las
+        lineas de esos productos (no el total del pedido), el conteo y el total
+        del periodo salen de funciones ventana y la paginacion es keyset sobre
+        (orden, pedido, producto) con HAVING.
+        """
+        campo, direccion = ORDEN_PEDIDOS_MAP.get(orden, ('amount_total', 'desc'))
+        clave = ORDEN_LINEAS_MAP[campo]
+        firma = firma_consulta('ventas_lineas', periodo, str(start), producto_ids,
+                               vendedor_ids, cliente_ids, orden)
+        sql, params = self._consulta_lineas(
+            start, end, producto_ids, vendedor_ids, cliente_ids,
+            columnas=', COUNT(*) OVER (), SUM(SUM("sale_order_line".price_total)) OVER ()',
+        )
+        op = '>' if direccion == 'asc' else '<'
+        if cursor:
+            try:
+                (valor, pedido_id), producto_id = decode_cursor(cursor, firma)
+            except TypeError:
+                raise ValueError("Cursor invalido")
+            sql += f' HAVING ({clave}, so_l.id, "sale_order_line".product_id) {op} (%s, %s, %s)'
+            params += [valor, pedido_id, producto_id]
+        sql += (
+            f' ORDER BY {clave} {direccion}, so_l.id {direccion},'
+            f' "sale_order_line".product_id {direccion} LIMIT %s'
+        )
+        self.env.cr.execute(sql, params + [limite + 1])
+        filas = self.env.cr.fetchall()
+
+        count = filas[0][12] if filas else 0
+        total_periodo = float(filas[0][13]) if filas else 0.0
+        cursor_siguiente = None
+        if len(filas) > limite:
+            filas = filas[:limite]
+            ultima = filas[-1]
+            valor = float(ultima[11]) if campo == 'amount_total' else ultima[6]
+            cursor_siguiente = encode_cursor(firma, [valor, ultima[0]], ultima[7])
+
+        data = [{
+            'id': f[0],
+            'nombre': f[1],
+            'cliente': f[3] or '',
+            'cliente_id': f[2],
+            'vendedor': f[5] or '',
+            'vendedor_id': f[4],
+            'producto': f[8] or '',
+            'producto_id': f[7],
+            'cantidad': float(f[9] or 0.0),
+            'subtotal': float(f[10] or 0.0),
+            'monto': float(f[11] or 0.0),
+            'fecha': str(f[6].date()) if f[6] else '',
+        } for f in filas]
 
         total_monto = sum(d['monto'] for d in data)
-        return {
-            'ids': [d['id'] for d in data],
+        resultado = {
+            'por_linea': True,
+            'ids': list(dict.fromkeys(d['id'] for d in data)),
             'data': data,
             'total_monto': total_monto,
             'count': len(data),
-            'mensaje': f"Se encontraron {len(data)} pedidos por ${total_monto:,.2f}",
+            'cursor_siguiente': cursor_siguiente,
+            'mensaje': (
+                f"Se encontraron {len(data)} ventas de esos productos (por pedido y "
+                f"producto) por ${total_monto:,.2f}"
+            ),
         }
+        if not cursor:
+            resultado['total_periodo'] = total_periodo
+        if not cursor and count > UMBRAL_REGISTROS:
+            resultado.update({
+                'advertencia': True,
+                'cantidad': count,
+                'cantidad_aproximada': False,
+                'periodo': periodo,
+                'filtros_actuales': {
+                    'producto_ids': producto_ids,
+                    'vendedor_ids': vendedor_ids,
+                    'cliente_ids': cliente_ids,
+                },
+                'mensaje': (
+                    f"Hay {count} ventas de esos productos (pedido x producto) en el periodo "
+                    f"'{periodo}' por un total de ${total_periodo:,.2f}; se muestran las "
+                    f"primeras {len(data)}. Para la pagina siguiente llama de nuevo con los "
+                    f"mismos filtros y cursor='cursor_siguiente', o usa agrupar_por para "
+                    f"totales por vendedor, cliente o producto."
+                ),
+            })
+        elif cursor_siguiente:
+            resultado['mensaje'] += ". Hay mas resultados: usa 'cursor_siguiente' para verlos."
+        return resultado
+
+    def _get_ventas_resumen(self, domain, periodo):
+        """Estadisticas de todos los pedidos del domain, calculadas en PostgreSQL."""
+        stats = resumen_sql(
+            self.env['sale.order'], domain,
+            monto='"sale_order".amount_total',
+            nombre='"sale_order".name',
+            grupo='"sale_order".partner_id',
+            tabla_grupo='res_partner',
+        )
+        return self._formatear_resumen(stats, periodo)
+
+    def _get_ventas_resumen_lineas(self, start, end, periodo, producto_ids,
+                                   vendedor_ids, cliente_ids):
+        """Estadisticas por pedido de lo vendido de esos productos: el monto de
+        cada pedido es la suma de sus lineas de esos productos (_consulta_lineas),
+        no el total del pedido."""
+        sql, params = self._consulta_lineas(start, end, producto_ids, vendedor_ids, cliente_ids)
+        base = f"""
+            SELECT l.id, l.nombre, SUM(l.monto) AS monto, l.cliente_id AS grupo_id
+              FROM ({sql}) AS l(id, nombre, cliente_id, cliente, vendedor_id, vendedor,
+                                fecha, producto_id, producto, cantidad, subtotal, monto)
+             GROUP BY l.id, l.nombre, l.cliente_id
+        """
+        stats = resumen_base(self.env, base, params, 'res_partner')
+        resultado = self._formatear_resumen(
+            stats, periodo, "pedidos con esos productos (solo el monto de esos productos)",
+        )
+        resultado['por_linea'] = True
+        return resultado
+
+    def _formatear_resumen(self, stats, periodo, descripcion='pedidos'):
+        top = stats.pop('top_por_monto')
+        stats['top_por_cliente'] = stats.pop('top_por_grupo')
+        p50 = stats['percentiles']['p50'] or 0.0
+        return dict(stats, **{
+            'resumen': True,
+            'ids': [d['id'] for d in top],
+            'data': top,
+            'periodo': periodo,
+            'mensaje': (
+                f"Resumen de {stats['cantidad']} {descripcion} ({periodo}): "
+                f"total ${stats['suma']:,.2f}, ticket mediano ${p50:,.2f}, "
+                f"maximo ${stats['maximo'] or 0.0:,.2f}"
+            ),
+        })
 
     def _get_ventas_agrupadas(self, agrupar_por, start, end,
                                producto_ids, vendedor_ids, cliente_ids, limite, orden):
@@ -145,3 +368,41 @@ class KPIVentas2(models.AbstractModel):
             'count': len(data),
             'mensaje': f"Ventas agrupadas por {label}: {len(data)} grupos, total ${total_monto:,.2f}",
         }
+
+    def _sql_exportacion(self, producto_ids=None, vendedor_ids=None, cliente_ids=None,
+                         periodo='mes_actual', **_otros):
+        """(columnas, sql, params) de todos los pedidos que filtra get_ventas.
+
+        Con producto_ids, una fila por pedido y producto con el monto de esas
+        lineas, como en get_ventas.
+        """
+        start, end = date_range_from_periodo(self, periodo)
+        if producto_ids:
+            sql, params = self._consulta_lineas(
+                start, end, producto_ids, vendedor_ids, cliente_ids,
+            )
+            sql = f"""
+                SELECT nombre, cliente, vendedor, fecha, producto, cantidad, subtotal, total
+                  FROM ({sql}) AS lineas (id, nombre, cliente_id, cliente, vendedor_id,
+                        vendedor, fecha, producto_id, producto, cantidad, subtotal, total)
+                 ORDER BY fecha, id, producto_id
+            """
+            columnas = [
+                'Pedido', 'Cliente', 'Vendedor', 'Fecha', 'Producto', 'Cantidad',
+                'Subtotal', 'Total',
+            ]
+            return columnas, sql, params
+        domain = self._build_domain(start, end, vendedor_ids, cliente_ids)
+        from_clause, where_clause, params = sql_desde_domain(self.env['sale.order'], domain)
+        sql = f"""
+            SELECT "sale_order".name, p_exp.name, vp_exp.name, "sale_order".date_order,
+                   "sale_order".amount_untaxed, "sale_order".amount_total
+              FROM {from_clause}
+              LEFT JOIN res_partner p_exp ON p_exp.id = "sale_order".partner_id
+              LEFT JOIN res_users v_exp ON v_exp.id = "sale_order".user_id
+              LEFT JOIN res_partner vp_exp ON vp_exp.id = v_exp.partner_id
+             WHERE {where_clause}
+             ORDER BY "sale_order".date_order, "sale_order".id
+        """
+        columnas = ['Pedido', 'Cliente', 'Vendedor', 'Fecha', 'Subtotal', 'Total']
+        return columnas, sql, params
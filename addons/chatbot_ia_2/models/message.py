@@ -1,4 +1,10 @@
-from odoo import models, fields
+import zlib
+import base64
+
+from odoo import models, fields, api
+
+# Resultados de funciones mas grandes que esto (bytes) se guardan comprimidos
+UMBRAL_COMPRIMIR = 1024
 
 
 class ChatbotMessage(models.Model):
@@ -18,5 +24,31 @@ class ChatbotMessage(models.Model):
         ('function', 'Funcion'),
     ], string='Rol', required=True)
     content = fields.Text(string='Contenido')
+    # Resultado de funcion grande (JSON + zlib). Fuera del prefetch: solo se
+    # lee al armar el historial para la API, no al cargar la sesion
+    content_comprimido = fields.Binary(
+        string='Contenido comprimido', attachment=False, prefetch=False,
+    )
     function_name = fields.Char(string='Nombre Funcion')
     visible = fields.Boolean(string='Visible', default=True)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        for vals in vals_list:
+            content = vals.get('content')
+            if (vals.get('role') == 'function' and content
+                    and len(content) > UMBRAL_COMPRIMIR and not vals.get('visible')):
+                vals['content_comprimido'] = base64.b64encode(
+                    zlib.compress(content.encode('utf-8'))
+                )
+                vals['content'] = False
+        return super().create(vals_list)
+
+    def contenido(self):
+        """Contenido completo del mensaje, descomprimido si hace falta."""
+        self.ensure_one()
+        if self.content or self.role != 'function':
+            return self.content or ''
+        if not self.content_comprimido:
+            return ''
+        return zlib.decompress(base64.b64decode(self.content_comprimido)).decode('utf-8')
@@ -0,0 +1,140 @@
+import logging
+import threading
+
+from odoo import models, fields, api
+
+from .similitud import IndiceSimilitud, normalizar, palabras, terminos_clave
+
+_logger = logging.getLogger(__name__)
+
+UMBRAL_SIMILITUD_DEFAULT = 0.8
+# Planes mas usados que entran al indice en memoria
+MAX_PLANES_INDICE = 5000
+
+# Secuencia que se incrementa al confirmar cambios de preguntas o argumentos
+# de planes: los workers la comparan con la version de su indice
+SECUENCIA_VERSION = 'chatbot_ia2_plan_version_seq'
+# Campos cuyo cambio invalida los indices
+CAMPOS_INDICE = {'pregunta', 'arguments'}
+
+# Indice por base de datos: {dbname: (version, ids de planes, IndiceSimilitud)}
+_INDICES = {}
+_INDICES_LOCK = threading.Lock()
+
+
+class ChatbotPlan(models.Model):
+    """Primera llamada a funcion que eligio la IA para una pregunta.
+
+    Sirve para reutilizar el plan ante preguntas parecidas y ahorrar la
+    llamada de planificacion al LLM.
+    """
+    _name = 'chatbot.ia2.plan'
+    _description = 'Plan de funciones aprendido'
+    _order = 'usos desc, id desc'
+
+    pregunta = fields.Char(string='Pregunta', required=True)
+    pregunta_normalizada = fields.Char(string='Pregunta normalizada', index=True)
+    function_name = fields.Char(string='Funcion', required=True)
+    arguments = fields.Text(string='Argumentos (JSON)', default='{}')
+    usos = fields.Integer(string='Usos', default=1)
+
+    def init(self):
+        self.env.cr.execute(f"CREATE SEQUENCE IF NOT EXISTS {SECUENCIA_VERSION}")
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        self._invalidar_indices()
+        return super().create(vals_list)
+
+    def write(self, vals):
+        if CAMPOS_INDICE.intersection(vals):
+            self._invalidar_indices()
+        return super().write(vals)
+
+    def unlink(self):
+        self._invalidar_indices()
+        return super().unlink()
+
+    @api.model
+    def registrar(self, pregunta, function_name, arguments):
+        """Guarda (o suma un uso a) el plan elegido por la IA para la pregunta."""
+        normalizada = normalizar(pregunta)
+        existente = self.search([
+            ('pregunta_normalizada', '=', normalizada),
+            ('function_name', '=', function_name),
+            ('arguments', '=', arguments),
+        ], limit=1)
+        if existente:
+            existente.sumar_uso()
+            return existente
+        return self.create({
+            'pregunta': pregunta,
+            'pregunta_normalizada': normalizada,
+            'function_name': function_name,
+            'arguments': arguments,
+        })
+
+    def sumar_uso(self):
+        """Suma un uso sin pasar por write(): no toca write_date ni invalida
+        los indices de los workers."""
+        self.env.cr.execute(
+            "UPDATE chatbot_ia2_plan SET usos = usos + 1 WHERE id IN %s", [tuple(self.ids)],
+        )
+        self.invalidate_cache(['usos'])
+
+    @api.model
+    def _invalidar_indices(self):
+        """Marca los indices de todos los workers como viejos al confirmar la
+        transaccion (antes del commit otro worker leeria los planes anteriores)."""
+        datos = self.env.cr.postcommit.data
+        if datos.get(SECUENCIA_VERSION):
+            return
+        datos[SECUENCIA_VERSION] = True
+        cr = self.env.cr
+        cr.postcommit.add(lambda: cr.execute(f"SELECT nextval('{SECUENCIA_VERSION}')"))
+
+    def _indice(self):
+        """Indice TF-IDF del proceso, reconstruido si cambiaron los planes."""
+        # El primer nextval deja last_value igual y solo cambia is_called
+        self.env.cr.execute(f"SELECT last_value, is_called FROM {SECUENCIA_VERSION}")
+        version = self.env.cr.fetchone()
+        dbname = self.env.cr.dbname
+        with _INDICES_LOCK:
+            cache = _INDICES.get(dbname)
+            if cache and cache[0] == version:
+                return cache[1], cache[2]
+        self.flush(['usos', 'pregunta'])
+        planes = self.search_read([], ['pregunta'], limit=MAX_PLANES_INDICE)
+        ids = [p['id'] for p in planes]
+        indice = IndiceSimilitud([p['pregunta'] for p in planes])
+        with _INDICES_LOCK:
+            _INDICES[dbname] = (version, ids, indice)
+        _logger.info("Indice de planes del chatbot reconstruido: %d preguntas", len(ids))
+        return ids, indice
+
+    @api.model
+    def buscar_similar(self, pregunta):
+        """Plan de una pregunta pasada suficientemente parecida, o None.
+
+        Los numeros, palabras de sentido, meses y nombres propios de ambas
+        preguntas tienen que coincidir (terminos_clave): la similitud de texto
+        sola no distingue "producto 5" de "producto 7" ni "mas vendidos" de
+        "menos vendidos". Ademas, las palabras que el plan copio de su pregunta
+        a los argumentos (un nombre a buscar, por ejemplo) tienen que estar
+        en la pregunta nueva.
+        """
+        umbral = float(self.env['ir.config_parameter'].sudo().get_param(
+            'chatbot_ia2.umbral_similitud', UMBRAL_SIMILITUD_DEFAULT))
+        ids, indice = self._indice()
+        posicion, score = indice.buscar(pregunta)
+        if posicion is None or score < umbral:
+            return None
+        plan = self.browse(ids[posicion]).exists()
+        if not plan or terminos_clave(plan.pregunta) != terminos_clave(pregunta):
+            return None
+        literales = palabras(plan.arguments) & palabras(plan.pregunta)
+        if not literales <= palabras(pregunta):
+            return None
+        _logger.info("Plan reutilizado (similitud %.2f): '%s' ~ '%s' -> %s",
+                     score, pregunta, plan.pregunta, plan.function_name)
+        return plan
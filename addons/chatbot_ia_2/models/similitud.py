@@ -0,0 +1,109 @@
+import re
+import zlib
+import unicodedata
+
+import numpy as np
+
+# Dimension del espacio de features (hashing trick): acota la memoria del
+# indice a len(textos) x DIMENSION float32 sin guardar un vocabulario
+DIMENSION = 2048
+NGRAMAS = (3, 4)
+
+
+def normalizar(texto):
+    """Minusculas, sin acentos ni signos, espacios colapsados."""
+    texto = unicodedata.normalize('NFKD', texto or '')
+    texto = ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+    return ' '.join(re.findall(r'\w+', texto))
+
+
+# Palabras que cambian el sentido de una consulta aunque el resto del texto
+# sea casi igual ("mas vendidos" / "menos vendidos", "del mes" / "del anio")
+TERMINOS_SENTIDO = {
+    'mas', 'menos', 'mayor', 'mayores', 'menor', 'menores', 'mejor', 'mejores',
+    'peor', 'peores', 'max', 'maximo', 'maximos', 'min', 'minimo', 'minimos',
+    'alto', 'altos', 'alta', 'altas', 'bajo', 'bajos', 'baja', 'bajas',
+    'caro', 'caros', 'barato', 'baratos', 'primero', 'primeros', 'ultimo', 'ultimos',
+    'asc', 'ascendente', 'desc', 'descendente', 'creciente', 'decreciente',
+    'arriba', 'abajo', 'sobre', 'debajo', 'encima', 'entre', 'no', 'sin', 'excepto',
+    'hoy', 'ayer', 'semana', 'mes', 'trimestre', 'anio', 'ano', 'actual', 'pasado',
+    'pasada', 'anterior',
+    # Meses y dias de la semana: cambian el periodo consultado
+    'enero', 'febrero', 'marzo', 'abril', 'mayo', 'junio', 'julio', 'agosto',
+    'septiembre', 'setiembre', 'octubre', 'noviembre', 'diciembre',
+    'lunes', 'martes', 'miercoles', 'jueves', 'viernes', 'sabado', 'domingo',
+}
+
+
+def palabras(texto):
+    """Palabras normalizadas del texto."""
+    return set(normalizar(texto).split())
+
+
+def numeros(texto):
+    """Numeros que aparecen en el texto (ids, cantidades, dias)."""
+    return set(re.findall(r'\d+', texto or ''))
+
+
+def terminos_clave(texto):
+    """Terminos que tienen que coincidir exactamente entre dos preguntas para
+    que compartan plan: numeros, palabras de sentido (TERMINOS_SENTIDO) y
+    nombres propios (palabras con mayuscula que no abren la oracion)."""
+    texto = texto or ''
+    palabras = normalizar(texto).split()
+    claves = numeros(texto) | {p for p in palabras if p in TERMINOS_SENTIDO}
+    originales = re.findall(r'\w+', texto)
+    claves |= {
+        normalizar(p) for i, p in enumerate(originales)
+        if i and p[0].isupper() and not p.isdigit()
+    }
+    return claves
+
+
+def _features(texto):
+    """Indices hasheados de palabras y n-gramas de caracteres del texto."""
+    texto = normalizar(texto)
+    feats = [zlib.crc32(('w:' + w).encode()) % DIMENSION for w in texto.split()]
+    padded = ' %s ' % texto
+    for n in NGRAMAS:
+        feats += [
+            zlib.crc32(padded[i:i + n].encode()) % DIMENSION
+            for i in range(len(padded) - n + 1)
+        ]
+    return feats
+
+
+def _tf(textos):
+    matriz = np.zeros((len(textos), DIMENSION), dtype=np.float32)
+    for fila, texto in enumerate(textos):
+        np.add.at(matriz[fila], _features(texto), 1.0)
+    return matriz
+
+
+class IndiceSimilitud:
+    """Indice TF-IDF de n-gramas de caracteres con busqueda por coseno.
+
+    Todo en memoria y vectorizado con NumPy: una consulta es un producto
+    matriz-vector sobre las filas ya normalizadas.
+    """
+
+    def __init__(self, textos):
+        tf = _tf(textos)
+        df = np.count_nonzero(tf, axis=0)
+        self.idf = (np.log((1.0 + len(textos)) / (1.0 + df)) + 1.0).astype(np.float32)
+        self.matriz = self._normalizar(tf * self.idf)
+
+    @staticmethod
+    def _normalizar(matriz):
+        normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+        normas[normas == 0] = 1.0
+        return matriz / normas
+
+    def buscar(self, texto):
+        """(posicion, similitud coseno) del texto mas parecido, o (None, 0.0)."""
+        if not len(self.matriz):
+            return None, 0.0
+        consulta = self._normalizar(_tf([texto]) * self.idf)[0]
+        scores = self.matriz @ consulta
+        mejor = int(np.argmax(scores))
+        return mejor, float(scores[mejor])
@@ -0,0 +1,126 @@
+odoo.define('chatbot_ia_2.ChatbotChat', function (require) {
+    "use strict";
+
+    /**
+     * Widget de chat de la sesion chatbot.ia2.
+     *
+     * Renderiza las burbujas en el cliente y solo pide al servidor los
+     * mensajes visibles con sequence mayor al ultimo recibido, en lugar de
+     * recargar chat_html y todos los message_ids en cada turno.
+     */
+    const AbstractFieldOwl = require('web.AbstractFieldOwl');
+    const fieldRegistryOwl = require('web.field_registry_owl');
+
+    const { useState, useRef } = owl.hooks;
+
+    // Cada cuanto se consulta la posicion en la cola mientras se espera
+    const INTERVALO_COLA_MS = 2000;
+
+    class ChatbotChat extends AbstractFieldOwl {
+        constructor() {
+            super(...arguments);
+            this.state = useState({
+                mensajes: [],
+                texto: '',
+                pendiente: false,
+                enviando: false,
+                posicionCola: 0,
+            });
+            this.listaRef = useRef('lista');
+            this.ultimaSecuencia = 0;
+        }
+
+        async willStart() {
+            await this._cargarNuevos();
+        }
+
+        mounted() {
+            this._scrollAlFinal();
+        }
+
+        patched() {
+            this._scrollAlFinal();
+        }
+
+        get sessionId() {
+            return this.record.res_id;
+        }
+
+        async _cargarNuevos() {
+            if (!this.sessionId) {
+                return;
+            }
+            const result = await this.env.services.rpc({
+                route: '/chatbot/mensajes',
+                params: {
+                    session_id: this.sessionId,
+                    desde_sequence: this.ultimaSecuencia,
+                },
+            });
+            for (const msg of result.mensajes) {
+                this.state.mensajes.push(msg);
+                this.ultimaSecuencia = Math.max(this.ultimaSecuencia, msg.sequence);
+            }
+        }
+
+        _scrollAlFinal() {
+            const lista = this.listaRef.el;
+            if (lista) {
+                lista.scrollTop = lista.scrollHeight;
+            }
+        }
+
+        async _onEnviar() {
+            const texto = this.state.texto.trim();
+            if (!texto || this.state.enviando || !this.sessionId) {
+                return;
+            }
+            this.state.texto = '';
+            this.state.pendiente = texto;
+            this.state.enviando = true;
+            // Mientras se espera la respuesta se consulta la posicion en la
+            // cola de admision, para mostrarla en lugar de "Pensando..."
+            const intervaloCola = setInterval(() => this._consultarCola(), INTERVALO_COLA_MS);
+            try {
+                const result = await this.env.services.rpc({
+                    route: '/chatbot/ask',
+                    params: {session_id: this.sessionId, pregunta: texto},
+                });
+                if (result.turno_en_curso) {
+                    // Otra pestana esta respondiendo en esta sesion: no se perdio el texto
+                    this.state.texto = texto;
+                    this.env.services.notification.notify({
+                        message: result.respuesta,
+                        type: 'warning',
+                    });
+                }
+            } finally {
+                clearInterval(intervaloCola);
+                this.state.posicionCola = 0;
+                this.state.pendiente = false;
+                this.state.enviando = false;
+                await this._cargarNuevos();
+            }
+        }
+
+        async _consultarCola() {
+            const result = await this.env.services.rpc({route: '/chatbot/cola', params: {}});
+            if (this.state.enviando) {
+                this.state.posicionCola = result.posicion;
+            }
+        }
+
+        _onKeydown(ev) {
+            if (ev.key === 'Enter') {
+                ev.preventDefault();
+                this._onEnviar();
+            }
+        }
+    }
+    ChatbotChat.template = 'chatbot_ia_2.ChatbotChat';
+    ChatbotChat.supportedFieldTypes = ['integer'];
+
+    fieldRegistryOwl.add('chatbot_chat', ChatbotChat);
+
+    return ChatbotChat;
+});
@@ -0,0 +1,14 @@
+{
+    'name': 'Chatbot IA Base',
+    'version': '1.0',
+    'summary': 'Utilidades compartidas por los modulos de chatbot IA',
+    'category': 'Tools',
+    'author': 'Martin Mendez',
+    'depends': ['base'],
+    'data': [],
+    'external_dependencies': {
+        'python': ['openai'],
+    },
+    'installable': True,
+    'application': False,
+}
@@ -0,0 +1,4 @@
+from . import admision
+from . import coalescencia
+from . import llm
+from . import replica
@@ -0,0 +1,161 @@
+import time
+import logging
+import threading
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+from odoo.tools import config
+
+_logger = logging.getLogger(__name__)
+
+
+class ChatbotSaturado(Exception):
+    """El turno fue rechazado por control de admision (mensaje para el usuario)."""
+
+
+class _Ticket:
+    __slots__ = ('uid',)
+
+    def __init__(self, uid):
+        self.uid = uid
+
+
+class ControlAdmision:
+    """Control de admision de turnos de chatbot dentro de un proceso Odoo.
+
+    - Pool acotado: como maximo `max_concurrencia` conexiones del chatbot a
+      la vez, entre turnos en curso y conexiones extra de segundo plano
+      (especulacion, exportaciones), para que la espera al LLM no ocupe todos
+      los threads y conexiones (`db_maxconn`).
+    - Cola FIFO de hasta `max_cola` turnos, cada uno esperando como mucho
+      `espera_max` segundos; si la cola esta llena se rechaza al instante.
+    - Limite por usuario de `turnos_por_minuto` turnos admitidos.
+    """
+
+    def __init__(self, max_concurrencia=4, max_cola=8, espera_max=20.0, turnos_por_minuto=6):
+        self.max_concurrencia = max_concurrencia
+        self.max_cola = max_cola
+        self.espera_max = espera_max
+        self.turnos_por_minuto = turnos_por_minuto
+        self._cond = threading.Condition()
+        self._activos = 0
+        self._extras = 0
+        self._cola = deque()
+        self._turnos = defaultdict(deque)
+
+    def estado(self):
+        with self._cond:
+            return {'activos': self._activos, 'extras': self._extras, 'en_cola': len(self._cola)}
+
+    def _ocupados(self):
+        return self._activos + self._extras
+
+    def posicion(self, uid):
+        """Posicion (desde 1) del primer turno de `uid` en la cola, o 0 si no
+        tiene ninguno esperando."""
+        with self._cond:
+            for posicion, ticket in enumerate(self._cola, 1):
+                if ticket.uid == uid:
+                    return posicion
+            return 0
+
+    def _verificar_limite_usuario(self, uid, ahora):
+        turnos = self._turnos[uid]
+        while turnos and turnos[0] <= ahora - 60:
+            turnos.popleft()
+        if len(turnos) >= self.turnos_por_minuto:
+            espera = int(turnos[0] + 60 - ahora) + 1
+            raise ChatbotSaturado(
+                f"Alcanzaste el limite de {self.turnos_por_minuto} consultas por minuto. "
+                f"Proba de nuevo en {espera} segundos."
+            )
+
+    def _entrar(self, uid):
+        with self._cond:
+            ahora = time.monotonic()
+            self._verificar_limite_usuario(uid, ahora)
+            if self._ocupados() < self.max_concurrencia and not self._cola:
+                self._activos += 1
+                self._turnos[uid].append(ahora)
+                return
+            if len(self._cola) >= self.max_cola:
+                raise ChatbotSaturado(
+                    f"El asistente esta saturado ({self._activos} consultas en curso y "
+                    f"{len(self._cola)} en espera). Proba de nuevo en unos segundos."
+                )
+            ticket = _Ticket(uid)
+            self._cola.append(ticket)
+            _logger.info("Turno de chatbot del usuario %s en cola (posicion %d)", uid, len(self._cola))
+            limite = ahora + self.espera_max
+            try:
+                while self._cola[0] is not ticket or self._ocupados() >= self.max_concurrencia:
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        posicion = list(self._cola).index(ticket) + 1
+                        raise ChatbotSaturado(
+                            f"El asistente esta ocupado: seguias en la posicion {posicion} "
+                            f"de la cola despues de {int(self.espera_max)} segundos. "
+                            f"Proba de nuevo en unos momentos."
+                        )
+                    self._cond.wait(restante)
+            finally:
+                self._cola.remove(ticket)
+                # El siguiente en la cola puede haber quedado primero
+                self._cond.notify_all()
+            self._activos += 1
+            self._turnos[uid].append(time.monotonic())
+
+    def _salir(self):
+        with self._cond:
+            self._activos -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def turno(self, uid):
+        """Reserva un lugar en el pool durante el bloque; ChatbotSaturado si no hay."""
+        self._entrar(uid)
+        try:
+            yield
+        finally:
+            self._salir()
+
+    @contextmanager
+    def conexion_extra(self):
+        """Reserva, sin esperar, un lugar del pool para una conexion de segundo
+        plano. Produce False si no hay lugar o hay turnos en cola (los turnos
+        tienen prioridad); quien llama debe omitir o postergar el trabajo."""
+        with self._cond:
+            reservada = not self._cola and self._ocupados() < self.max_concurrencia
+            if reservada:
+                self._extras += 1
+        try:
+            yield reservada
+        finally:
+            if reservada:
+                with self._cond:
+                    self._extras -= 1
+                    self._cond.notify_all()
+
+
+# Un ControlAdmision por prefijo de configuracion (modulo)
+_controles = {}
+_control_lock = threading.Lock()
+
+
+def control_admision(prefijo):
+    """ControlAdmision del proceso para el modulo de prefijo `prefijo`,
+    configurado desde odoo.conf:
+
+    <prefijo>_max_concurrencia, <prefijo>_max_cola,
+    <prefijo>_espera_max (segundos), <prefijo>_turnos_por_minuto
+    """
+    with _control_lock:
+        control = _controles.get(prefijo)
+        if control is None:
+            control = _controles[prefijo] = ControlAdmision(
+                max_concurrencia=int(config.get(f'{prefijo}_max_concurrencia', 4)),
+                max_cola=int(config.get(f'{prefijo}_max_cola', 8)),
+                espera_max=float(config.get(f'{prefijo}_espera_max', 20)),
+                turnos_por_minuto=int(config.get(f'{prefijo}_turnos_por_minuto', 6)),
+            )
+        return control
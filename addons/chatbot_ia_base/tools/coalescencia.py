@@ -0,0 +1,69 @@
+import copy
+import logging
+import threading
+
+_logger = logging.getLogger(__name__)
+
+
+class _Vuelo:
+    __slots__ = ('evento', 'resultado', 'error', 'seguidores')
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado = None
+        self.error = None
+        self.seguidores = 0
+
+
+class SingleFlight:
+    """Coalescencia de llamadas identicas en curso dentro del proceso.
+
+    La primera llamada con una clave la ejecuta; las que llegan con la misma
+    clave mientras tanto esperan su resultado (o su excepcion) en vez de
+    repetir el trabajo. Si la espera supera `espera_max` segundos, el seguidor
+    ejecuta la llamada por su cuenta.
+    """
+
+    def __init__(self, nombre, espera_max=30.0, copiar=True):
+        self.nombre = nombre
+        self.espera_max = espera_max
+        self.copiar = copiar
+        self._lock = threading.Lock()
+        self._vuelos = {}
+
+    def en_curso(self):
+        with self._lock:
+            return len(self._vuelos)
+
+    def ejecutar(self, clave, funcion):
+        with self._lock:
+            vuelo = self._vuelos.get(clave)
+            lider = vuelo is None
+            if lider:
+                vuelo = self._vuelos[clave] = _Vuelo()
+            else:
+                vuelo.seguidores += 1
+
+        if lider:
+            try:
+                vuelo.resultado = funcion()
+                return vuelo.resultado
+            except Exception as e:
+                vuelo.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._vuelos[clave]
+                vuelo.evento.set()
+                if vuelo.seguidores:
+                    _logger.info("%s: %d llamadas identicas coalescidas",
+                                 self.nombre, vuelo.seguidores)
+
+        if not vuelo.evento.wait(self.espera_max):
+            _logger.warning("%s: espera de %ss agotada, se ejecuta sin coalescer",
+                            self.nombre, self.espera_max)
+            return funcion()
+        if vuelo.error is not None:
+            raise vuelo.error
+        # Cada seguidor recibe su propia copia (los resultados son dicts)
+        return copy.deepcopy(vuelo.resultado) if self.copiar else vuelo.resultado
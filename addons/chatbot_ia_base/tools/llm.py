@@ -0,0 +1,99 @@
+import json
+import time
+import hashlib
+import logging
+
+import openai
+from odoo.tools import config
+
+from .coalescencia import SingleFlight
+
+_logger = logging.getLogger(__name__)
+
+# Espera maxima por la respuesta de un pedido identico ya en curso
+ESPERA_MAX_LLM = 90.0
+
+# Niveles de modelo: nivel -> (modelo, timeout en segundos) por defecto
+NIVELES_DEFAULT = {
+    'rapido': ('gpt-4o-mini', 20.0),
+    'completo': ('gpt-4o-mini', 45.0),
+}
+# Nivel al que se cae cuando otro agota su timeout
+NIVEL_RESPALDO = 'rapido'
+
+# Tipo de llamada -> nivel por defecto
+#   herramientas   elegir la proxima funcion (o responder directo)
+#   respuesta      sintetizar la respuesta a partir de resultados de funciones
+#   reformulacion  redactar en lenguaje natural un resultado KPI (v1)
+RUTAS_DEFAULT = {
+    'herramientas': 'rapido',
+    'respuesta': 'completo',
+    'reformulacion': 'rapido',
+}
+
+_COMPLETIONS = SingleFlight('OpenAI', espera_max=ESPERA_MAX_LLM, copiar=False)
+
+
+def _config(prefijo, clave, default):
+    valor = config.get(f'{prefijo}_{clave}')
+    return default if valor in (None, '', False) else valor
+
+
+def _modelo_y_timeout(prefijo, nombre):
+    modelo, timeout = NIVELES_DEFAULT[nombre]
+    return (
+        _config(prefijo, f'modelo_{nombre}', modelo),
+        float(_config(prefijo, f'timeout_{nombre}', timeout)),
+    )
+
+
+def nivel(prefijo, tipo):
+    """(nivel, modelo, timeout) configurado para un tipo de llamada.
+
+    odoo.conf: <prefijo>_nivel_<tipo> = rapido|completo, y por nivel
+    <prefijo>_modelo_<nivel> y <prefijo>_timeout_<nivel>.
+    """
+    nombre = _config(prefijo, f'nivel_{tipo}', RUTAS_DEFAULT.get(tipo, NIVEL_RESPALDO))
+    if nombre not in NIVELES_DEFAULT:
+        nombre = NIVEL_RESPALDO
+    return (nombre, *_modelo_y_timeout(prefijo, nombre))
+
+
+def chat_completion(**kwargs):
+    """openai.ChatCompletion.create coalesciendo pedidos identicos en curso.
+
+    Si varios usuarios mandan a la vez exactamente el mismo pedido (modelo,
+    mensajes, funciones, temperatura), se hace una sola llamada a OpenAI y
+    todos reciben su respuesta (o su error).
+    """
+    clave = hashlib.sha256(
+        json.dumps(kwargs, sort_keys=True, ensure_ascii=False, default=str).encode()
+    ).hexdigest()
+    return _COMPLETIONS.ejecutar(clave, lambda: openai.ChatCompletion.create(**kwargs))
+
+
+def completar(prefijo, tipo, **kwargs):
+    """chat_completion con el modelo y timeout del nivel que corresponde a `tipo`
+    segun la configuracion del modulo de prefijo `prefijo`.
+
+    Si el nivel elegido agota su timeout se reintenta una vez con el nivel de
+    respaldo (rapido). Cada decision de ruteo queda en el log con su latencia.
+    """
+    nombre, modelo, timeout = nivel(prefijo, tipo)
+    inicio = time.monotonic()
+    try:
+        respuesta = chat_completion(model=modelo, request_timeout=timeout, **kwargs)
+    except openai.error.Timeout:
+        if nombre == NIVEL_RESPALDO:
+            raise
+        modelo_lento = modelo
+        nombre = NIVEL_RESPALDO
+        modelo, timeout_respaldo = _modelo_y_timeout(prefijo, nombre)
+        _logger.warning(
+            "LLM %s: %s supero %.0fs, se reintenta con %s (%s)",
+            tipo, modelo_lento, timeout, modelo, nombre,
+        )
+        inicio = time.monotonic()
+        respuesta = chat_completion(model=modelo, request_timeout=timeout_respaldo, **kwargs)
+    _logger.info("LLM %s: %s (%s) en %.2fs", tipo, modelo, nombre, time.monotonic() - inicio)
+    return respuesta
@@ -0,0 +1,104 @@
+import time
+import logging
+import threading
+
+import psycopg2
+
+from odoo import sql_db
+from odoo.tools import config
+
+_logger = logging.getLogger(__name__)
+
+LAG_MAX_DEFAULT = 30
+REINTENTO_DEFAULT = 60
+
+LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery()
+            OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+# Errores propios de la replica (conexion, conflicto con la recuperacion,
+# escritura en transaccion de solo lectura): se reintenta en la primaria
+ERRORES_REPLICA = (
+    psycopg2.OperationalError,
+    psycopg2.InternalError,
+    psycopg2.extensions.TransactionRollbackError,
+)
+
+# Circuito abierto hasta este instante (time.monotonic) despues de un fallo
+_ABIERTO_HASTA = {}
+_LOCK = threading.Lock()
+
+
+def _config(prefijo, clave, default, tipo=str):
+    valor = config.get(f'{prefijo}_{clave}')
+    if valor in (None, '', False):
+        return default
+    return tipo(valor)
+
+
+def _abrir_circuito(prefijo, dsn, motivo):
+    reintento = _config(prefijo, 'replica_reintento', REINTENTO_DEFAULT, float)
+    with _LOCK:
+        _ABIERTO_HASTA[dsn] = time.monotonic() + reintento
+    _logger.warning("Replica de lectura deshabilitada por %ss: %s", reintento, motivo)
+
+
+def _circuito_abierto(dsn):
+    with _LOCK:
+        return _ABIERTO_HASTA.get(dsn, 0) > time.monotonic()
+
+
+def _cursor_replica(prefijo, dsn):
+    """Cursor de solo lectura en la replica, o None si no esta en condiciones."""
+    try:
+        cr = sql_db.db_connect(dsn, allow_uri=True).cursor()
+    except Exception as e:
+        _abrir_circuito(prefijo, dsn, e)
+        return None
+    try:
+        cr.execute("SET TRANSACTION READ ONLY")
+        cr.execute(LAG_SQL)
+        lag = cr.fetchone()[0]
+    except Exception as e:
+        cr.close()
+        _abrir_circuito(prefijo, dsn, e)
+        return None
+    lag_max = _config(prefijo, 'replica_lag_max', LAG_MAX_DEFAULT, float)
+    if lag is None or lag > lag_max:
+        cr.close()
+        _abrir_circuito(prefijo, dsn, f"lag de {lag}s (maximo {lag_max}s)")
+        return None
+    return cr
+
+
+def ejecutar_lectura(prefijo, env, funcion):
+    """Ejecuta `funcion(env)` contra la replica de lectura si esta configurada.
+
+    La replica se configura en odoo.conf con `<prefijo>_replica_dsn` (URI
+    postgresql://...). Si no responde, su lag supera `<prefijo>_replica_lag_max`
+    segundos o la consulta falla en la base, se usa la base primaria y la
+    replica queda deshabilitada por `<prefijo>_replica_reintento` segundos.
+    """
+    dsn = _config(prefijo, 'replica_dsn', None)
+    if not dsn or _circuito_abierto(dsn):
+        return funcion(env)
+
+    # El cache y las escrituras pendientes del ORM se comparten entre los
+    # environments del thread: se bajan a la primaria antes de leer en la
+    # replica y se descarta lo leido de la replica al terminar.
+    env['base'].flush()
+    cr = _cursor_replica(prefijo, dsn)
+    if cr is None:
+        return funcion(env)
+    try:
+        return funcion(env(cr=cr))
+    except ERRORES_REPLICA as e:
+        _abrir_circuito(prefijo, dsn, e)
+    finally:
+        env['base'].invalidate_cache()
+        cr.close()
+    return funcion(env)
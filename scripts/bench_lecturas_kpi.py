@@ -0,0 +1,90 @@
+"""Compara tiempo y memoria de materializar filas de KPI con browse vs search_read.
+
+Se ejecuta con el Python de Odoo contra una base restaurada:
+
+    python3 scripts/bench_lecturas_kpi.py -c /etc/odoo/odoo.conf -d db-grande
+
+Por cada modelo y tamanio reporta las filas efectivamente leidas, el tiempo
+(ms) y el pico de memoria de Python (KiB) de cada estrategia, y la relacion
+browse / search_read. Cada medicion arranca con el cache del ORM vacio.
+"""
+import argparse
+import time
+import tracemalloc
+
+import odoo
+from odoo import api, SUPERUSER_ID
+
+TAMANIOS = (50, 5000)
+
+CASOS = {
+    'account.move': (
+        [('move_type', '=', 'out_invoice'), ('state', '=', 'posted')],
+        ['name', 'partner_id', 'amount_total', 'amount_residual', 'invoice_date_due', 'payment_state'],
+        lambda f: (f.name, f.partner_id.name, f.partner_id.id, f.amount_total,
+                   f.amount_residual, f.invoice_date_due, f.payment_state),
+    ),
+    'sale.order': (
+        [('state', 'in', ['sale', 'done'])],
+        ['name', 'partner_id', 'user_id', 'amount_total', 'date_order'],
+        lambda p: (p.name, p.partner_id.name, p.partner_id.id, p.user_id.name,
+                   p.user_id.id, p.amount_total, p.date_order),
+    ),
+    'product.product': (
+        [('sale_ok', '=', True)],
+        ['name', 'list_price', 'categ_id'],
+        lambda p: (p.name, p.list_price, p.categ_id.name),
+    ),
+}
+
+
+def medir(env, fn):
+    """(filas, ms, KiB de pico) de ejecutar fn con el cache vacio."""
+    env.invalidate_all()
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    filas = len(fn())
+    duracion = time.perf_counter() - inicio
+    _actual, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return filas, duracion * 1000, pico / 1024
+
+
+def comparar(env, tamanios):
+    """Imprime la comparacion y retorna las mediciones como lista de dicts."""
+    resultados = []
+    print(f"Base {env.cr.dbname}")
+    for modelo, (domain, campos, fila) in CASOS.items():
+        Model = env[modelo]
+        for n in tamanios:
+            filas, ms_b, kb_b = medir(
+                env, lambda: [fila(r) for r in Model.search(domain, limit=n)],
+            )
+            _filas, ms_r, kb_r = medir(env, lambda: Model.search_read(domain, campos, limit=n))
+            resultados.append({
+                'modelo': modelo, 'limite': n, 'filas': filas,
+                'browse_ms': ms_b, 'browse_kib': kb_b,
+                'search_read_ms': ms_r, 'search_read_kib': kb_r,
+            })
+            print(f"{modelo:16} {filas:>5} filas | browse {ms_b:8.1f} ms {kb_b:9.0f} KiB"
+                  f" | search_read {ms_r:8.1f} ms {kb_r:9.0f} KiB"
+                  f" | browse/search_read x{ms_b / ms_r if ms_r else 0:.1f} tiempo"
+                  f" x{kb_b / kb_r if kb_r else 0:.1f} memoria")
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('-c', '--config', required=True, help='Archivo odoo.conf')
+    parser.add_argument('-d', '--db', required=True, help='Base de datos')
+    parser.add_argument('--tamanios', type=int, nargs='+', default=list(TAMANIOS))
+    args = parser.parse_args()
+
+    odoo.tools.config.parse_config(['-c', args.config])
+    with api.Environment.manage(), odoo.registry(args.db).cursor() as cr:
+        comparar(api.Environment(cr, SUPERUSER_ID, {}), args.tamanios)
+        cr.rollback()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""Prueba de carga del agente v2: N sesiones concurrentes via accion_enviar.
+
+Pensado para correr contra Odoo apuntado al mock (scripts/mock_openai.py):
+
+    python scripts/carga_chatbot.py --url http://localhost:8069 --db db-grande \
+        --usuario admin --password <password o api key> \
+        --sesiones 20 --turnos 5 --dsn "host=localhost dbname=db-grande user=odoo password=odoo"
+
+Reporta throughput, latencia por turno (p50/p95/p99) y, si se pasa --dsn
+(requiere psycopg2), conexiones a la base y esperas de locks muestreadas
+durante la corrida.
+"""
+import argparse
+import itertools
+import json
+import math
+import threading
+import time
+import urllib.request
+
+PREGUNTAS_DEFAULT = [
+    "Cuales son las ventas del mes por vendedor?",
+    "Mostrame las facturas vencidas de clientes",
+    "Que productos se venden mas este trimestre?",
+    "Cuanto nos deben los clientes?",
+]
+
+
+class ClienteOdoo:
+    """Cliente JSON-RPC minimo (/jsonrpc) para execute_kw."""
+
+    def __init__(self, url, db, usuario, password):
+        self.url = url.rstrip('/') + '/jsonrpc'
+        self.db = db
+        self.password = password
+        self._ids = itertools.count()
+        self.uid = self._llamar('common', 'login', [db, usuario, password])
+        if not self.uid:
+            raise SystemExit("Credenciales invalidas")
+
+    def _llamar(self, servicio, metodo, args):
+        pedido = json.dumps({
+            'jsonrpc': '2.0', 'method': 'call', 'id': next(self._ids),
+            'params': {'service': servicio, 'method': metodo, 'args': args},
+        }).encode()
+        req = urllib.request.Request(self.url, pedido, {'Content-Type': 'application/json'})
+        with urllib.request.urlopen(req, timeout=600) as resp:
+            respuesta = json.loads(resp.read())
+        if respuesta.get('error'):
+            raise RuntimeError(respuesta['error'].get('data', {}).get('message')
+                               or respuesta['error'].get('message'))
+        return respuesta.get('result')
+
+    def execute(self, modelo, metodo, *args):
+        return self._llamar('object', 'execute_kw',
+                            [self.db, self.uid, self.password, modelo, metodo, list(args)])
+
+
+class MuestreoBase(threading.Thread):
+    """Muestrea pg_stat_activity y pg_locks cada `intervalo` segundos."""
+
+    def __init__(self, dsn, intervalo=0.5):
+        super().__init__(daemon=True)
+        import psycopg2
+        self.conn = psycopg2.connect(dsn)
+        self.conn.autocommit = True
+        self.intervalo = intervalo
+        self.detener = threading.Event()
+        self.conexiones = []
+        self.esperas_lock = []
+
+    def run(self):
+        with self.conn.cursor() as cr:
+            while not self.detener.is_set():
+                cr.execute("SELECT COUNT(*) FROM pg_stat_activity WHERE datname = current_database()")
+                self.conexiones.append(cr.fetchone()[0] - 1)
+                cr.execute("SELECT COUNT(*) FROM pg_locks WHERE NOT granted")
+                self.esperas_lock.append(cr.fetchone()[0])
+                self.detener.wait(self.intervalo)
+        self.conn.close()
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    k = max(0, math.ceil(p / 100.0 * len(ordenados)) - 1)
+    return ordenados[k]
+
+
+def correr_sesion(cliente, preguntas, turnos, latencias, errores, lock):
+    sesion_id = cliente.execute('chatbot.ia2', 'create', {})
+    for n in range(turnos):
+        pregunta = preguntas[n % len(preguntas)]
+        inicio = time.perf_counter()
+        try:
+            cliente.execute('chatbot.ia2', 'write', [sesion_id], {'input_text': pregunta})
+            cliente.execute('chatbot.ia2', 'accion_enviar', [sesion_id])
+        except Exception as e:
+            with lock:
+                errores.append(str(e))
+            continue
+        with lock:
+            latencias.append(time.perf_counter() - inicio)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--url', default='http://localhost:8069')
+    parser.add_argument('--db', required=True)
+    parser.add_argument('--usuario', default='admin')
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--sesiones', type=int, default=10)
+    parser.add_argument('--turnos', type=int, default=3)
+    parser.add_argument('--preguntas', help='Archivo de texto, una pregunta por linea')
+    parser.add_argument('--dsn', help='DSN de PostgreSQL para muestrear conexiones y locks')
+    args = parser.parse_args()
+
+    preguntas = PREGUNTAS_DEFAULT
+    if args.preguntas:
+        with open(args.preguntas) as f:
+            preguntas = [l.strip() for l in f if l.strip()]
+
+    muestreo = MuestreoBase(args.dsn) if args.dsn else None
+    latencias, errores, lock = [], [], threading.Lock()
+    hilos = [
+        threading.Thread(target=correr_sesion, args=(
+            ClienteOdoo(args.url, args.db, args.usuario, args.password),
+            preguntas[i % len(preguntas):] + preguntas[:i % len(preguntas)],
+            args.turnos, latencias, errores, lock,
+        ))
+        for i in range(args.sesiones)
+    ]
+
+    if muestreo:
+        muestreo.start()
+    inicio = time.perf_counter()
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    duracion = time.perf_counter() - inicio
+    if muestreo:
+        muestreo.detener.set()
+        muestreo.join()
+
+    print("Sesiones: %d x %d turnos | duracion %.1f s" % (args.sesiones, args.turnos, duracion))
+    print("Turnos OK: %d | errores: %d | throughput %.2f turnos/s" % (
+        len(latencias), len(errores), len(latencias) / duracion if duracion else 0.0))
+    print("Latencia por turno: p50 %.2f s | p95 %.2f s | p99 %.2f s | max %.2f s" % (
+        percentil(latencias, 50), percentil(latencias, 95), percentil(latencias, 99),
+        max(latencias or [0.0])))
+    if muestreo and muestreo.conexiones:
+        print("Conexiones a la base: max %d | promedio %.1f" % (
+            max(muestreo.conexiones), sum(muestreo.conexiones) / len(muestreo.conexiones)))
+        con_espera = [e for e in muestreo.esperas_lock if e]
+        print("Esperas de lock: max %d simultaneas | %d de %d muestras con esperas" % (
+            max(muestreo.esperas_lock), len(con_espera), len(muestreo.esperas_lock)))
+    for error in errores[:5]:
+        print("  error:", error)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+"""Servidor local compatible con la API de chat completions de OpenAI.
+
+Reproduce secuencias guionadas de function calls con latencia configurable,
+para probar y medir el loop del agente sin red ni costo:
+
+    python scripts/mock_openai.py --puerto 8000 --guiones scripts/guiones_mock.json \
+        --latencia lognormal:800,0.5
+
+y en Odoo: OPENAI_API_BASE=http://<host>:8000/v1 (OPENAI_API_KEY puede ser cualquiera).
+
+Formato de guiones (JSON):
+
+    {"guiones": [
+        {"si_contiene": "ventas",
+         "pasos": [{"function_call": {"name": "get_ventas", "arguments": {"periodo": "mes_actual"}}},
+                   {"content": "Este mes se vendio ..."}]}
+     ],
+     "default": [{"content": "Respuesta de prueba."}]}
+
+El paso se elige segun cuantos resultados de funcion hay despues del ultimo
+mensaje del usuario, asi cada iteracion del loop avanza un paso del guion.
+
+Latencias: fija:<ms> | uniforme:<min_ms>,<max_ms> | lognormal:<mediana_ms>,<sigma>
+
+Con --latencia-modelo <modelo>=<latencia> (repetible) cada modelo puede tener
+su propia latencia, para probar el ruteo por niveles y el respaldo por timeout:
+
+    --latencia fija:300 --latencia-modelo gpt-4o=fija:60000
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+GUIONES_DEFAULT = {
+    'guiones': [],
+    'default': [
+        {'function_call': {'name': 'get_ventas', 'arguments': {'periodo': 'mes_actual'}}},
+        {'content': 'Respuesta simulada a partir de los datos consultados.'},
+    ],
+}
+
+
+def parsear_latencia(spec):
+    """Retorna una funcion sin argumentos que devuelve una latencia en segundos."""
+    tipo, _, valores = spec.partition(':')
+    nums = [float(v) for v in valores.split(',') if v]
+    if tipo == 'fija':
+        return lambda: nums[0] / 1000.0
+    if tipo == 'uniforme':
+        return lambda: random.uniform(nums[0], nums[1]) / 1000.0
+    if tipo == 'lognormal':
+        mu = math.log(nums[0])
+        return lambda: random.lognormvariate(mu, nums[1]) / 1000.0
+    raise ValueError("Latencia desconocida: %s" % spec)
+
+
+class Estadisticas:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pedidos = 0
+        self.en_curso = 0
+        self.max_en_curso = 0
+        self.por_modelo = {}
+
+    def entrar(self, modelo):
+        with self.lock:
+            self.pedidos += 1
+            self.por_modelo[modelo] = self.por_modelo.get(modelo, 0) + 1
+            self.en_curso += 1
+            self.max_en_curso = max(self.max_en_curso, self.en_curso)
+
+    def salir(self):
+        with self.lock:
+            self.en_curso -= 1
+
+
+def elegir_paso(guiones, mensajes):
+    ultimo_usuario = max((i for i, m in enumerate(mensajes) if m.get('role') == 'user'), default=-1)
+    pregunta = (mensajes[ultimo_usuario].get('content') or '').lower() if ultimo_usuario >= 0 else ''
+    paso = sum(1 for m in mensajes[ultimo_usuario + 1:] if m.get('role') == 'function')
+    pasos = guiones.get('default', GUIONES_DEFAULT['default'])
+    for guion in guiones.get('guiones', []):
+        if guion.get('si_contiene', '').lower() in pregunta:
+            pasos = guion['pasos']
+            break
+    return pasos[min(paso, len(pasos) - 1)]
+
+
+def armar_respuesta(modelo, paso):
+    if 'function_call' in paso:
+        llamada = paso['function_call']
+        argumentos = llamada.get('arguments', {})
+        if not isinstance(argumentos, str):
+            argumentos = json.dumps(argumentos)
+        mensaje = {
+            'role': 'assistant',
+            'content': None,
+            'function_call': {'name': llamada['name'], 'arguments': argumentos},
+        }
+        fin = 'function_call'
+    else:
+        mensaje = {'role': 'assistant', 'content': paso.get('content', '')}
+        fin = 'stop'
+    return {
+        'id': 'chatcmpl-mock-%s' % uuid.uuid4().hex[:12],
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': modelo,
+        'choices': [{'index': 0, 'message': mensaje, 'finish_reason': fin}],
+        'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0},
+    }
+
+
+def crear_handler(guiones, latencia, stats, latencia_modelo=None):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _responder(self, codigo, cuerpo):
+            data = json.dumps(cuerpo).encode()
+            self.send_response(codigo)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.rstrip('/').endswith('/stats'):
+                with stats.lock:
+                    self._responder(200, {
+                        'pedidos': stats.pedidos,
+                        'en_curso': stats.en_curso,
+                        'max_en_curso': stats.max_en_curso,
+                        'por_modelo': dict(stats.por_modelo),
+                    })
+            else:
+                self._responder(404, {'error': {'message': 'not found'}})
+
+        def do_POST(self):
+            largo = int(self.headers.get('Content-Length') or 0)
+            try:
+                pedido = json.loads(self.rfile.read(largo) or b'{}')
+            except ValueError:
+                self._responder(400, {'error': {'message': 'JSON invalido'}})
+                return
+            if not self.path.rstrip('/').endswith('/chat/completions'):
+                self._responder(404, {'error': {'message': 'not found'}})
+                return
+            modelo = pedido.get('model', 'mock')
+            stats.entrar(modelo)
+            try:
+                time.sleep((latencia_modelo or {}).get(modelo, latencia)())
+                paso = elegir_paso(guiones, pedido.get('messages', []))
+                self._responder(200, armar_respuesta(modelo, paso))
+            finally:
+                stats.salir()
+
+        def log_message(self, fmt, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--puerto', type=int, default=8000)
+    parser.add_argument('--guiones', help='Archivo JSON con los guiones')
+    parser.add_argument('--latencia', default='fija:500')
+    parser.add_argument('--latencia-modelo', action='append', default=[],
+                        metavar='MODELO=LATENCIA', help='Latencia propia de un modelo')
+    args = parser.parse_args()
+
+    guiones = GUIONES_DEFAULT
+    if args.guiones:
+        with open(args.guiones) as f:
+            guiones = json.load(f)
+    latencia_modelo = {}
+    for spec in args.latencia_modelo:
+        modelo, _, latencia = spec.partition('=')
+        latencia_modelo[modelo] = parsear_latencia(latencia)
+    servidor = ThreadingHTTPServer(
+        (args.host, args.puerto),
+        crear_handler(guiones, parsear_latencia(args.latencia), Estadisticas(), latencia_modelo),
+    )
+    print("Mock OpenAI escuchando en http://%s:%d/v1 (latencia %s)" % (
+        args.host, args.puerto, args.latencia))
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
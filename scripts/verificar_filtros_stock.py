@@ -0,0 +1,74 @@
+"""Verifica los filtros de stock de get_productos contra una base real.
+
+Corre cada filtro (sin_stock, stock_min, stock_max) en el listado y en el
+resumen, y controla que el stock de cada producto devuelto cumpla el filtro:
+
+    python scripts/verificar_filtros_stock.py --url http://localhost:8069 --db db-grande \
+        --usuario admin --password <password o api key>
+
+Sale con codigo 1 si algun filtro falla o devuelve productos que no lo cumplen.
+"""
+import argparse
+import sys
+
+from carga_chatbot import ClienteOdoo
+
+# nombre -> (filtros, condicion que tiene que cumplir el stock de cada producto)
+CASOS = {
+    'sin_stock': ({'sin_stock': True}, lambda stock: stock <= 0),
+    'stock_min': ({'stock_min': 1}, lambda stock: stock >= 1),
+    'stock_min_negativo': ({'stock_min': -5}, lambda stock: stock >= -5),
+    'stock_max': ({'stock_max': 10}, lambda stock: stock <= 10),
+}
+
+
+def verificar(cliente, nombre, filtros, cumple, limite):
+    """Lista de errores del caso (vacia si todo esta bien)."""
+    errores = []
+    # Listado por nombre (busqueda + control de volumen), listado por stock
+    # (agregado propio) y resumen: los tres caminos que usan el domain
+    try:
+        listados = {
+            orden: cliente.execute(
+                'chatbot2.kpi.productos', 'get_productos', [], orden, limite, filtros,
+            )
+            for orden in ('nombre_asc', 'stock_asc')
+        }
+        resumen = cliente.execute(
+            'chatbot2.kpi.productos', 'get_productos', [], 'nombre_asc', limite, filtros,
+            None, True,
+        )
+    except Exception as e:
+        return [f"{nombre}: la consulta fallo: {e}"]
+    for orden, listado in listados.items():
+        for producto in listado['data']:
+            if not cumple(producto['stock']):
+                errores.append(
+                    f"{nombre} ({orden}): producto {producto['id']} con stock "
+                    f"{producto['stock']} no cumple {filtros}"
+                )
+    print(f"{nombre:20} {len(listados['nombre_asc']['data']):>4} productos listados | "
+          f"resumen de {resumen.get('cantidad', 0)} productos")
+    return errores
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--url', default='http://localhost:8069')
+    parser.add_argument('--db', required=True)
+    parser.add_argument('--usuario', default='admin')
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--limite', type=int, default=50)
+    args = parser.parse_args()
+
+    cliente = ClienteOdoo(args.url, args.db, args.usuario, args.password)
+    errores = []
+    for nombre, (filtros, cumple) in CASOS.items():
+        errores += verificar(cliente, nombre, filtros, cumple, args.limite)
+    for error in errores:
+        print(error)
+    sys.exit(1 if errores else 0)
+
+
+if __name__ == '__main__':
+    main()